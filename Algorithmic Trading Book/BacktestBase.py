@@ -0,0 +1,197 @@
+#　イベント駆動型バックテストの土台（BacktestBase）
+#P175.py / P176.py / P177.ipynb で少しずつ書いていたものを1つのファイルにまとめたもの
+#P192.py（BacktestLongShort）はこれを import して使う
+#
+#元の書き方は1本ごとに self.data['price'].iloc[bar] や str(self.data.index[bar])[:10] を呼び、
+#注文のたびに print していた → pandas のスカラーアクセスと print がループの中で一番遅い
+#ここでは
+#  - get_data の最後に価格・日付を numpy 配列に1回だけ取り出す（self.prices / self.dates）
+#  - 戦略は run_bars(start, on_bar) に「1本ごとに呼ばれる関数」を渡す形にする
+#  - 注文の記録は self.journal（リスト）にためて、close_out でまとめて表示する
+#計算（約定価格・units・手数料）は元のコードと同じなので、結果も同じ
+#
+#Python for Algorithmic Trading
+#(c)Dr. Yves J. Hilpisch
+#The Python Quants GmbH
+#
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+
+class BacktestBase:
+    '''Base class for event-based backtesting of trading strategies.
+
+    Attributes
+    ==========
+    symbol: str
+        列名（tr_eikon_eod_data.csv の銘柄）
+    start, end: str
+        期間
+    amount: float
+        初期資金
+    ftc, ptc: float
+        固定手数料・比例手数料（1回の取引あたり）
+    verbose: bool
+        True なら close_out のときに取引の記録をまとめて表示する
+    '''
+
+    def __init__(self, symbol, start, end, amount,
+                 ftc=0.0, ptc=0.0, verbose=True):
+        self.symbol = symbol
+        self.start = start
+        self.end = end
+        self.initial_amount = amount
+        self.amount = amount
+        self.ftc = ftc
+        self.ptc = ptc
+        self.units = 0
+        self.position = 0
+        self.trades = 0
+        self.verbose = verbose
+        self.journal = []
+        self.get_data()
+
+    def get_data(self):
+        '''Retrieves and prepares the data.
+        '''
+        raw = pd.read_csv('tr_eikon_eod_data.csv', index_col=0)
+
+        raw.index = pd.to_datetime(raw.index, format='%Y-%m-%d', errors='coerce')
+        raw = raw[raw.index.notna()]
+
+        raw[self.symbol] = pd.to_numeric(raw[self.symbol], errors='coerce')
+        raw = pd.DataFrame(raw[self.symbol]).dropna()
+
+        raw = raw.loc[self.start:self.end]
+        raw.rename(columns={self.symbol: 'price'}, inplace=True)
+        raw['return'] = np.log(raw['price'] / raw['price'].shift(1))
+        self.data = raw.dropna()
+        self.snapshot()
+
+    def snapshot(self):
+        '''self.data から価格・日付の配列を作り直す（self.data を差し替えたら呼ぶ）
+        '''
+        self.prices = self.data['price'].to_numpy(dtype='float64')
+        self.dates = self.data.index.strftime('%Y-%m-%d').to_numpy()
+
+    def column(self, name):
+        '''self.data の列を numpy 配列で返す（戦略のループに入る前に1回だけ呼ぶ）
+        '''
+        return self.data[name].to_numpy(dtype='float64')
+
+    def plot_data(self, cols=None):
+        '''Plots the closing prices for symbol.
+        '''
+        if cols is None:
+            cols = ['price']
+        self.data[cols].plot(figsize=(10, 6), title=self.symbol)
+
+    def get_date_price(self, bar):
+        '''Return date and price for bar.
+        '''
+        return self.dates[bar], self.prices[bar]
+
+    def print_balance(self, bar):
+        '''Print out current cash balance info.
+        '''
+        date, price = self.get_date_price(bar)
+        print(f'{date} | current balance {self.amount:.2f}')
+
+    def print_net_wealth(self, bar):
+        '''Print out current cash balance info.
+        '''
+        date, price = self.get_date_price(bar)
+        net_wealth = self.units * price + self.amount
+        print(f'{date} | current net wealth {net_wealth:.2f}')
+
+    def log_trade(self, bar, side, units, price):
+        '''取引を journal にためる（verbose でなくても必ずためる。表示は verbose のときだけ close_out でまとめて行う）
+        '''
+        self.journal.append((bar, side, units, price, self.amount,
+                             self.units * price + self.amount))
+
+    def journal_frame(self):
+        '''journal を DataFrame にする（1行 = 1回の注文）
+        '''
+        columns = ['bar', 'side', 'units', 'price', 'balance', 'net_wealth']
+        frame = pd.DataFrame(self.journal, columns=columns)
+        frame.insert(0, 'date', self.dates[frame['bar'].to_numpy(dtype='int64')])
+        return frame
+
+    def place_buy_order(self, bar, units=None, amount=None):
+        '''Place a buy order.
+        '''
+        price = self.prices[bar]
+        if units is None:
+            units = int(amount / price)
+        self.amount -= (units * price) * (1 + self.ptc) + self.ftc
+        self.units += units
+        self.trades += 1
+        self.log_trade(bar, 'buying', units, price)
+
+    def place_sell_order(self, bar, units=None, amount=None):
+        '''Place a sell order.
+        '''
+        price = self.prices[bar]
+        if units is None:
+            units = int(amount / price)
+        self.amount += (units * price) * (1 - self.ptc) - self.ftc
+        self.units -= units
+        self.trades += 1
+        self.log_trade(bar, 'selling', units, price)
+
+    def reset(self):
+        '''戦略を回す前の状態に戻す
+        '''
+        self.position = 0
+        self.units = 0
+        self.trades = 0
+        self.amount = self.initial_amount
+        self.journal = []
+
+    def run_bars(self, start, on_bar):
+        '''start 本目から最後の足まで on_bar(bar) を順番に呼び、最後に close_out する
+        '''
+        bar = start
+        for bar in range(start, len(self.prices)):
+            on_bar(bar)
+        self.close_out(bar)
+
+    def print_journal(self):
+        '''journal を元のコードと同じ形式でまとめて表示する
+        '''
+        lines = []
+        for bar, side, units, price, balance, net_wealth in self.journal:
+            date = self.dates[bar]
+            lines.append(f'{date} | {side} {units} units at {price:.2f}')
+            lines.append(f'{date} | current balance {balance:.2f}')
+            lines.append(f'{date} | current net wealth {net_wealth:.2f}')
+        if lines:
+            print('\n'.join(lines))
+
+    def close_out(self, bar):
+        '''Closing out a long or short position.
+        '''
+        date, price = self.get_date_price(bar)
+        self.amount += self.units * price
+        self.units = 0
+        self.trades += 1
+        if self.verbose:
+            self.print_journal()
+            print(f'{date} | inventory {self.units} units at {price:.2f}')
+            print('=' * 55)
+        print('Final balance   [$] {:.2f}'.format(self.amount))
+        perf = ((self.amount - self.initial_amount) /
+                self.initial_amount * 100)
+        print(f'Net Performance [%] {perf:.2f}')
+        print(f'Trades Executed [#] {self.trades}')
+        print('=' * 55)
+
+
+if __name__ == '__main__':
+    bb = BacktestBase('AAPL.O', '2010-1-1', '2019-12-31', 10000)
+    print(bb.data.info())
+    print(bb.data.tail())
+    bb.plot_data()
+    plt.show()
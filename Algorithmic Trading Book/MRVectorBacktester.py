@@ -93,6 +93,70 @@ class MRVectorBacktester(MomVectorBacktester):
 
         return round(aperf, 2), round(operf, 2)
 
+    def run_grid(self, SMAs, thresholds):
+        """
+        Backtests every SMA x threshold combination at once.
+        （SMA の候補 × threshold の候補を (足数 × 組み合わせ数) の2次元配列でまとめて回す）
+
+        run_strategy の np.where の連鎖と ffill を列ごとに同時にやる:
+          - SMA は候補ごとに1回だけ計算し、threshold の候補はその距離を共有する
+          - ffill は「最後にシグナルが出た足の番号」の累積最大で引く
+          - 組み合わせは BLOCK_BYTES に収まる列数ずつ回す（メモリを抑える）
+        戻り値: (SMA, threshold) ごとの aperf / operf / trades（run_strategy と同じ値）
+        table['aperf'].unstack() で SMA × threshold の成績の面になる
+        """
+        price = self.data['price'].to_numpy('float64')
+        ret = self.data['return'].to_numpy('float64')
+        n = len(price)
+        rows = np.arange(n)
+        cumret = np.concatenate([[0.0], np.cumsum(ret)])
+
+        combos = [(int(sma), float(thr)) for sma in SMAs for thr in thresholds]
+        aperf = np.full(len(combos), np.nan)
+        operf = np.full(len(combos), np.nan)
+        n_trades = np.zeros(len(combos), dtype=np.int64)
+
+        width = max(1, BLOCK_BYTES // (8 * max(n, 1)))
+        for k in range(0, len(combos), width):
+            block = combos[k:k + width]
+            smas = np.array([sma for sma, _ in block])
+            thr = np.array([t for _, t in block])
+
+            # 距離（SMA が決まる前の足は NaN → どの条件も False）
+            sma_values = {sma: self.data['price'].rolling(sma).mean().to_numpy() for sma in set(smas)}
+            distance = price[:, None] - np.column_stack([sma_values[sma] for sma in smas])
+
+            # シグナル: 売り -1 → 買い 1 → ゼロクロス 0 の順に上書き（run_strategy と同じ）
+            value = np.where(distance > thr, -1.0, np.nan)
+            value = np.where(distance < -thr, 1.0, value)
+            cross = np.zeros_like(distance, dtype=bool)
+            cross[1:] = distance[1:] * distance[:-1] < 0
+            value[cross] = 0.0
+
+            # ffill: 各足で最後にシグナルが出た足の番号を引き、無ければ 0
+            last = np.where(~np.isnan(value), rows[:, None], -1)
+            np.maximum.accumulate(last, axis=0, out=last)
+            position = np.take_along_axis(value, np.maximum(last, 0), axis=0)
+            position[last < 0] = 0.0
+
+            # 戦略リターン = 1本前のポジション × リターン（SMA が決まる前のポジションは 0）
+            total = ret[1:] @ position[:-1]
+            # run_strategy は SMA が決まった足から始まるので、取引はその次の足から数える
+            start = smas - 1
+            trades = (position[1:] != position[:-1]) & (rows[1:, None] > start[None, :])
+            n_trades[k:k + width] = trades.sum(axis=0)
+
+            # 戦略リターンが1本も無い組み合わせは NaN のまま
+            ok = start < n - 1
+            strategy = self.amount * np.exp(total - self.tc * n_trades[k:k + width])
+            creturns = self.amount * np.exp(cumret[n] - cumret[np.minimum(start, n)])
+            aperf[k:k + width] = np.where(ok, strategy, np.nan)
+            operf[k:k + width] = np.where(ok, strategy - creturns, np.nan)
+
+        index = pd.MultiIndex.from_tuples(combos, names=['SMA', 'threshold'])
+        table = pd.DataFrame({'aperf': aperf, 'operf': operf, 'trades': n_trades}, index=index)
+        return table.round({'aperf': 2, 'operf': 2})
+
 
 if __name__ == '__main__':
     # ---- ① 既存のティッカー指定（そのまま動く）----
@@ -103,3 +167,7 @@ if __name__ == '__main__':
     mrbt_csv = MRVectorBacktester(csv_path=r"C:\market_data\USDJPY_M5.csv",
                                   amount=10000, tc=0.0)
     print(mrbt_csv.run_strategy(SMA=25, threshold=5))
+
+    # ---- ③ SMA × threshold をまとめて評価 ----
+    table = mrbt_csv.run_grid(SMAs=range(10, 110, 10), thresholds=[0.05, 0.1, 0.2, 0.5])
+    print(table['aperf'].unstack())
@@ -1,6 +1,19 @@
+import os
+import sys
+
 import numpy as np
 import pandas as pd
 
+# リポジトリ直下の共通モジュール（bar_cache など）を読み込めるようにする
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bar_cache import load_ohlc_cached
+
+# run_many で一度に持つ (足数 × モメンタム数) の2次元配列の上限（バイト）
+BLOCK_BYTES = 64 * 1024 * 1024
+
+# run_many で「期間の最初と最後の価格が同じ」とみなす相対誤差（価格の比較で符号が決まらない足）
+TIE_RTOL = 1e-12
+
 
 class MomVectorBacktester:
     """
@@ -16,30 +29,23 @@ class MomVectorBacktester:
         self.amount = amount              # 初期投資額
         self.tc = tc                      # 取引コスト（例：0.001 = 0.1%）
         self.results = None               # 結果格納用の変数（後で使う）
+        self.many_results = {}            # run_many で作った期間ごとの結果フレーム
 
         self.get_data()                   # データ取得（CSV読み込み）を実行
 
 
     def get_data(self):
         # --- CSVを読み込み、必要な形に整形する ---
-        raw = pd.read_csv(self.csv_path)
-
-        # datetime を作る
-        raw['datetime'] = pd.to_datetime(
-            raw['<DTYYYYMMDD>'].astype(str) +
-            raw['<TIME>'].astype(str).str.zfill(4),
-            format='%Y%m%d%H%M'
-        )
-
-        # datetime を index にする
-        raw.set_index('datetime', inplace=True)
+        # 2回目以降はパース済みキャッシュ（_bar_cache）を開くだけ
+        # datetime の index も作成済みで返ってくる
+        raw = load_ohlc_cached(self.csv_path)
 
         # start/end で期間を絞り込む
         raw = raw.loc[self.start:self.end]
 
         # Close価格だけを取り出す
-        data = raw[['<CLOSE>']].copy()
-        data.rename(columns={'<CLOSE>': 'price'}, inplace=True)
+        data = raw[['Close']].copy()
+        data.rename(columns={'Close': 'price'}, inplace=True)
 
         # 対数収益率（return）を計算
         data['return'] = np.log(data['price'] / data['price'].shift(1))
@@ -81,6 +87,67 @@ class MomVectorBacktester:
         return round(aperf, 2), round(operf, 2)
 
 
+    def run_many(self, momenta, materialize=()):
+        # --- 複数のモメンタム期間をまとめて評価する ---
+        # run_strategy を期間ごとに呼ぶと毎回フレームをコピーするので、
+        # 期間ごとのポジションを (足数 × 期間数) の2次元配列で作り、
+        # 手数料・累積リターンを列ごとにまとめて計算する
+        # 戻り値は期間ごとの最終成績の表（aperf / operf は run_strategy と同じ値）
+        # materialize に入れた期間だけ、run_strategy と同じ結果フレームを self.many_results に作る
+        momenta = np.asarray(list(momenta), dtype=np.int64)
+        returns = self.data['return']
+        ret = returns.to_numpy('float64')
+        price = self.data['price'].to_numpy('float64')
+        n = len(ret)
+        rows = np.arange(n)
+
+        # 期間 m のリターンの移動平均の符号 = log(price_t / price_{t-m}) の符号 = price_t と price_{t-m} の大小
+        #   - 価格の比較なので、累積和の丸め誤差で符号が変わることがない
+        #   - 最初の足（t = m-1）は price_{t-m} が dropna で落ちているので、リターンの合計で見る
+        #   - 価格がちょうど同じ（移動平均の本当の値が 0）の足は、rolling().mean() も丸め誤差で ±1 / 0 になる
+        #     → run_strategy と同じ値にするため、その足だけ rolling().mean() の符号をそのまま使う
+        csum = np.cumsum(ret)
+        # 単純保有の最終資産（どの期間でも同じ）
+        creturns = self.amount * np.exp(ret.sum())
+
+        aperf = np.full(len(momenta), np.nan)
+        n_trades = np.zeros(len(momenta), dtype=np.int64)
+        width = max(1, BLOCK_BYTES // (8 * max(n, 1)))
+        for k in range(0, len(momenta), width):
+            ms = momenta[k:k + width]
+            # ポジションが決まるのは t >= m-1 の足から（それより前は 0 にしておく）
+            valid = rows[:, None] >= ms[None, :] - 1
+            first = rows[:, None] == ms[None, :] - 1
+            diff = price[:, None] - price[np.maximum(rows[:, None] - ms[None, :], 0)]
+            position = np.where(first, np.sign(csum)[:, None], np.sign(diff))
+
+            tie = np.where(first, np.abs(csum)[:, None] <= TIE_RTOL,
+                           np.abs(diff) <= TIE_RTOL * np.abs(price)[:, None]) & valid
+            for j in np.flatnonzero(tie.any(axis=0)):
+                exact = np.sign(returns.rolling(int(ms[j])).mean().to_numpy())
+                position[tie[:, j], j] = exact[tie[:, j]]
+            position[~valid] = 0
+            position = position.astype(np.int8)
+
+            # 戦略リターン = 1本前のポジション × リターン（ポジションが無い足は 0 なので足しても同じ）
+            total = ret[1:] @ position[:-1]
+            # 取引 = ポジションが変わった足（最初にポジションが決まった足は数えない）
+            trades = (position[1:] != position[:-1]) & (rows[1:, None] >= ms[None, :])
+            n_trades[k:k + width] = trades.sum(axis=0)
+            # 戦略リターンが1本も無い期間は run_strategy と同じく NaN
+            aperf[k:k + width] = np.where(ms < n, self.amount * np.exp(total - self.tc * n_trades[k:k + width]),
+                                          np.nan)
+
+        self.many_results = {}
+        for m in materialize:
+            self.run_strategy(int(m))
+            self.many_results[int(m)] = self.results
+
+        table = pd.DataFrame({'aperf': aperf, 'operf': aperf - creturns, 'trades': n_trades},
+                             index=pd.Index(momenta, name='momentum'))
+        return table.round({'aperf': 2, 'operf': 2})
+
+
     def plot_results(self):
         # --- 結果をグラフで表示 ---
         if self.results is None:
@@ -101,3 +168,7 @@ if __name__ == '__main__':
 
     print(mombt.run_strategy(momentum=5))
     mombt.plot_results()
+
+    # モメンタム 1〜200 をまとめて評価（フレームのコピーは作らない）
+    table = mombt.run_many(range(1, 201))
+    print(table.sort_values('aperf', ascending=False).head(10))
@@ -17,10 +17,11 @@ from BacktestBase import *
 
 
 class BacktestLongShort(BacktestBase):
-    
+    # 戦略は「1本ごとに呼ばれる on_bar」を作って run_bars に渡す
+    # on_bar の中では self.data を触らず、ループの前に取り出した numpy 配列だけを見る
+
     def go_long(self, bar, units=None, amount=None):
         # もしショートがあるなら決済
-        
         if self.position == -1:
             self.place_buy_order(bar, units=-self.units)
         if units:
@@ -29,63 +30,64 @@ class BacktestLongShort(BacktestBase):
             if amount == 'all':
                 amount = self.amount
             self.place_buy_order(bar, amount=amount)
-    
-    
+
     def go_short(self, bar, units=None, amount=None):
         # もしロングがあるなら決済
         if self.position == 1:
-            self.place_sell_order(bar,units=self.units)
+            self.place_sell_order(bar, units=self.units)
+        if units:
+            self.place_sell_order(bar, units=units)
         elif amount:
             if amount == 'all':
                 amount = self.amount
             self.place_sell_order(bar, amount=amount)
-    
+
     def run_sma_strategy(self, SMA1, SMA2):
         msg = f'\n\nRunning SMA strategy | SMA1={SMA1} & SMA2={SMA2}'
         msg += f'\nfixed costs {self.ftc} | '
         msg += f'proportional costs {self.ptc}'
         print(msg)
         print('=' * 55)
-        self.position = 0 # initial neutral position
-        self.trades = 0 # initial neutral position
-        self.trades = 0 # no trades yet
-        self.amount = self.initial_amount #reset initial capital
-        self.data['SMA1'] = self.data['price'].rolling(SMA1).mean() 
-        self.data['SMA2'] = self.data['price'].rolling(SMA2).mean() 
-        
-        for bar in range (SMA2, len(self.data)):
+        self.reset()
+        self.data['SMA1'] = self.data['price'].rolling(SMA1).mean()
+        self.data['SMA2'] = self.data['price'].rolling(SMA2).mean()
+        sma1 = self.column('SMA1')
+        sma2 = self.column('SMA2')
+
+        def on_bar(bar):
             if self.position in [0, -1]:
-                if self.data['SMA1'].iloc[bar] > self.data['SMA2'].iloc[bar]:
+                if sma1[bar] > sma2[bar]:
                     self.go_long(bar, amount='all')
-                    self.position = 1 # long position
+                    self.position = 1  # long position
             if self.position in [0, 1]:
-                if self.data['SMA1'].iloc[bar] < self.data['SMA2'].iloc[bar]:
+                if sma1[bar] < sma2[bar]:
                     self.go_short(bar, amount='all')
-                    self.position = -1 # short position
-        self.close_out(bar)
-    
+                    self.position = -1  # short position
+
+        self.run_bars(SMA2, on_bar)
+
     def run_momentum_strategy(self, momentum):
         msg = f'\n\nRunning momentum strategy | {momentum} days'
         msg += f'\nfixed costs {self.ftc} | '
-        msg += f'proportional costs {self.ftc} | '
+        msg += f'proportional costs {self.ptc}'
         print(msg)
-        print('=' *  55)
-        self.position = 0 # initial neutral position
-        self.trades = 0 # no trades yet
-        self.amount = self.initial_amount # reset initial capital
+        print('=' * 55)
+        self.reset()
         self.data['momentum'] = self.data['return'].rolling(momentum).mean()
-        for bar in range(momentum, len(self.data)):
+        mom = self.column('momentum')
+
+        def on_bar(bar):
             if self.position in [0, -1]:
-                if self.data['momentum'].iloc[bar] > 0:
+                if mom[bar] > 0:
                     self.go_long(bar, amount='all')
-                    self.position = 1 # long position
+                    self.position = 1  # long position
             if self.position in [0, 1]:
-                if self.data['momentum'].iloc[bar] <= 0:
+                if mom[bar] <= 0:
                     self.go_short(bar, amount='all')
-                    self.position = -1 # short position
-    self.close_out(bar)
-    
-    
+                    self.position = -1  # short position
+
+        self.run_bars(momentum, on_bar)
+
     def run_mean_reversion_strategy(self, SMA, threshold):
         msg = f'\n\nRunning mean reversion strategy | '
         msg += f'SMA={SMA} & thr={threshold}'
@@ -93,31 +95,29 @@ class BacktestLongShort(BacktestBase):
         msg += f'proportional costs {self.ptc}'
         print(msg)
         print('=' * 55)
-        self.position = 0 #initial neutral position
-        self.trades = 0 # no trades yet
-        self.amount = self.initial_amount # reset initial capital
-        
+        self.reset()
         self.data['SMA'] = self.data['price'].rolling(SMA).mean()
-    
-    for bar in range(SMA, len(self.data)):
-        if self.position == 0:
-            if(self.data['price'].iloc[bar] <
-               self.data['SMA'].iloc[bar] - threshold):
-                self.go_long(bar, amount=self.initial_amount)
-                self.position = 1
-            elif (self.data['price'].iloc[bar] >
-                  self.data['SMA'].iloc[bar] + threshold):
-                self.go_short(bar, amount=self.initial_amount)
-                self.position = -1
-        elif self.position == 1:
-            if self.data['price'].iloc[bar] >= self.data['SMA'].iloc[bar]:
-                self.place_sell_order(bar, units=self.units)
-                self.position = 0
-        elif self.poisition == -1:
-            if self.data['price'].iloc[bar] <=self.data['SMA'].iloc[bar]:
-                self.place_buy_order(bar, units=-self.units)
-                self.position = 0
-    self.close_out(bar)
+        price = self.prices
+        sma = self.column('SMA')
+
+        def on_bar(bar):
+            if self.position == 0:
+                if price[bar] < sma[bar] - threshold:
+                    self.go_long(bar, amount=self.initial_amount)
+                    self.position = 1
+                elif price[bar] > sma[bar] + threshold:
+                    self.go_short(bar, amount=self.initial_amount)
+                    self.position = -1
+            elif self.position == 1:
+                if price[bar] >= sma[bar]:
+                    self.place_sell_order(bar, units=self.units)
+                    self.position = 0
+            elif self.position == -1:
+                if price[bar] <= sma[bar]:
+                    self.place_buy_order(bar, units=-self.units)
+                    self.position = 0
+
+        self.run_bars(SMA, on_bar)
 
 
 if __name__ == '__main__':
@@ -132,6 +132,3 @@ if __name__ == '__main__':
     lsbt = BacktestLongShort('AAPL.O', '2010-1-1', '2019-12-31',
                              10000, 10.0, 0.01, False)
     run_strategies()
-            
-            
-     
\ No newline at end of file
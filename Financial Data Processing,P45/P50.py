@@ -1,14 +1,15 @@
 import pandas as pd
+import os
+import sys
+# リポジトリ直下の共通モジュール（market_data）を読み込めるようにする
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from market_data import load_url_csv
 
 # ① データを作る（読み込む）
-data = pd.read_csv(
-    'https://hilpisch.com/pyalgo_eikon_eod_data.csv',
-    index_col=0,
-    parse_dates=True
-).dropna()
+# 1回目だけダウンロードして、2回目以降は data/_market_cache から読む
+data = load_url_csv('https://hilpisch.com/pyalgo_eikon_eod_data.csv').dropna()
 
 # ② 保存先フォルダがなければ作る（重要）
-import os
 os.makedirs('data', exist_ok=True)
 
 # ③ ファイルに書き出す
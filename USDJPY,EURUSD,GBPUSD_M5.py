@@ -2,6 +2,9 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import os
+from ohlc_loader import load_ohlc
+from instruments import instrument_for_path
+from montecarlo import monte_carlo
 
 # ==========================================
 # 【1. 準備ブロック】
@@ -9,31 +12,13 @@ import os
 
 file_path = r'C:\market_data\USDJPY_M5.csv'
 
-try:
-    df = pd.read_csv(file_path, header=0, encoding='utf-8')
-except:
-    df = pd.read_csv(file_path, header=0, encoding='shift-jis')
+df = load_ohlc(file_path)
 
-rename_dict = {'<DTYYYYMMDD>':'Date','<TIME>':'Time','<OPEN>':'Open','<HIGH>':'High','<LOW>':'Low','<CLOSE>':'Close'}
-df.rename(columns=rename_dict, inplace=True, errors='ignore')
-
-if 'Date' in df.columns and 'Time' in df.columns:
-    time_str = df['Time'].astype(str).str.zfill(4)
-    df['Time'] = pd.to_datetime(df['Date'].astype(str) + time_str, format='%Y%m%d%H%M')
-    df.set_index('Time', inplace=True)
-
-df = df[['Open', 'High', 'Low', 'Close']].copy()
-
-# 通貨ペアごとの厳密な設定
-price_sample = df['Close'].iloc[0]
-if price_sample < 50: 
-    pips_unit = 0.0001
-    pip_value_per_1lot = 1500  
-    pair_label = "USDストレート"
-else:
-    pips_unit = 0.01
-    pip_value_per_1lot = 100   
-    pair_label = "クロス円"
+# 通貨ペアごとの厳密な設定（ファイル名の銘柄で instruments.py から引く）
+inst = instrument_for_path(file_path)
+pips_unit = inst['pip_size']
+pip_value_per_1lot = inst['pip_value_jpy']
+pair_label = inst['label']
 
 # バックテスト・パラメータ
 spread_pips = 1.0
@@ -78,11 +63,12 @@ def run_simulation_final(df, sl_pips, spread_pips, pips_unit, pip_val_1lot, cap,
     entry_price = 0
     entry_time = None
     
+    # DataFrame でも memmap_store の BarWindow（期間ビュー）でも受け取れるように np.asarray で取り出す
     times = df.index
-    closes = df['Close'].values
-    highs = df['High'].values
-    lows = df['Low'].values
-    targets = df['target_pos'].values
+    closes = np.asarray(df['Close'])
+    highs = np.asarray(df['High'])
+    lows = np.asarray(df['Low'])
+    targets = np.asarray(df['target_pos'])
 
     for i in range(len(df)):
         if balance <= 0: break
@@ -202,6 +188,12 @@ def print_final_report(tdf, b_hist):
 
 print_final_report(trade_df, balance_history)
 
+# 最大DD・SQN をトレード順の入れ替えで分布にする（破産 = 初期資金の半分を失う確率）
+if not trade_df.empty:
+    mc_paths, mc_summary = monte_carlo(trade_df, pip_value_per_1lot, risk_per_trade, max_lot_cap, initial_capital,
+                                       n_paths=10000, seed=0)
+    print(mc_summary)
+
 plt.figure(figsize=(10, 6))
 plt.plot(balance_history, color='orange', lw=2)
 plt.title('Final Professional Equity Curve')
@@ -0,0 +1,395 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from ohlc_loader import OHLC_COLUMNS, detect_csv_format, frame_from_raw, sniff_time_format, usecols_for
+
+# ==========================================
+# 【パース済み足データのバイナリキャッシュ】
+# 1回目: CSV → load_ohlc → .npy に保存
+# 2回目以降: .npy をメモリマップで開くだけ（CSVのパースをしない）
+# CSVのパス・サイズ・更新時刻が変わったら更新する
+#   - 末尾に追記されただけなら、前回読んだ位置から後ろだけをパースして .npy に追記する
+#   - 上書き・再エクスポートで中身が変わっていたら全部作り直す
+# ==========================================
+
+CACHE_DIR_NAME = '_bar_cache'
+META_FILE = 'meta.json'
+TIME_FILE = 'datetime.npy'
+OHLC_FILE = 'ohlc.npy'
+
+CACHE_VERSION = 2
+
+# 「前回読んだところまで同じファイルか」を確かめるのに使う先頭・末尾のバイト数
+SIGNATURE_BYTES = 4096
+
+
+def source_fingerprint(path):
+    """キャッシュのキー（CSVのパス・サイズ・更新時刻）"""
+    st = os.stat(path)
+    return {
+        'path': os.path.abspath(path),
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+    }
+
+
+def cache_dir_for(path, cache_root=None):
+    """
+    CSVごとのキャッシュフォルダ
+    既定では CSV と同じフォルダの _bar_cache/<ファイル名>_<パスのハッシュ>/
+    """
+    abspath = os.path.abspath(path)
+    if cache_root is None:
+        cache_root = os.path.join(os.path.dirname(abspath), CACHE_DIR_NAME)
+    stem = os.path.splitext(os.path.basename(abspath))[0]
+    digest = hashlib.sha1(abspath.encode('utf-8')).hexdigest()[:10]
+    return os.path.join(cache_root, f'{stem}_{digest}')
+
+
+def read_meta(cache_dir):
+    meta_path = os.path.join(cache_dir, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def is_cache_valid(path, cache_dir, loader_kwargs=None):
+    meta = read_meta(cache_dir)
+    if meta is None:
+        return False
+    return (
+        meta.get('version') == CACHE_VERSION
+        and meta.get('source') == source_fingerprint(path)
+        and meta.get('loader_kwargs') == (loader_kwargs or {})
+    )
+
+
+def cache_files(meta):
+    """
+    meta.json が指している .npy のファイル名 (日時, OHLC)
+    作り直すたびに build ごとの別名で書く（古い形式のキャッシュは datetime.npy / ohlc.npy）
+    """
+    files = (meta or {}).get('files') or {}
+    return files.get('times', TIME_FILE), files.get('ohlc', OHLC_FILE)
+
+
+def write_cache(cache_dir, df, source, loader_kwargs=None, csv_state=None):
+    """
+    DataFrame（DatetimeIndex + Open/High/Low/Close）をキャッシュに書き出す
+    - .npy は作り直すたびに build ごとの新しい名前で書く
+      （同じプロセスが前の .npy をメモリマップで開いたままでも、Windows で上書き・削除に失敗して途中で止まらない）
+    - meta.json は最後に一時ファイルから置き換えるので、途中で落ちても壊れたキャッシュは使われない
+    - 古い .npy はそのあと消す。開いたままで消せないものは残しておき、次に作り直すときに消す
+    - サブフォルダ（bar_pyramid.py の pyramid/ など）は自分でM1と突き合わせるので消さない
+    csv_state: 追記読み込み用の情報（読んだ位置・列の形式など。ingest_csv が作る）
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    build = uuid.uuid4().hex
+    time_file = f'datetime_{build[:12]}.npy'
+    ohlc_file = f'ohlc_{build[:12]}.npy'
+
+    times = df.index.to_numpy(dtype='datetime64[ns]').view('int64')
+    ohlc = np.ascontiguousarray(df[OHLC_COLUMNS].to_numpy(dtype='float64'))
+    np.save(os.path.join(cache_dir, time_file), times)
+    np.save(os.path.join(cache_dir, ohlc_file), ohlc)
+
+    meta = {
+        'version': CACHE_VERSION,
+        # 作り直すたびに変わるID（追記では変わらない）。bar_pyramid.py などが「追記か作り直しか」を見分けるのに使う
+        'build': build,
+        'files': {'times': time_file, 'ohlc': ohlc_file},
+        'source': source,
+        'loader_kwargs': loader_kwargs or {},
+        'columns': OHLC_COLUMNS,
+        'rows': int(len(df)),
+        'last_time': int(times[-1]) if len(times) else None,
+        'csv': csv_state,
+    }
+    _write_meta(cache_dir, meta)
+
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if os.path.isfile(path) and name not in (META_FILE, time_file, ohlc_file):
+            try:
+                os.remove(path)
+            except OSError:
+                pass   # まだメモリマップで開かれている（次に作り直すときに消す）
+    return meta
+
+
+def _write_meta(cache_dir, meta):
+    tmp_path = os.path.join(cache_dir, META_FILE + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, os.path.join(cache_dir, META_FILE))
+
+
+def _append_header(path, values):
+    """
+    values を追記したあとの .npy のヘッダー（バイト列）
+    np.save のヘッダーには行数が増えても書き換えられる余白があるので、通常は同じ長さで書ける
+    余白が足りず長さが変わってしまうとき（まず起きない）は None
+    """
+    with open(path, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+        shape, fortran_order, dtype = read_header(f)
+        header_len = f.tell()
+    if fortran_order or dtype != values.dtype or shape[1:] != values.shape[1:]:
+        raise ValueError(f'{path}: 追記する配列の形式が一致しません')
+
+    header = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+              'shape': (shape[0] + len(values),) + shape[1:]}
+    buf = io.BytesIO()
+    if version == (1, 0):
+        np.lib.format.write_array_header_1_0(buf, header)
+    else:
+        np.lib.format.write_array_header_2_0(buf, header)
+    return buf.getvalue() if len(buf.getvalue()) == header_len else None
+
+
+def _append_npy(path, values, header):
+    """.npy の末尾に行を追記し、ヘッダー（_append_header の戻り値）だけ書き換える（既存部分は読み書きしない）"""
+    with open(path, 'r+b') as f:
+        f.seek(0, os.SEEK_END)
+        f.write(values.tobytes())
+        f.seek(0)
+        f.write(header)
+
+
+def load_cache_arrays(cache_dir, mmap=True):
+    """キャッシュを (times[int64 ns], ohlc[n×4 float64]) のまま返す"""
+    mode = 'r' if mmap else None
+    time_file, ohlc_file = cache_files(read_meta(cache_dir))
+    times = np.load(os.path.join(cache_dir, time_file), mmap_mode=mode)
+    ohlc = np.load(os.path.join(cache_dir, ohlc_file), mmap_mode=mode)
+    return times, ohlc
+
+
+def frame_from_arrays(times, ohlc):
+    """
+    配列からDataFrameを作る（n×4 の配列をそのままブロックとして使うのでコピーしない）
+    """
+    index = pd.DatetimeIndex(np.asarray(times).view('datetime64[ns]'), name='datetime')
+    return pd.DataFrame(ohlc, index=index, columns=OHLC_COLUMNS, copy=False)
+
+
+def _complete_lines_end(path, size):
+    """最後の改行の直後の位置（エクスポート途中で書きかけの最終行は次回に回す）"""
+    with open(path, 'rb') as f:
+        pos = size
+        while pos > 0:
+            step = min(1 << 16, pos)
+            f.seek(pos - step)
+            k = f.read(step).rfind(b'\n')
+            if k >= 0:
+                return pos - step + k + 1
+            pos -= step
+    return 0
+
+
+def _signature(path, offset):
+    """ファイル先頭と offset 直前の数KBのハッシュ（前回読んだ部分が書き換わっていないかの確認用）"""
+    with open(path, 'rb') as f:
+        head = f.read(min(SIGNATURE_BYTES, offset))
+        start = max(0, offset - SIGNATURE_BYTES)
+        f.seek(start)
+        tail = f.read(offset - start)
+    return hashlib.sha1(head + b'|' + tail).hexdigest()
+
+
+def _parse_full(path, encoding=None, time_format=None):
+    """
+    CSV全体をパースする（load_ohlc と同じ結果）
+    追記分だけを読むときに同じ形式で読めるように、列名・文字コード・時刻形式も返す
+    """
+    fmt = detect_csv_format(path, encoding)
+    with open(path, 'r', encoding=fmt['encoding']) as f:
+        header = [name.strip().strip('"') for name in f.readline().strip().split(',')]
+    raw = pd.read_csv(path, header=0, encoding=fmt['encoding'], usecols=usecols_for(fmt))
+
+    # 追記分（数行）だけでは HHMM / HHMMSS を判定できないので、先頭で決めた形式を覚えておく
+    if time_format is None:
+        time_format = sniff_time_format(path, fmt)
+
+    df = frame_from_raw(raw, fmt, time_format)
+    state = {'encoding': fmt['encoding'], 'columns': fmt['columns'], 'header': header, 'time_format': time_format}
+    return df, state
+
+
+def _parse_tail(path, start, end, state):
+    """CSVの start〜end バイト目（ヘッダーなし・行の途中で切れていない）をパースする"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    if not data.strip():
+        return None
+
+    fmt = {'encoding': state['encoding'], 'columns': state['columns']}
+    # BOM はファイル先頭にしかないので、途中から読むときは普通の utf-8
+    encoding = 'utf-8' if state['encoding'] == 'utf-8-sig' else state['encoding']
+    raw = pd.read_csv(io.BytesIO(data), header=None, names=state['header'],
+                      usecols=usecols_for(fmt), encoding=encoding)
+    return frame_from_raw(raw, fmt, state['time_format'])
+
+
+def _try_append(path, cache_dir, meta, source):
+    """
+    前回読んだ位置より後ろだけをパースしてキャッシュに追記する
+    戻り値: (追加した行数, 読んだバイト数)。追記で済ませられないときは ValueError（理由つき）
+    """
+    state = meta.get('csv')
+    if not state or state.get('offset') is None:
+        raise ValueError('追記用の情報がありません')
+    offset = state['offset']
+    if source['size'] < offset:
+        raise ValueError('CSVが前回より短くなっています')
+    if source['size'] == offset:
+        # 1バイトも増えていないのにサイズ・更新時刻が変わった → 同じ長さで書き直された（途中の足の修正など）
+        raise ValueError('CSVが同じ長さで書き換わっています')
+    if _signature(path, offset) != state['signature']:
+        raise ValueError('前回読んだ部分が書き換わっています（再エクスポート）')
+
+    if len(load_cache_arrays(cache_dir)[0]) != meta['rows']:
+        raise ValueError('キャッシュの行数が meta.json と一致しません')
+
+    end = _complete_lines_end(path, source['size'])
+    tail = _parse_tail(path, offset, end, state) if end > offset else None
+
+    added = 0
+    if tail is not None and len(tail):
+        new_times = tail.index.to_numpy(dtype='datetime64[ns]').view('int64')
+        # つなぎ目の確認: 追記分の先頭が既存の最終時刻より後で、追記分の中も昇順であること
+        if meta['last_time'] is not None and new_times[0] <= meta['last_time']:
+            raise ValueError(f'つなぎ目の日時が戻っています: {pd.Timestamp(int(new_times[0]))} <= {pd.Timestamp(meta["last_time"])}')
+        if np.any(np.diff(new_times) <= 0):
+            raise ValueError('追記分の日時が昇順になっていません')
+
+        new_ohlc = np.ascontiguousarray(tail[OHLC_COLUMNS].to_numpy(dtype='float64'))
+        time_file, ohlc_file = cache_files(meta)
+        time_path, ohlc_path = os.path.join(cache_dir, time_file), os.path.join(cache_dir, ohlc_file)
+        headers = [_append_header(time_path, new_times), _append_header(ohlc_path, new_ohlc)]
+        added = len(tail)
+        if None in headers:
+            # ヘッダーの余白が足りない → その場では書き直さず（開いたままのメモリマップがある）、
+            # 既存分 + 追記分を新しい build として書き出す
+            old_times, old_ohlc = load_cache_arrays(cache_dir, mmap=False)
+            state['offset'] = end
+            state['signature'] = _signature(path, end)
+            df = frame_from_arrays(np.r_[old_times, new_times], np.vstack([old_ohlc, new_ohlc]))
+            write_cache(cache_dir, df, source, meta['loader_kwargs'], state)
+            return added, end - offset
+
+        _append_npy(time_path, new_times, headers[0])
+        _append_npy(ohlc_path, new_ohlc, headers[1])
+        meta['rows'] += added
+        meta['last_time'] = int(new_times[-1])
+
+    state['offset'] = end
+    state['signature'] = _signature(path, end)
+    meta['source'] = source
+    _write_meta(cache_dir, meta)
+    return added, end - offset
+
+
+def ingest_csv(path, cache_root=None, **loader_kwargs):
+    """
+    CSVをキャッシュに取り込む（毎日エクスポートし直すCSV用）
+    - 変わっていなければ何もしない
+    - 末尾に追記されただけなら、増えた行だけをパースして追記する（1日分の手間で済む）
+    - それ以外（上書き・途中の書き換え・つなぎ目の日時が戻る）は全部作り直す
+    戻り値: {'mode': 'fresh' / 'append' / 'rebuild', 'rows_added': ..., 'bytes_parsed': ..., 'reason': ...}
+    """
+    cache_dir = cache_dir_for(path, cache_root)
+    if is_cache_valid(path, cache_dir, loader_kwargs):
+        return {'mode': 'fresh', 'rows_added': 0, 'bytes_parsed': 0, 'reason': ''}
+
+    source = source_fingerprint(path)
+    meta = read_meta(cache_dir)
+    reason = 'キャッシュがありません'
+    if meta is not None and meta.get('version') == CACHE_VERSION and meta.get('loader_kwargs') == loader_kwargs:
+        try:
+            added, nbytes = _try_append(path, cache_dir, meta, source)
+            return {'mode': 'append', 'rows_added': added, 'bytes_parsed': nbytes, 'reason': ''}
+        except ValueError as e:
+            reason = str(e)
+    elif meta is not None:
+        reason = 'キャッシュの形式・読み込み設定が違います'
+
+    df, state = _parse_full(path, **loader_kwargs)
+    end = _complete_lines_end(path, source['size'])
+    # 最終行に改行がない（書きかけかもしれない）ときは、その行まで読んでしまったので次回は作り直す
+    state['offset'] = end if end == source['size'] else None
+    state['signature'] = _signature(path, end)
+    write_cache(cache_dir, df, source, loader_kwargs, state)
+    return {'mode': 'rebuild', 'rows_added': len(df), 'bytes_parsed': source['size'], 'reason': reason}
+
+
+def load_ohlc_cached(path, cache_root=None, mmap=True, **loader_kwargs):
+    """
+    load_ohlc のキャッシュ付き版
+    - キャッシュがあり、CSVが変わっていなければ .npy をメモリマップで開くだけ
+    - CSVの末尾に追記されていれば、増えた分だけパースして .npy に追記する（ingest_csv）
+    - なければ / CSVが書き換わっていれば全体をパースして作り直す
+    loader_kwargs（time_format など）は load_ohlc と同じで、キーにも含める
+    """
+    cache_dir = cache_dir_for(path, cache_root)
+
+    if not is_cache_valid(path, cache_dir, loader_kwargs):
+        ingest_csv(path, cache_root, **loader_kwargs)
+
+    times, ohlc = load_cache_arrays(cache_dir, mmap=mmap)
+    return frame_from_arrays(times, ohlc)
+
+
+def clear_cache(path, cache_root=None):
+    cache_dir = cache_dir_for(path, cache_root)
+    if os.path.exists(cache_dir):
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == "__main__":
+    import time
+
+    path = r'C:\market_data\USDJPY_M15.csv'
+
+    t0 = time.perf_counter()
+    df = load_ohlc_cached(path)
+    t1 = time.perf_counter()
+    df = load_ohlc_cached(path)
+    t2 = time.perf_counter()
+
+    print(df.tail())
+    print(f"1回目: {t1 - t0:.3f} 秒 / 2回目（キャッシュ）: {(t2 - t1) * 1000:.1f} ミリ秒")
+
+    # 毎日の再エクスポート後はこれだけ（増えた行だけ読む）
+    print(ingest_csv(path))
+
+
+#=========================================================
+#bar_cache.py（パース済みデータのキャッシュ）
+#=========================================================
+
+#使い方
+#from bar_cache import load_ohlc_cached
+#df = load_ohlc_cached(r'C:\market_data\USDJPY_M15.csv')
+
+#キャッシュの場所
+#C:\market_data\_bar_cache\USDJPY_M15_xxxxxxxxxx\
+#  datetime_<build>.npy … 日時（int64, ナノ秒）
+#  ohlc_<build>.npy     … Open/High/Low/Close（n行×4列, float64）
+#  （作り直すたびに名前が変わる。開いたままの古い .npy があっても Windows で書き込みに失敗しない）
+#  meta.json    … 元CSVのパス・サイズ・更新時刻、どこまで読んだか（バイト位置・最終日時）
+
+#CSVの末尾に足が追記されただけなら、次回は増えた行だけパースして追記する
+#  ingest_csv(path) → {'mode': 'append', 'rows_added': 288, ...} のように何をしたか分かる
+#CSVを上書き・再エクスポートして途中が変わっていたら、次回自動で全部作り直す
+#おかしくなったら _bar_cache フォルダごと消してOK
@@ -0,0 +1,260 @@
+import json
+import os
+import uuid
+
+import numpy as np
+
+from bar_cache import cache_dir_for, frame_from_arrays, load_ohlc_cached, read_meta
+
+# ==========================================
+# 【M1 から上位足をまとめて作る「足ピラミッド」】
+# M1 → M5 → M15 → M30 → H1 → H4 → D1 を1回の流れで作り、M1キャッシュの隣に保存する
+# 別々にエクスポートした M5/M15/H1 のCSVとズレることがなくなる
+# M1 に新しい行が増えたら、各時間足の「最後の1本（未完成かもしれない）」から先だけ作り直す
+# M1 キャッシュが作り直された（CSVの途中が書き換わった）ときは、行数が同じでも全部作り直す
+# ==========================================
+
+NS_PER_MINUTE = 60 * 1_000_000_000
+
+# 時間足 → 1本の長さ（分）。上から順に、1つ前の時間足をまとめて作る
+TIMEFRAMES = {
+    'M5': 5,
+    'M15': 15,
+    'M30': 30,
+    'H1': 60,
+    'H4': 240,
+    'D1': 1440,
+}
+
+PYRAMID_DIR = 'pyramid'
+META_FILE = 'pyramid.json'
+
+
+def aggregate_bars(times, ohlc, minutes):
+    """
+    時刻順の足（times: int64 ns, ohlc: n×4）を minutes 分足にまとめる
+    df.resample(f'{minutes}min').agg(first/max/min/last).dropna() と同じ結果（空の足は作らない）
+    """
+    times = np.asarray(times)
+    ohlc = np.asarray(ohlc)
+    if len(times) == 0:
+        return times[:0].copy(), ohlc[:0].copy()
+
+    step = minutes * NS_PER_MINUTE
+    bucket = times // step
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(times)] - 1
+
+    out = np.empty((len(starts), 4))
+    out[:, 0] = ohlc[starts, 0]
+    out[:, 1] = np.fmax.reduceat(ohlc[:, 1], starts)
+    out[:, 2] = np.fmin.reduceat(ohlc[:, 2], starts)
+    out[:, 3] = ohlc[ends, 3]
+    return bucket[starts] * step, out
+
+
+def build_pyramid(times, ohlc, timeframes=TIMEFRAMES):
+    """
+    M1 から全時間足を作る
+    M5 は M1 から、M15 は M5 から…と下の足をまとめていくので、上に行くほど計算が軽い
+    戻り値: {'M5': (times, ohlc), 'M15': ..., ...}
+    """
+    pyramid = {}
+    src_times, src_ohlc = times, ohlc
+    for tf, minutes in timeframes.items():
+        src_times, src_ohlc = aggregate_bars(src_times, src_ohlc, minutes)
+        pyramid[tf] = (src_times, src_ohlc)
+    return pyramid
+
+
+def update_pyramid(pyramid, new_times, new_ohlc, timeframes=TIMEFRAMES):
+    """
+    M1 の追加分（new_times は既存の最終時刻より後）だけで各時間足を更新する
+    各時間足の最後の1本は未完成の可能性があるので、その足の開始時刻から作り直す
+    """
+    updated = {}
+    src_times, src_ohlc = np.asarray(new_times), np.asarray(new_ohlc)
+
+    for tf, minutes in timeframes.items():
+        old_times, old_ohlc = pyramid[tf]
+        if len(src_times) == 0:
+            updated[tf] = (old_times, old_ohlc)
+            continue
+
+        step = minutes * NS_PER_MINUTE
+        if len(old_times) and old_times[-1] == src_times[0] // step * step:
+            # 最後の1本と追加分の先頭が同じ足 → 最後の1本に追加分を合成する
+            last = np.vstack([old_ohlc[-1:], src_ohlc])
+            last_times = np.r_[old_times[-1], src_times]
+            tf_times, tf_ohlc = aggregate_bars(last_times, last, minutes)
+            keep = len(old_times) - 1
+        else:
+            tf_times, tf_ohlc = aggregate_bars(src_times, src_ohlc, minutes)
+            keep = len(old_times)
+
+        updated[tf] = (np.r_[old_times[:keep], tf_times], np.vstack([old_ohlc[:keep], tf_ohlc]))
+        # 次の時間足は「この時間足で作り直した部分」だけを材料にする
+        src_times, src_ohlc = tf_times, tf_ohlc
+
+    return updated
+
+
+class BarPyramid:
+    """
+    M1のCSV 1本から全時間足を取り出す
+    保存先: <M1キャッシュ>/pyramid/<時間足>/datetime_<build>.npy, ohlc_<build>.npy（どれが今のものかは pyramid.json）
+
+    pyr = BarPyramid(r'C:\\market_data\\USDJPY_M1.csv', time_format='HHMMSS')
+    df_5m = pyr.get('M5')
+    """
+
+    def __init__(self, m1_path, cache_root=None, timeframes=TIMEFRAMES, **loader_kwargs):
+        self.m1_path = m1_path
+        self.cache_root = cache_root
+        self.timeframes = timeframes
+        self.loader_kwargs = loader_kwargs
+        self.root = os.path.join(cache_dir_for(m1_path, cache_root), PYRAMID_DIR)
+        self._fresh = False
+
+    def _tf_dir(self, tf):
+        return os.path.join(self.root, tf)
+
+    def _read_meta(self):
+        path = os.path.join(self.root, META_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _tf_files(self, tf, meta=None):
+        """pyramid.json が指している時間足の .npy のファイル名 (日時, OHLC)。古い形式は datetime.npy / ohlc.npy"""
+        files = ((meta if meta is not None else self._read_meta()) or {}).get('files') or {}
+        tf_files = files.get(tf) or {}
+        return tf_files.get('times', 'datetime.npy'), tf_files.get('ohlc', 'ohlc.npy')
+
+    def _load_tf(self, tf, mmap=True, meta=None):
+        mode = 'r' if mmap else None
+        time_file, ohlc_file = self._tf_files(tf, meta)
+        times = np.load(os.path.join(self._tf_dir(tf), time_file), mmap_mode=mode)
+        ohlc = np.load(os.path.join(self._tf_dir(tf), ohlc_file), mmap_mode=mode)
+        return times, ohlc
+
+    def _m1_state(self):
+        """
+        M1 キャッシュ（bar_cache）の今の状態
+        build … bar_cache が作り直すたびに変わるID（追記では変わらない）
+        source / signature … 元CSVのパス・サイズ・更新時刻と、読んだ範囲の先頭・末尾のハッシュ
+        """
+        meta = read_meta(cache_dir_for(self.m1_path, self.cache_root)) or {}
+        return {
+            'build': meta.get('build'),
+            'source': meta.get('source'),
+            'signature': (meta.get('csv') or {}).get('signature'),
+        }
+
+    def _save(self, pyramid, m1_rows, m1_last, m1_state):
+        """
+        全時間足を書き出す
+        - .npy は保存するたびに build ごとの新しい名前で書く
+          （get() で返したフレームが前の .npy をメモリマップで開いたままなので、その場で上書きすると
+          Linux では古いフレームを読んだ瞬間に SIGBUS、Windows では PermissionError になる）
+        - pyramid.json は最後に一時ファイルから置き換える（途中で落ちたら次回は全部作り直しになる）
+        - 古い .npy はそのあと消す。開いたままで消せないものは残しておき、次に保存するときに消す
+        """
+        build = uuid.uuid4().hex[:12]
+        files = {}
+        for tf, (times, ohlc) in pyramid.items():
+            os.makedirs(self._tf_dir(tf), exist_ok=True)
+            files[tf] = {'times': f'datetime_{build}.npy', 'ohlc': f'ohlc_{build}.npy'}
+            np.save(os.path.join(self._tf_dir(tf), files[tf]['times']), np.asarray(times, dtype='int64'))
+            np.save(os.path.join(self._tf_dir(tf), files[tf]['ohlc']), np.ascontiguousarray(ohlc, dtype='float64'))
+        meta = {
+            'm1_rows': int(m1_rows),
+            'm1_last': int(m1_last),
+            'm1_build': m1_state['build'],
+            'm1_source': m1_state['source'],
+            'm1_signature': m1_state['signature'],
+            'timeframes': self.timeframes,
+            'files': files,
+            'rows': {tf: int(len(times)) for tf, (times, _) in pyramid.items()},
+        }
+        meta_path = os.path.join(self.root, META_FILE)
+        with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=1)
+        os.replace(meta_path + '.tmp', meta_path)
+
+        for tf, tf_files in files.items():
+            for name in os.listdir(self._tf_dir(tf)):
+                if name not in tf_files.values():
+                    try:
+                        os.remove(os.path.join(self._tf_dir(tf), name))
+                    except OSError:
+                        pass   # まだメモリマップで開かれている（次に保存するときに消す）
+
+    def refresh(self):
+        """
+        M1 キャッシュと突き合わせて、必要なら更新する
+        戻り値: 'fresh'（そのまま）/ 'incremental'（追加分だけ）/ 'rebuilt'（全部作り直し）
+        """
+        m1 = load_ohlc_cached(self.m1_path, self.cache_root, **self.loader_kwargs)
+        times = m1.index.asi8
+        ohlc = m1.to_numpy()
+        m1_state = self._m1_state()
+        meta = self._read_meta()
+
+        # 前回から M1 キャッシュが「追記だけ」されたとき（作り直されていない）に限り、続きから作る
+        if (meta is not None and meta.get('timeframes') == self.timeframes
+                and m1_state['build'] is not None and meta.get('m1_build') == m1_state['build']):
+            rows = meta['m1_rows']
+            same_prefix = 0 < rows <= len(times) and times[rows - 1] == meta['m1_last']
+            unchanged = (meta.get('m1_source') == m1_state['source']
+                         and meta.get('m1_signature') == m1_state['signature'])
+            if same_prefix and rows == len(times) and unchanged:
+                self._fresh = True
+                return 'fresh'
+            if same_prefix:
+                old = {tf: self._load_tf(tf, mmap=False, meta=meta) for tf in self.timeframes}
+                pyramid = update_pyramid(old, times[rows:], ohlc[rows:], self.timeframes)
+                self._save(pyramid, len(times), times[-1], m1_state)
+                self._fresh = True
+                return 'incremental'
+
+        os.makedirs(self.root, exist_ok=True)
+        pyramid = build_pyramid(times, ohlc, self.timeframes)
+        self._save(pyramid, len(times), times[-1] if len(times) else 0, m1_state)
+        self._fresh = True
+        return 'rebuilt'
+
+    def get(self, timeframe):
+        """時間足のDataFrame（DatetimeIndex + Open/High/Low/Close）。'M1' なら元のM1"""
+        if timeframe == 'M1':
+            return load_ohlc_cached(self.m1_path, self.cache_root, **self.loader_kwargs)
+        if timeframe not in self.timeframes:
+            raise KeyError(f'{timeframe} は作っていません（{list(self.timeframes)}）')
+        if not self._fresh:
+            self.refresh()
+        times, ohlc = self._load_tf(timeframe)
+        return frame_from_arrays(times, ohlc)
+
+
+if __name__ == "__main__":
+    pyr = BarPyramid(r'C:\market_data\USDJPY_M1.csv', time_format='HHMMSS')
+    print(pyr.refresh())
+    for tf in ['M5', 'H1', 'D1']:
+        print(tf, len(pyr.get(tf)))
+    print(pyr.get('H4').tail())
+
+
+#=========================================================
+#bar_pyramid.py（M1 から全時間足を作る）
+#=========================================================
+
+#使い方
+#from bar_pyramid import BarPyramid
+#pyr = BarPyramid(r'C:\market_data\USDJPY_M1.csv', time_format='HHMMSS')
+#df_5m = pyr.get('M5')    ← resample しなくていい（2回目以降は .npy を開くだけ）
+#df_h1 = pyr.get('H1')
+#M1 が更新されると別名の .npy に書き直すので、前に get() したフレームはそのまま読める（古い中身のまま）
+
+#M5/M15/H1 を別々にエクスポートしなくても、全部 M1 から同じ形で作れる
+#時間足の区切りは resample と同じ（0:00 起点、空の足は作らない）
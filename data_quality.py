@@ -0,0 +1,208 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from ohlc_loader import NS_PER_DAY, NS_PER_SECOND, detect_csv_format, frame_from_raw, usecols_for
+
+# ==========================================
+# 【足データの品質チェック（バックテスト前に毎回回す用）】
+# 数百万本でも numpy の一括計算だけで、以下をまとめて調べる
+#   - 読み込みで捨てられた行（日時に変換できない行）
+#   - 時間足のグリッドに対する欠損（週末は除く）
+#   - 日時の重複・逆順
+#   - High < Low、Open/Close が [Low, High] の外、NaN
+#   - ATR の N 倍を超える値動き（スパイク）
+# 戻り値は dict（そのまま json にできる）
+# ==========================================
+
+NS_PER_MINUTE = 60 * NS_PER_SECOND
+
+# 1970-01-01 は木曜日（weekday=3）
+_EPOCH_WEEKDAY = 3
+
+# 既定の週末（土・日）。ブローカー時間で日曜夜から始まるデータでも、日曜の足は欠損に数えない
+WEEKEND_DAYS = (5, 6)
+
+
+def _ts(ns):
+    return pd.Timestamp(int(ns)).isoformat()
+
+
+def infer_timeframe_minutes(times):
+    """隣り合う足の間隔の最頻値（分）を時間足とみなす"""
+    diffs = np.diff(np.asarray(times))
+    diffs = diffs[diffs > 0]
+    if len(diffs) == 0:
+        return None
+    values, counts = np.unique(diffs, return_counts=True)
+    return int(values[np.argmax(counts)] // NS_PER_MINUTE)
+
+
+def _open_slots_before(times, step, weekend_days):
+    """
+    1970-01-01 から times までに、週末以外の日にあるグリッドの足が何本あるか（times の足自身は含まない）
+    週ごとの本数 × 週数 + 週の途中の日数 で計算するので、ループなしで求まる
+    """
+    open_day = np.array([(_EPOCH_WEEKDAY + k) % 7 not in weekend_days for k in range(7)])
+    open_before = np.r_[0, np.cumsum(open_day)]  # 週の最初の r 日のうち営業日の数
+    slots_per_day = NS_PER_DAY // step
+
+    days = times // NS_PER_DAY
+    weeks, rem = days // 7, days % 7
+    is_open = open_day[rem]
+    in_day = (times % NS_PER_DAY) // step
+    count = (weeks * open_before[7] + open_before[rem]) * slots_per_day + np.where(is_open, in_day, 0)
+    return count, is_open
+
+
+def scan_gaps(times, timeframe_minutes, weekend_days=WEEKEND_DAYS, max_examples=20):
+    """
+    並べ替え済み・重複なしの日時から、グリッドに対して抜けている足を数える
+    1日より長い時間足（W1 など）はグリッドの判定をしない
+    """
+    step = timeframe_minutes * NS_PER_MINUTE
+    if NS_PER_DAY % step != 0 or len(times) < 2:
+        return {'missing_bars': None, 'off_grid': None, 'gaps': []}
+
+    off_grid = times % step != 0
+    count, is_open = _open_slots_before(times, step, weekend_days)
+    # 次の足までに、本来あるはずの足の数（自分が営業時間内なら自分の分を引く）
+    missing = count[1:] - count[:-1] - (is_open[:-1] & ~off_grid[:-1])
+    missing = np.maximum(missing, 0)
+
+    gap_idx = np.flatnonzero(missing)
+    top = gap_idx[np.argsort(-missing[gap_idx], kind='stable')[:max_examples]]
+    gaps = [{'after': _ts(times[i]), 'next': _ts(times[i + 1]), 'missing': int(missing[i])} for i in sorted(top)]
+
+    return {
+        'missing_bars': int(missing.sum()),
+        'gap_count': int(len(gap_idx)),
+        'off_grid': int(off_grid.sum()),
+        'gaps': gaps,
+    }
+
+
+def scan_bars(df, timeframe_minutes=None, atr_period=14, spike_atr=10.0,
+              weekend_days=WEEKEND_DAYS, max_examples=20):
+    """
+    DatetimeIndex + Open/High/Low/Close の足データを調べて、レポート（dict）を返す
+    timeframe_minutes: None なら足の間隔の最頻値から判定する
+    spike_atr: 1本の値幅（TR）が直前までの ATR の何倍を超えたらスパイクとみなすか
+    """
+    times = df.index.to_numpy(dtype='datetime64[ns]').view('int64')
+    o = np.asarray(df['Open'], dtype='float64')
+    h = np.asarray(df['High'], dtype='float64')
+    l = np.asarray(df['Low'], dtype='float64')
+    c = np.asarray(df['Close'], dtype='float64')
+    n = len(times)
+
+    def examples(mask):
+        return [_ts(t) for t in times[np.flatnonzero(mask)[:max_examples]]]
+
+    report = {'rows': n}
+    if n == 0:
+        report['ok'] = False
+        return report
+    report['start'] = _ts(times.min())
+    report['end'] = _ts(times.max())
+
+    # ---------- 並び順・重複 ----------
+    d = np.diff(times)
+    backwards = np.r_[False, d < 0]
+    report['non_monotonic'] = {'count': int(backwards.sum()), 'examples': examples(backwards)}
+
+    sorted_times = times if not backwards.any() else np.sort(times)
+    dup = np.r_[False, sorted_times[1:] == sorted_times[:-1]]
+    report['duplicates'] = {
+        'count': int(dup.sum()),
+        'examples': [_ts(t) for t in sorted_times[np.flatnonzero(dup)[:max_examples]]],
+    }
+
+    # ---------- 欠損（グリッドとの比較） ----------
+    unique_times = sorted_times[~dup]
+    if timeframe_minutes is None:
+        timeframe_minutes = infer_timeframe_minutes(unique_times)
+    report['timeframe_minutes'] = timeframe_minutes
+    if timeframe_minutes:
+        report['gaps'] = scan_gaps(unique_times, timeframe_minutes, weekend_days, max_examples)
+
+    # ---------- OHLC の整合性 ----------
+    nan_rows = np.isnan(o) | np.isnan(h) | np.isnan(l) | np.isnan(c)
+    high_low = h < l
+    close_out = (c > h) | (c < l)
+    open_out = (o > h) | (o < l)
+    report['ohlc'] = {
+        'nan_rows': {'count': int(nan_rows.sum()), 'examples': examples(nan_rows)},
+        'high_below_low': {'count': int(high_low.sum()), 'examples': examples(high_low)},
+        'close_outside_range': {'count': int(close_out.sum()), 'examples': examples(close_out)},
+        'open_outside_range': {'count': int(open_out.sum()), 'examples': examples(open_out)},
+    }
+
+    # ---------- スパイク（TR が直前までの ATR の N 倍超） ----------
+    prev_c = np.r_[np.nan, c[:-1]]
+    tr = np.maximum(h - l, np.maximum(abs(h - prev_c), abs(l - prev_c)))
+    atr_prev = pd.Series(tr).rolling(atr_period).mean().shift(1).to_numpy()
+    with np.errstate(invalid='ignore'):
+        spike = tr > spike_atr * atr_prev
+    report['spikes'] = {'atr_multiple': spike_atr, 'count': int(spike.sum()), 'examples': examples(spike)}
+
+    report['ok'] = not (
+        backwards.any() or dup.any() or nan_rows.any() or high_low.any()
+        or close_out.any() or open_out.any() or spike.any()
+    )
+    return report
+
+
+def scan_csv(path, encoding=None, time_format=None, **scan_kwargs):
+    """
+    CSVを読み込んで scan_bars する
+    ローダーが黙って捨てている「日時に変換できない行」の数もレポートに入れる
+    """
+    fmt = detect_csv_format(path, encoding)
+    raw = pd.read_csv(path, header=0, encoding=fmt['encoding'], usecols=usecols_for(fmt))
+    total = len(raw)
+    df = frame_from_raw(raw, fmt, time_format)
+
+    report = {'path': path, 'csv_rows': total, 'dropped_rows': total - len(df)}
+    report.update(scan_bars(df, **scan_kwargs))
+    if report['dropped_rows']:
+        report['ok'] = False
+    return report
+
+
+def summarize(report):
+    """レポートを1行ずつの表（項目, 件数）にする"""
+    rows = [('dropped_rows', report.get('dropped_rows', 0)),
+            ('non_monotonic', report['non_monotonic']['count']),
+            ('duplicates', report['duplicates']['count']),
+            ('missing_bars', report.get('gaps', {}).get('missing_bars')),
+            ('spikes', report['spikes']['count'])]
+    rows += [(f'ohlc.{k}', v['count']) for k, v in report['ohlc'].items()]
+    return pd.DataFrame(rows, columns=['check', 'count'])
+
+
+if __name__ == "__main__":
+    import time
+
+    t0 = time.perf_counter()
+    report = scan_csv(r'C:\market_data\USDJPY_M5.csv')
+    print(f"{time.perf_counter() - t0:.2f} 秒")
+
+    print(summarize(report).to_string(index=False))
+    print(json.dumps(report['gaps'], ensure_ascii=False, indent=1))
+
+
+#=========================================================
+#data_quality.py（足データの品質チェック）
+#=========================================================
+
+#使い方
+#from data_quality import scan_bars, scan_csv
+#report = scan_csv(r'C:\market_data\USDJPY_M5.csv')   ← 捨てられた行数も分かる
+#report = scan_bars(df)                                ← 読み込み済みの df でもOK
+#if not report['ok']: print(summarize(report))
+
+#json.dump(report, f) でそのまま保存できる（日時は ISO 形式の文字列）
+#欠損は「週末（土日）以外で、時間足のグリッドにあるはずの足」で数える
+#年末年始・祝日の休場も欠損として出てくるので、gaps の日付を見て判断する
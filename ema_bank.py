@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 【EMAバンク（複数の期間のEMAをまとめて計算）】
+# df['Close'].ewm(span=X, adjust=False).mean() を span ごとに何度も書く代わりに、
+# 価格配列と span のリストから (本数 × span数) の2次元配列を1回で作る
+#   - 各 span は pandas の ewm でそのまま計算し、結果を列ごとに詰める（pandas と1ビットも違わない）
+#   - 保存は dtype（既定 float32）で、メモリは float64 の DataFrame の半分
+# ==========================================
+
+BANK_DTYPE = 'float32'
+
+
+def ema_bank(prices, spans, dtype=BANK_DTYPE):
+    """
+    prices: 終値などの1次元配列 / spans: [5, 20, 80, 200] など
+    戻り値: (len(prices), len(spans)) の配列（列 j が spans[j] のEMA。列ごとに連続したメモリ）
+    dtype='float64' なら pandas と完全に一致、既定の float32 はそれを丸めたもの
+    """
+    prices = pd.Series(np.asarray(prices, dtype='float64'), copy=False)
+    spans = list(spans)
+    out = np.empty((len(prices), len(spans)), dtype=dtype, order='F')
+    for j, span in enumerate(spans):
+        out[:, j] = prices.ewm(span=span, adjust=False).mean().to_numpy()
+    return out
+
+
+class EMABank:
+    """
+    emas = EMABank(df['Close'], [5, 20, 80, 200])
+    emas[20]          → span=20 のEMA（1次元配列）
+    emas.to_frame()   → 列 EMA5, EMA20, ... のDataFrame
+    """
+
+    def __init__(self, prices, spans, dtype=BANK_DTYPE):
+        self.index = prices.index if isinstance(prices, pd.Series) else None
+        self.spans = list(spans)
+        self.values = ema_bank(prices, self.spans, dtype=dtype)
+        self._col = {span: j for j, span in enumerate(self.spans)}
+
+    def __getitem__(self, span):
+        if span not in self._col:
+            raise KeyError(f'span={span} は計算していません（{self.spans}）')
+        return self.values[:, self._col[span]]
+
+    def __contains__(self, span):
+        return span in self._col
+
+    def to_frame(self, prefix='EMA'):
+        return pd.DataFrame(self.values, index=self.index, columns=[f'{prefix}{s}' for s in self.spans])
+
+
+if __name__ == "__main__":
+    import time
+
+    from bar_cache import load_ohlc_cached
+
+    df = load_ohlc_cached(r'C:\market_data\USDJPY_M5.csv')
+    spans = [5, 20, 80, 200]
+
+    t0 = time.perf_counter()
+    emas = EMABank(df['Close'], spans)
+    t1 = time.perf_counter()
+    print(emas.to_frame().tail())
+    print(f"{len(df)} 本 × {len(spans)} 本のEMA: {t1 - t0:.3f} 秒, {emas.values.nbytes / 1024 ** 2:.1f} MB")
+
+    exact = EMABank(df['Close'], spans, dtype='float64')
+    for span in spans:
+        same = np.array_equal(exact[span], df['Close'].ewm(span=span, adjust=False).mean().to_numpy(), equal_nan=True)
+        print(span, 'pandas と一致' if same else '不一致')
+
+
+#=========================================================
+#ema_bank.py（EMAをまとめて計算）
+#=========================================================
+
+#使い方
+#from ema_bank import EMABank
+#emas = EMABank(df['Close'], [20, 80, 200])
+#df['EMA_short'] = emas[20]
+
+#パラメータを振って何通りも試すときは、使う span を全部まとめて1回作っておけば、
+#組み合わせごとに ewm を計算し直さなくていい
+#既定は float32（メモリ半分）。シグナルを pandas と完全に同じにしたいときは dtype='float64'
@@ -0,0 +1,238 @@
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 【SL/TP の決済足をまとめて探すエンジン】
+# forex-tester5min.py の run_backtest は全ての足を Python の for で回して
+# 「安値がSL以下か・高値がTP以上か・反対シグナルか」を1本ずつ見ている
+# ここでは1トレードごとに、決済が起きる最初の足を numpy の検索で直接探す
+#   - 安値・高値はブロック（既定256本）ごとの最小・最大を先に作っておき、
+#     触れていないブロックは中身を見ずに飛ばす
+#   - 反対シグナル・次のエントリー候補は「i 本目以降で最初に現れる足」を配列で持っておく
+#   - 複利のロット計算は、トレードの数だけ回る短いループで順番に解く
+# 結果（trade_df, history）は fx_backtest.run_backtest と完全に同じ
+# ==========================================
+
+BLOCK_SIZE = 256
+
+
+def next_true_index(mask):
+    """
+    各 i について「i 本目以降で mask が最初に True になる位置」（なければ len(mask)）
+    例: [F, T, F, F, T] → [1, 1, 4, 4, 4]
+    """
+    n = len(mask)
+    idx = np.where(mask, np.arange(n), n)
+    return np.minimum.accumulate(idx[::-1])[::-1]
+
+
+class ExtremaIndex:
+    """
+    安値・高値の「最初に水準に触れた足」を探すための索引
+    ブロックごとの最小（安値）・最大（高値）を持つだけなので、メモリは元の 2/BLOCK_SIZE 程度
+    NaN の足はループ版と同じく「触れていない」扱い（fmin / fmax で無視する）
+    """
+
+    def __init__(self, lows, highs, block_size=BLOCK_SIZE):
+        self.lows = np.asarray(lows)
+        self.highs = np.asarray(highs)
+        self.n = len(self.lows)
+        self.block_size = block_size
+        starts = np.arange(0, self.n, block_size)
+        if self.n:
+            self.low_min = np.fmin.reduceat(self.lows, starts)
+            self.high_max = np.fmax.reduceat(self.highs, starts)
+        else:
+            self.low_min = self.high_max = self.lows[:0]
+
+    def first_low_at_or_below(self, level, start, stop):
+        """[start, stop) で 安値 <= level になる最初の足（なければ stop）"""
+        return self._first(self.lows, self.low_min, np.less_equal, level, start, stop)
+
+    def first_high_at_or_above(self, level, start, stop):
+        """[start, stop) で 高値 >= level になる最初の足（なければ stop）"""
+        return self._first(self.highs, self.high_max, np.greater_equal, level, start, stop)
+
+    def _first(self, values, blocks, op, level, start, stop):
+        stop = min(stop, self.n)
+        if start >= stop:
+            return stop
+        b = self.block_size
+
+        # start が入っているブロックの残り
+        head_end = min((start // b + 1) * b, stop)
+        hit = np.flatnonzero(op(values[start:head_end], level))
+        if len(hit):
+            return start + int(hit[0])
+
+        # その先はブロックの最小・最大で当たりのブロックを探す（見る範囲は倍々に広げる）
+        k = start // b + 1
+        last = (stop - 1) // b + 1
+        width = 16
+        while k < last:
+            end = min(k + width, last)
+            found = np.flatnonzero(op(blocks[k:end], level))
+            if len(found):
+                k += int(found[0])
+                lo = k * b
+                hit = np.flatnonzero(op(values[lo:min(lo + b, stop)], level))
+                # 最後のブロックは stop より先で触れているだけのこともある
+                return lo + int(hit[0]) if len(hit) else stop
+            k = end
+            width *= 2
+        return stop
+
+
+def run_backtest_vectorized(df, pips_unit, pip_value_jpy, spread_pips=1.0,
+                            sl_atr_multiplier=1.5, tp_atr_multiplier=3.0,
+                            risk_percent=0.01, initial_capital=100000, max_lots=10.0,
+                            block_size=BLOCK_SIZE, resolver=None):
+    """
+    fx_backtest.run_backtest（forex-tester5min.py）と同じ結果を、足ごとのループなしで出す
+    df は Open / High / Low / signal / ATR を持つ DataFrame（compact 版や BarWindow でもよい）
+
+    1トレードの流れ（ループ版と同じ順番・同じ優先順位）:
+      エントリー … i-1 本目のシグナルが 0 以外・ATR が NaN でない・ロット > 0.01 なら i 本目の始値
+      決済       … i 本目以降で最初に「SL に触れる / TP に触れる / 1本前が反対シグナル」になった足
+                   同じ足で複数起きたら SL → TP → Reverse の順
+      次のエントリーは決済した足の次の足から探す
+    resolver … intrabar.IntrabarResolver。渡すと SL と TP が同じ足のときだけ M1 でどちらが先か決める
+    """
+    times = df.index
+    opens = np.asarray(df['Open'])
+    highs = np.asarray(df['High'])
+    lows = np.asarray(df['Low'])
+    signals = np.asarray(df['signal'])
+    atrs = np.asarray(df['ATR'])
+    n = len(opens)
+
+    balance = initial_capital
+    history = [initial_capital]
+    trades = []
+    if n <= 2:
+        return pd.DataFrame(trades), history
+
+    extrema = ExtremaIndex(lows, highs, block_size)
+    tp_same_bar = 0 if resolver is None else 1
+
+    # i 本目に判定に使うのは i-1 本目のシグナルと ATR
+    prev_signal = np.empty(n, dtype=signals.dtype)
+    prev_signal[0] = 0
+    prev_signal[1:] = signals[:-1]
+    prev_atr_ok = np.zeros(n, dtype=bool)
+    prev_atr_ok[1:] = ~np.isnan(atrs[:-1])
+
+    entry_candidate = (prev_signal != 0) & prev_atr_ok
+    entry_candidate[:2] = False                   # ループ版は i = 2 から
+    next_entry = next_true_index(entry_candidate)
+    next_sell_signal = next_true_index(prev_signal == -1)   # 買いポジションの Reverse
+    next_buy_signal = next_true_index(prev_signal == 1)     # 売りポジションの Reverse
+
+    i = int(next_entry[2])
+    while i < n:
+        atr = atrs[i-1]
+        sl_pips = atr * sl_atr_multiplier / pips_unit
+        tp_pips = atr * tp_atr_multiplier / pips_unit
+
+        risk_amount = balance * risk_percent
+        lots = risk_amount / (sl_pips * pip_value_jpy)
+        if lots > max_lots:
+            lots = max_lots
+
+        if not lots > 0.01:
+            i = int(next_entry[i + 1]) if i + 1 < n else n
+            continue
+
+        curr_pos = signals[i-1]
+        entry_price = opens[i]
+
+        if curr_pos == 1:
+            sl_price = entry_price - (sl_pips * pips_unit)
+            tp_price = entry_price + (tp_pips * pips_unit)
+            reverse = int(next_sell_signal[i])
+            # SL は Reverse と同じ足でも優先なので reverse の足まで含めて探す
+            sl_bar = extrema.first_low_at_or_below(sl_price, i, reverse + 1)
+            # TP は SL より前（同じ足なら SL が優先）だけ探せばいい
+            # resolver があるときは SL と同じ足も探す（どちらが先かは M1 で決める）
+            tp_bar = extrema.first_high_at_or_above(tp_price, i, min(sl_bar + tp_same_bar, reverse + 1))
+        else:
+            sl_price = entry_price + (sl_pips * pips_unit)
+            tp_price = entry_price - (tp_pips * pips_unit)
+            reverse = int(next_buy_signal[i])
+            sl_bar = extrema.first_high_at_or_above(sl_price, i, reverse + 1)
+            tp_bar = extrema.first_low_at_or_below(tp_price, i, min(sl_bar + tp_same_bar, reverse + 1))
+
+        # SL に触れた足で TP にも触れていたら、M1 で TP が先なら SL は無かったことにする
+        sl_found = sl_bar < min(reverse + 1, n)
+        if resolver is not None and sl_found and tp_bar == sl_bar and resolver.resolve(times[sl_bar], curr_pos, sl_price, tp_price) == "TP":
+            sl_bar = n
+
+        exit_bar = min(sl_bar, tp_bar, reverse)
+        if exit_bar >= n:
+            break   # 最後まで決済されなかった（ループ版でもトレードとして記録されない）
+
+        if exit_bar == sl_bar:
+            exit_price = sl_price
+            reason = "SL"
+        elif exit_bar == tp_bar:
+            exit_price = tp_price
+            reason = "TP"
+        else:
+            exit_price = opens[exit_bar]
+            reason = "Reverse"
+
+        pips_diff = (exit_price - entry_price) * curr_pos / pips_unit
+        net_pips = pips_diff - spread_pips
+        profit_yen = net_pips * pip_value_jpy * lots
+
+        balance += profit_yen
+        trades.append({
+            'entry_time': times[i], 'exit_time': times[exit_bar],
+            'type': 'BUY' if curr_pos == 1 else 'SELL',
+            'pips': net_pips, 'profit': profit_yen, 'balance': balance, 'reason': reason
+        })
+        history.append(balance)
+        if balance <= 0:
+            break
+
+        i = int(next_entry[exit_bar + 1]) if exit_bar + 1 < n else n
+
+    return pd.DataFrame(trades), history
+
+
+if __name__ == "__main__":
+    import time
+
+    from bar_cache import load_ohlc_cached
+    from fx_backtest import add_indicators, add_signal, run_backtest
+    from instruments import instrument_for_path
+
+    file_path = r'C:\market_data\USDJPY_M5.csv'
+    inst = instrument_for_path(file_path)
+    df = add_signal(add_indicators(load_ohlc_cached(file_path)), slope_thresh=2.0 * inst['pip_size'])
+
+    t0 = time.perf_counter()
+    loop_df, loop_hist = run_backtest(df, inst['pip_size'], inst['pip_value_jpy'])
+    t1 = time.perf_counter()
+    fast_df, fast_hist = run_backtest_vectorized(df, inst['pip_size'], inst['pip_value_jpy'])
+    t2 = time.perf_counter()
+
+    print(f"ループ版: {t1 - t0:.2f} 秒 / このエンジン: {t2 - t1:.2f} 秒 / トレード数 {len(fast_df)}")
+    print('一致' if loop_df.equals(fast_df) and loop_hist == fast_hist else '不一致')
+
+
+#=========================================================
+#exit_engine.py（SL/TP の決済足をまとめて探す）
+#=========================================================
+
+#使い方
+#from exit_engine import run_backtest_vectorized
+#trade_df, history = run_backtest_vectorized(df, pips_unit=0.01, pip_value_jpy=1000)
+#引数・戻り値は fx_backtest.run_backtest と同じ（そのまま置き換えられる）
+
+#足の数ではなくトレードの数だけ Python が回るので、M1 を何年分も回すときほど差が出る
+#SL/TP の距離が大きくて決済まで何千本もかかるトレードでも、ブロック単位で飛ばすので遅くならない
+
+#ExtremaIndex は単体でも使える（「この水準に最初に触れた足」を探す）
+#ext = ExtremaIndex(df['Low'], df['High'])
+#bar = ext.first_high_at_or_above(150.0, start, len(df))
@@ -2,42 +2,16 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import os
+from ohlc_loader import load_ohlc
+from ema_bank import EMABank
 
 # --- 1. データの読み込み設定 ---
 file_path = r'C:\market_data\USDJPY_M1.csv'
 
-# フォレックステスターの形式に合わせて読み込み
-# encodingは、エラーが出る場合は 'shift-jis' か 'utf-8' に切り替えてください
-try:
-    df = pd.read_csv(file_path, header=0, encoding='utf-8')
-except UnicodeDecodeError:
-    df = pd.read_csv(file_path, header=0, encoding='shift-jis')
-
-# --- 2. 列名の正規化 (前と同じ) ---
-rename_dict = {
-    '<DTYYYYMMDD>': 'Date', '<TIME>': 'Time',
-    '<OPEN>': 'Open', '<HIGH>': 'High', '<LOW>': 'Low', '<CLOSE>': 'Close', '<VOL>': 'TickVol',
-    'DATE': 'Date', 'TIME': 'Time', 'OPEN': 'Open', 'HIGH': 'High', 'LOW': 'Low', 'CLOSE': 'Close'
-}
-df.rename(columns=rename_dict, inplace=True)
-
-# --- 3. 【修正ポイント】日付と時間を正しく合体させる ---
-if 'Date' in df.columns and 'Time' in df.columns:
-    # 時間(Time)を6桁の文字列に揃える (例: 0 -> 000000, 100 -> 000100)
-    time_str = df['Time'].astype(str).str.zfill(6)
-    # 日付(Date)を文字列にする
-    date_str = df['Date'].astype(str)
-    
-    # 合体させて日付型に変換 (YYYYMMDDHHMMSS の形式を指定)
-    df['Combined_Time'] = pd.to_datetime(date_str + time_str, format='%Y%m%d%H%M%S', errors='coerce')
-    
-    # 万が一変換に失敗した行（空行など）があれば消す
-    df.dropna(subset=['Combined_Time'], inplace=True)
-    
-    df.set_index('Combined_Time', inplace=True)
-
-# 必要な列が揃っているか確認し、余計な列（<TICKER>等）を捨てる
-df = df[['Open', 'High', 'Low', 'Close']].copy()
+# --- 2〜3. 読み込み・列名の正規化・日時の合体 ---
+# 文字コード判定と <TIME> の桁数（HHMMSS）の判定は ohlc_loader が行う
+# 変換に失敗した行（空行など）は捨て、余計な列（<TICKER>等）も読まない
+df = load_ohlc(file_path, time_format='HHMMSS')
 
 print("--- データの読み込みと整形に成功しました ---")
 print(df.head())
@@ -57,10 +31,11 @@ avg_gain = gain.rolling(window=period_rsi).mean()
 avg_loss = loss.rolling(window=period_rsi).mean()
 df['RSI'] = 100 - (100 / (1 + avg_gain / avg_loss))
 
-# EMAの計算
-df['EMA5'] = df['Close'].ewm(span=5, adjust=False).mean()
-df['EMA20'] = df['Close'].ewm(span=20, adjust=False).mean()
-df['EMA200'] = df['Close'].ewm(span=200, adjust=False).mean()
+# EMAの計算（ema_bank で3本まとめて1回で計算。float64 なので ewm(adjust=False) と同じ値）
+emas = EMABank(df['Close'], [5, 20, 200], dtype='float64')
+df['EMA5'] = emas[5]
+df['EMA20'] = emas[20]
+df['EMA200'] = emas[200]
 
 # EMA20の角度
 df['EMA20_slope'] = df['EMA20'].diff(5) 
@@ -2,6 +2,8 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import os
+from ohlc_loader import load_ohlc
+from instruments import instrument_for_path
 
 # ==========================================
 # 【1. 設定・準備ブロック】
@@ -17,54 +19,17 @@ RISK_PERCENT = 0.01         # 1トレードの許容損失(1%)
 INITIAL_CAPITAL = 100000    # 初期資金(円)
 MAX_LOTS = 100.0            # 最大ロット
 
-# --- 通貨ペア特性の自動判定 ---
-# データの最初の数行だけ読み込んで判定（errors='ignore'を削除）
-try:
-    temp_df = pd.read_csv(file_path, nrows=5, header=0, encoding='utf-8')
-except:
-    temp_df = pd.read_csv(file_path, nrows=5, header=0, encoding='shift-jis')
-
-# 列名クリーニング（カッコを除去して大文字化）
-temp_df.columns = [c.replace('<','').replace('>','').upper() for c in temp_df.columns]
-
-# CLOSE列を探してサンプル価格を取得
-if 'CLOSE' in temp_df.columns:
-    price_sample = temp_df['CLOSE'].iloc[0]
-else:
-    # 列名が見つからない場合のフォールバック（最初の数値列を探すなど）
-    price_sample = temp_df.select_dtypes(include=[np.number]).iloc[0, 0]
-
-if price_sample < 50:
-    PIPS_UNIT = 0.0001      # EURUSD等
-    PIP_VALUE_JPY = 1500    # 1ロットで1pip動いた時の円価値 (10ドル×150円想定)
-    pair_label = "EURUSD (ドルストレート)"
-else:
-    PIPS_UNIT = 0.01        # USDJPY等
-    PIP_VALUE_JPY = 1000    # 1ロットで1pip動いた時の円価値 (1000円)
-    pair_label = "USDJPY/CrossJPY (円ペア)"
+# --- 通貨ペア特性 ---
+# CSVの先頭を読んで価格で推測せず、ファイル名の銘柄で instruments.py から引く
+inst = instrument_for_path(file_path)
+PIPS_UNIT = inst['pip_size']            # EURUSD等 0.0001 / USDJPY等 0.01
+PIP_VALUE_JPY = inst['pip_value_jpy']   # 1ロットで1pip動いた時の円価値 (EURUSD: 10ドル×150円想定)
+pair_label = inst['label']
 
 SLOPE_THRESH = SLOPE_THRESH_PIPS * PIPS_UNIT
 
-# 1. 本データの読み込み
-try:
-    df = pd.read_csv(file_path, header=0, encoding='utf-8')
-except:
-    df = pd.read_csv(file_path, header=0, encoding='shift-jis')
-
-# 列名正規化
-rename_dict = {
-    '<DTYYYYMMDD>':'Date','<TIME>':'Time','<OPEN>':'Open','<HIGH>':'High','<LOW>':'Low','<CLOSE>':'Close',
-    'DATE':'Date', 'TIME':'Time', 'OPEN':'Open', 'HIGH':'High', 'LOW':'Low', 'CLOSE':'Close'
-}
-df.rename(columns=rename_dict, inplace=True, errors='ignore')
-
-if 'Date' in df.columns:
-    # Timeが数値（4桁）の場合に備えてzfill
-    df['Time'] = pd.to_datetime(df['Date'].astype(str) + df['Time'].astype(str).str.zfill(4), format='%Y%m%d%H%M', errors='coerce')
-    df.dropna(subset=['Time'], inplace=True)
-    df.set_index('Time', inplace=True)
-
-df = df[['Open', 'High', 'Low', 'Close']].copy()
+# 1. 本データの読み込み（ohlc_loader で共通化）
+df = load_ohlc(file_path)
 
 # ==========================================
 # 【2. インジケータ・シグナル計算ブロック】
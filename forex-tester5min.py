@@ -1,6 +1,12 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from bar_cache import load_ohlc_cached
+from fx_backtest import add_indicators, add_signal, build_compact_frame
+from instruments import instrument_for_path
+from exit_engine import run_backtest_vectorized
+from intrabar import IntrabarResolver
+from montecarlo import monte_carlo
 
 # ==========================================
 # 【1. 設定・準備ブロック】
@@ -19,120 +25,46 @@ RISK_PERCENT = 0.01
 INITIAL_CAPITAL = 100000
 MAX_LOTS = 10.0
 
-# --- データ読み込み ---
-try:
-    df = pd.read_csv(file_path, header=0, encoding='utf-8')
-except:
-    df = pd.read_csv(file_path, header=0, encoding='shift-jis')
-
-# 列名正規化
-rename_dict = {
-    '<DTYYYYMMDD>': 'Date', '<TIME>': 'Time', '<OPEN>': 'Open', '<HIGH>': 'High', '<LOW>': 'Low', '<CLOSE>': 'Close',
-    'DATE': 'Date', 'TIME': 'Time', 'OPEN': 'Open', 'HIGH': 'High', 'LOW': 'Low', 'CLOSE': 'Close'
-}
-df.rename(columns=rename_dict, inplace=True, errors='ignore')
+# True: 省メモリ版（M1 を何年分も回すとき用。指標の途中列を持たない）
+COMPACT_MODE = False
 
-# Time列の作成
-if 'Date' in df.columns and 'Time' in df.columns:
-    df['Time'] = pd.to_datetime(df['Date'].astype(str) + df['Time'].astype(str).str.zfill(4), format='%Y%m%d%H%M', errors='coerce')
-    df.dropna(subset=['Time'], inplace=True)
-    df.set_index('Time', inplace=True)
+# 同じ足で SL と TP の両方に触れたとき、M1 でどちらが先か確かめる（None なら今まで通り SL が先）
+M1_PATH = None          # 例: r'C:\market_data\USDJPY_M1.csv'
+BAR_MINUTES = 15        # file_path の時間足（分）
 
-df = df[['Open', 'High', 'Low', 'Close']].copy()
+# --- データ読み込み ---
+# 文字コード判定・列名正規化・日時生成は ohlc_loader にまとめた
+# 2回目以降は _bar_cache の .npy を開くだけ（CSVを更新すると自動で作り直す）
+df = load_ohlc_cached(file_path)
 
-# --- 通貨ペア特性判定 ---
-price_sample = df['Close'].iloc[0]
-if price_sample < 50:
-    PIPS_UNIT = 0.0001
-    PIP_VALUE_JPY = 1500
-    pair_label = "EURUSD (ドルストレート)"
-else:
-    PIPS_UNIT = 0.01
-    PIP_VALUE_JPY = 1000
-    pair_label = "USDJPY (円ペア)"
+# --- 通貨ペア特性 ---
+# 最初の終値から推測せず、ファイル名の銘柄で instruments.py から引く
+inst = instrument_for_path(file_path)
+PIPS_UNIT = inst['pip_size']
+PIP_VALUE_JPY = inst['pip_value_jpy']
+pair_label = inst['label']
 
 SLOPE_THRESH = SLOPE_THRESH_PIPS * PIPS_UNIT
 
 # ==========================================
 # 【2. インジケータ・シグナル計算ブロック】
 # ==========================================
-df['EMA_short'] = df['Close'].ewm(span=20, adjust=False).mean()
-df['EMA_long'] = df['Close'].ewm(span=80, adjust=False).mean()
-df['EMA_trend'] = df['Close'].ewm(span=200, adjust=False).mean()
-df['EMA_slope'] = df['EMA_long'].diff(5)
-
-# ---------- ATR ----------
-df['TR'] = np.maximum(df['High'] - df['Low'],
-                     np.maximum(abs(df['High'] - df['Close'].shift(1)),
-                                abs(df['Low'] - df['Close'].shift(1))))
-df['ATR'] = df['TR'].rolling(ATR_PERIOD).mean()
-
-# ---------- ADX ----------
-df['PlusDM'] = np.where((df['High'] - df['High'].shift(1)) >
-                        (df['Low'].shift(1) - df['Low']), 
-                        np.maximum(df['High'] - df['High'].shift(1), 0), 0)
-
-df['MinusDM'] = np.where((df['Low'].shift(1) - df['Low']) >
-                         (df['High'] - df['High'].shift(1)),
-                         np.maximum(df['Low'].shift(1) - df['Low'], 0), 0)
-
-df['TR_smooth'] = df['TR'].rolling(ATR_PERIOD).sum()
-df['PlusDM_smooth'] = df['PlusDM'].rolling(ATR_PERIOD).sum()
-df['MinusDM_smooth'] = df['MinusDM'].rolling(ATR_PERIOD).sum()
-
-df['PlusDI'] = 100 * (df['PlusDM_smooth'] / df['TR_smooth'])
-df['MinusDI'] = 100 * (df['MinusDM_smooth'] / df['TR_smooth'])
-
-df['DX'] = 100 * (abs(df['PlusDI'] - df['MinusDI']) / (df['PlusDI'] + df['MinusDI']))
-df['ADX'] = df['DX'].rolling(ATR_PERIOD).mean()
-
-# 24時間稼働 → time_filter無し
-# ------------- ADX方向性の追加 -------------
-# buy条件
-buy_cond = (
-    (df['Close'] > df['EMA_trend']) &
-    (df['EMA_short'] > df['EMA_long']) &
-    (df['Close'] < df['EMA_short']) &
-    (df['EMA_slope'] > SLOPE_THRESH) &
-    (df['ADX'] > 25) &
-    (df['PlusDI'] > df['MinusDI'])   # ここ追加
-)
-
-# sell条件
-sell_cond = (
-    (df['Close'] < df['EMA_trend']) &
-    (df['EMA_short'] < df['EMA_long']) &
-    (df['Close'] > df['EMA_short']) &
-    (df['EMA_slope'] < -SLOPE_THRESH) &
-    (df['ADX'] > 25) &
-    (df['MinusDI'] > df['PlusDI'])   # ここ追加
-)
-
-
-df['signal'] = 0
-df.loc[buy_cond, 'signal'] = 1
-df.loc[sell_cond, 'signal'] = -1
+if COMPACT_MODE:
+    # 途中の指標は残さず、Open/High/Low/Close/ATR(float32) + signal(int8) だけにする
+    df, mem_report = build_compact_frame(df, SLOPE_THRESH, ATR_PERIOD)
+    print(mem_report.to_string(index=False))
+else:
+    # EMA(20/80/200)・傾き・ATR・ADX とシグナルは fx_backtest と共通（24時間稼働 → time_filter無し）
+    # stream_backtest / exit_engine / sweep / signal_masks もこれと同じ値になるように作ってある
+    df = add_signal(add_indicators(df, ATR_PERIOD), SLOPE_THRESH, adx_thresh=25)
 
 # ==========================================
 # 【3. 実運用シミュレーションブロック】
 # ==========================================
 def run_backtest(df):
-    balance = INITIAL_CAPITAL
-    history = [INITIAL_CAPITAL]
-    trades = []
-
-    curr_pos = 0
-    entry_price = 0
-    entry_time = None
-    lots = 0
-
+    # DataFrame でも memmap_store の BarWindow（期間ビュー）でも受け取れるように np.asarray で取り出す
     times = df.index
-    opens = df['Open'].values
-    highs = df['High'].values
-    lows = df['Low'].values
-    closes = df['Close'].values
-    signals = df['signal'].values
-    atrs = df['ATR'].values
+    signals = np.asarray(df['signal'])
 
     # デバッグ用
     print("データ数:", len(df))
@@ -140,77 +72,28 @@ def run_backtest(df):
     print("最後の日時:", times[-1])
     print("シグナル数:", (signals != 0).sum())
 
-    for i in range(2, len(df)):
-        # エントリー
-        if curr_pos == 0 and signals[i-1] != 0:
-            if np.isnan(atrs[i-1]):
-                continue
-
-            atr = atrs[i-1]
-            sl_pips = atr * SL_ATR_MULTIPLIER / PIPS_UNIT
-            tp_pips = atr * TP_ATR_MULTIPLIER / PIPS_UNIT
+    # 足ごとの for ループは exit_engine に置き換えた（トレード一覧・残高推移は同じ）
+    # エントリーごとに「SL / TP / 反対シグナル」が最初に起きる足を配列の検索で探す
+    resolver = None
+    if M1_PATH is not None:
+        resolver = IntrabarResolver.from_csv(M1_PATH, BAR_MINUTES)
 
-            risk_amount = balance * RISK_PERCENT
-            lots = risk_amount / (sl_pips * PIP_VALUE_JPY)
-            if lots > MAX_LOTS:
-                lots = MAX_LOTS
+    trades, history = run_backtest_vectorized(
+        df, PIPS_UNIT, PIP_VALUE_JPY, spread_pips=SPREAD_PIPS,
+        sl_atr_multiplier=SL_ATR_MULTIPLIER, tp_atr_multiplier=TP_ATR_MULTIPLIER,
+        risk_percent=RISK_PERCENT, initial_capital=INITIAL_CAPITAL, max_lots=MAX_LOTS,
+        resolver=resolver)
 
-            if lots > 0.01:
-                curr_pos = signals[i-1]
-                entry_price = opens[i]
-                entry_time = times[i]
-                entry_sl_pips = sl_pips
-                entry_tp_pips = tp_pips
+    if resolver is not None:
+        counts = resolver.report()
+        print(f"M1 で解決した足: {counts['ambiguous']} 本"
+              f"（TP が先 {counts['tp_first']} / SL が先 {counts['sl_first']}"
+              f" / M1 でも同時 {counts['same_m1']} / M1 なし {counts['no_m1']}）")
 
-        # 決済
-        if curr_pos != 0:
-            exit_price = 0
-            reason = ""
-            if curr_pos == 1:
-                sl_price = entry_price - (entry_sl_pips * PIPS_UNIT)
-                tp_price = entry_price + (entry_tp_pips * PIPS_UNIT)
+    if history[-1] <= 0:
+        print("資金がゼロになりました。終了します。")
 
-                if lows[i] <= sl_price:
-                    exit_price = sl_price
-                    reason = "SL"
-                elif highs[i] >= tp_price:
-                    exit_price = tp_price
-                    reason = "TP"
-                elif signals[i-1] == -1:
-                    exit_price = opens[i]
-                    reason = "Reverse"
-            else:
-                sl_price = entry_price + (entry_sl_pips * PIPS_UNIT)
-                tp_price = entry_price - (entry_tp_pips * PIPS_UNIT)
-
-                if highs[i] >= sl_price:
-                    exit_price = sl_price
-                    reason = "SL"
-                elif lows[i] <= tp_price:
-                    exit_price = tp_price
-                    reason = "TP"
-                elif signals[i-1] == 1:
-                    exit_price = opens[i]
-                    reason = "Reverse"
-
-            if exit_price != 0:
-                pips_diff = (exit_price - entry_price) * curr_pos / PIPS_UNIT
-                net_pips = pips_diff - SPREAD_PIPS
-                profit_yen = net_pips * PIP_VALUE_JPY * lots
-
-                balance += profit_yen
-                trades.append({
-                    'entry_time': entry_time, 'exit_time': times[i],
-                    'type': 'BUY' if curr_pos == 1 else 'SELL',
-                    'pips': net_pips, 'profit': profit_yen, 'balance': balance, 'reason': reason
-                })
-                curr_pos = 0
-                history.append(balance)
-                if balance <= 0:
-                    print("資金がゼロになりました。終了します。")
-                    break
-
-    return pd.DataFrame(trades), history
+    return trades, history
 
 trade_df, balance_history = run_backtest(df)
 
@@ -254,3 +137,9 @@ def show_report(tdf, b_hist):
     plt.show()
 
 show_report(trade_df, balance_history)
+
+# 最大DD・SQN は上の1通りの順番の値なので、トレード順を作り直して分布も見る
+if not trade_df.empty:
+    mc_paths, mc_summary = monte_carlo(trade_df, PIP_VALUE_JPY, RISK_PERCENT, MAX_LOTS, INITIAL_CAPITAL,
+                                       n_paths=10000, min_lots=0.01, seed=0)
+    print(mc_summary)
@@ -2,6 +2,8 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import os
+from ohlc_loader import load_ohlc
+from instruments import instrument_for_path
 
 # ==========================================
 # 【1. 準備ブロック】
@@ -10,40 +12,16 @@ import os
 # テストしたいファイルのパスを指定（ここを変えるだけでOK）
 file_path = r'C:\market_data\GBPUSD_M5.csv' 
 
-# 1. データの読み込み
-try:
-    df = pd.read_csv(file_path, header=0, encoding='utf-8')
-except UnicodeDecodeError:
-    df = pd.read_csv(file_path, header=0, encoding='shift-jis')
-
-# 2. 列名の正規化 (FT/MT4形式を共通化)
-rename_dict = {
-    '<DTYYYYMMDD>': 'Date', '<TIME>': 'Time',
-    '<OPEN>': 'Open', '<HIGH>': 'High', '<LOW>': 'Low', '<CLOSE>': 'Close', '<VOL>': 'TickVol',
-    'DATE': 'Date', 'TIME': 'Time', 'OPEN': 'Open', 'HIGH': 'High', 'LOW': 'Low', 'CLOSE': 'Close'
-}
-df.rename(columns=rename_dict, inplace=True)
-
-# 3. 日付と時間の合体 (5分足・4桁パディング対応)
-if 'Date' in df.columns and 'Time' in df.columns:
-    time_str = df['Time'].astype(str).str.zfill(4) 
-    date_str = df['Date'].astype(str)
-    df['Combined_Time'] = pd.to_datetime(date_str + time_str, format='%Y%m%d%H%M', errors='coerce')
-    df.dropna(subset=['Combined_Time'], inplace=True)
-    df.set_index('Combined_Time', inplace=True)
-
-df = df[['Open', 'High', 'Low', 'Close']].copy()
+# 1〜3. データの読み込み・列名の正規化・日付と時間の合体（ohlc_loader で共通化）
+df = load_ohlc(file_path)
 
 # ------------------------------------------
-# ★自動pips単位判定ロジック
+# ★pips単位（銘柄ごとの値を instruments.py から引く）
 # ------------------------------------------
-# 価格が50以下（ユーロドル等）なら 0.0001、それ以上（ドル円等）なら 0.01
-if df['Close'].iloc[0] < 50:
-    pips_unit = 0.00012
-    pair_name = "USD以外（ドルストレート）"
-else:
-    pips_unit = 0.012
-    pair_name = "JPYペア（クロス円）"
+# 価格から推測しない（GBPUSD の 1pip は 0.0001、円ペアは 0.01）
+inst = instrument_for_path(file_path)
+pips_unit = inst['pip_size']
+pair_name = inst['label']
 
 # 4. パラメータ設定 (pips単位を掛けて自動調整)
 spread = 1.0 * pips_unit           # スプレッド 1.0 pips
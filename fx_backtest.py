@@ -0,0 +1,418 @@
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 【forex-tester のロジックを import できる形にしたもの】
+# forex-tester5min.py（ATRでSL/TP + ADX）と
+# USDJPY,EURUSD,GBPUSD_M5.py（run_simulation_final）の計算をそのまま関数にした
+# ファイル名に - や , が入っているスクリプトは import できないので、
+# 他のモジュール（ストリーミング・最適化など）はこちらを使う
+# ==========================================
+
+ATR_PERIOD = 14
+
+
+# ------------------------------------------
+# forex-tester5min.py のインジケータ・シグナル
+# ------------------------------------------
+
+def add_indicators(df, atr_period=ATR_PERIOD):
+    """EMA(20/80/200)・EMAの傾き・ATR・ADX を df に追加する（forex-tester5min.py と同じ計算）"""
+    df['EMA_short'] = df['Close'].ewm(span=20, adjust=False).mean()
+    df['EMA_long'] = df['Close'].ewm(span=80, adjust=False).mean()
+    df['EMA_trend'] = df['Close'].ewm(span=200, adjust=False).mean()
+    df['EMA_slope'] = df['EMA_long'].diff(5)
+
+    # ---------- ATR ----------
+    df['TR'] = np.maximum(df['High'] - df['Low'],
+                         np.maximum(abs(df['High'] - df['Close'].shift(1)),
+                                    abs(df['Low'] - df['Close'].shift(1))))
+    df['ATR'] = df['TR'].rolling(atr_period).mean()
+
+    # ---------- ADX ----------
+    df['PlusDM'] = np.where((df['High'] - df['High'].shift(1)) >
+                            (df['Low'].shift(1) - df['Low']),
+                            np.maximum(df['High'] - df['High'].shift(1), 0), 0)
+
+    df['MinusDM'] = np.where((df['Low'].shift(1) - df['Low']) >
+                             (df['High'] - df['High'].shift(1)),
+                             np.maximum(df['Low'].shift(1) - df['Low'], 0), 0)
+
+    df['TR_smooth'] = df['TR'].rolling(atr_period).sum()
+    df['PlusDM_smooth'] = df['PlusDM'].rolling(atr_period).sum()
+    df['MinusDM_smooth'] = df['MinusDM'].rolling(atr_period).sum()
+
+    add_adx_from_smooth(df)
+    df['ADX'] = df['DX'].rolling(atr_period).mean()
+    return df
+
+
+def add_adx_from_smooth(df):
+    """TR_smooth / PlusDM_smooth / MinusDM_smooth から PlusDI・MinusDI・DX を計算する"""
+    df['PlusDI'] = 100 * (df['PlusDM_smooth'] / df['TR_smooth'])
+    df['MinusDI'] = 100 * (df['MinusDM_smooth'] / df['TR_smooth'])
+
+    df['DX'] = 100 * (abs(df['PlusDI'] - df['MinusDI']) / (df['PlusDI'] + df['MinusDI']))
+    return df
+
+
+def add_signal(df, slope_thresh, adx_thresh=25):
+    """押し目買い・戻り売り + ADX方向性（forex-tester5min.py と同じ条件）"""
+    buy_cond = (
+        (df['Close'] > df['EMA_trend']) &
+        (df['EMA_short'] > df['EMA_long']) &
+        (df['Close'] < df['EMA_short']) &
+        (df['EMA_slope'] > slope_thresh) &
+        (df['ADX'] > adx_thresh) &
+        (df['PlusDI'] > df['MinusDI'])
+    )
+
+    sell_cond = (
+        (df['Close'] < df['EMA_trend']) &
+        (df['EMA_short'] < df['EMA_long']) &
+        (df['Close'] > df['EMA_short']) &
+        (df['EMA_slope'] < -slope_thresh) &
+        (df['ADX'] > adx_thresh) &
+        (df['MinusDI'] > df['PlusDI'])
+    )
+
+    df['signal'] = 0
+    df.loc[buy_cond, 'signal'] = 1
+    df.loc[sell_cond, 'signal'] = -1
+    return df
+
+
+# ------------------------------------------
+# 省メモリ版（float32 価格・指標 / int8 シグナル）
+# ------------------------------------------
+
+PRICE_DTYPE = 'float32'
+SIGNAL_DTYPE = 'int8'
+
+
+def _mb(nbytes):
+    return round(nbytes / 1024 ** 2, 2)
+
+
+def frame_memory(df):
+    """DataFrame（index込み）のメモリ使用量 [byte]"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def _rolling(values, window, how):
+    roll = pd.Series(values, copy=False).rolling(window)
+    return (roll.mean() if how == 'mean' else roll.sum()).to_numpy()
+
+
+def build_compact_frame(df, slope_thresh, atr_period=ATR_PERIOD, adx_thresh=25):
+    """
+    add_indicators + add_signal の省メモリ版
+    途中の指標（EMA・TR・DM・DI・DX など）は1本ずつ float64 で計算して、条件に使ったらすぐ捨てる
+    残すのは run_backtest に必要な列だけ:
+      Open/High/Low/Close/ATR … float32, signal … int8, index … int64 ナノ秒（DatetimeIndex）
+    signal は通常版と同じ（指標は float64 で計算するため）。ATR と価格は float32 に丸めるので、
+    run_backtest の損益は float32 の丸め分（1e-7 程度）だけずれる
+
+    戻り値: (compact_df, report)
+      report … 段階ごとに「その時点で持っている配列」のメモリ量（DataFrame）
+    """
+    n = len(df)
+    report = []
+
+    def record(stage, *arrays):
+        nbytes = sum(a.nbytes for a in arrays) + n * 8  # + 日時（int64）
+        report.append({'stage': stage, 'MB': _mb(nbytes), 'bytes_per_bar': round(nbytes / max(n, 1), 1)})
+
+    high = df['High'].to_numpy(dtype='float64')
+    low = df['Low'].to_numpy(dtype='float64')
+    close = df['Close'].to_numpy(dtype='float64')
+    record('価格（float64 作業用）', high, low, close)
+
+    # ---------- EMA と傾き → 条件の前半だけ bool で残す ----------
+    ema_long = pd.Series(close).ewm(span=80, adjust=False).mean().to_numpy()
+    ema_slope = np.full(n, np.nan)
+    ema_slope[5:] = ema_long[5:] - ema_long[:-5]
+    ema_short = pd.Series(close).ewm(span=20, adjust=False).mean().to_numpy()
+    ema_trend = pd.Series(close).ewm(span=200, adjust=False).mean().to_numpy()
+    record('EMA（float64 作業用）', high, low, close, ema_short, ema_long, ema_trend, ema_slope)
+
+    buy = (close > ema_trend) & (ema_short > ema_long) & (close < ema_short) & (ema_slope > slope_thresh)
+    sell = (close < ema_trend) & (ema_short < ema_long) & (close > ema_short) & (ema_slope < -slope_thresh)
+    del ema_short, ema_long, ema_trend, ema_slope
+    record('EMA条件（bool）', high, low, close, buy, sell)
+
+    # ---------- ATR ----------
+    prev_close = np.r_[np.nan, close[:-1]]
+    tr = np.maximum(high - low, np.maximum(abs(high - prev_close), abs(low - prev_close)))
+    del prev_close
+    atr = _rolling(tr, atr_period, 'mean').astype(PRICE_DTYPE)
+    tr_smooth = _rolling(tr, atr_period, 'sum')
+    del tr
+    record('ATR', high, low, close, buy, sell, atr, tr_smooth)
+
+    # ---------- ADX ----------
+    up = high - np.r_[np.nan, high[:-1]]
+    down = np.r_[np.nan, low[:-1]] - low
+    plus_dm = np.where(up > down, np.maximum(up, 0), 0)
+    minus_dm = np.where(down > up, np.maximum(down, 0), 0)
+    del up, down
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        plus_di = 100 * (_rolling(plus_dm, atr_period, 'sum') / tr_smooth)
+        del plus_dm
+        minus_di = 100 * (_rolling(minus_dm, atr_period, 'sum') / tr_smooth)
+        del minus_dm, tr_smooth
+        dx = 100 * (abs(plus_di - minus_di) / (plus_di + minus_di))
+    adx = _rolling(dx, atr_period, 'mean')
+    del dx
+    record('ADX（float64 作業用）', high, low, close, buy, sell, atr, plus_di, minus_di, adx)
+
+    buy &= (adx > adx_thresh) & (plus_di > minus_di)
+    sell &= (adx > adx_thresh) & (minus_di > plus_di)
+    del adx, plus_di, minus_di, high, low, close
+
+    signal = np.zeros(n, dtype=SIGNAL_DTYPE)
+    signal[buy] = 1
+    signal[sell] = -1
+    del buy, sell
+
+    compact = pd.DataFrame({
+        'Open': df['Open'].to_numpy(dtype=PRICE_DTYPE),
+        'High': df['High'].to_numpy(dtype=PRICE_DTYPE),
+        'Low': df['Low'].to_numpy(dtype=PRICE_DTYPE),
+        'Close': df['Close'].to_numpy(dtype=PRICE_DTYPE),
+        'ATR': atr,
+        'signal': signal,
+    }, index=df.index)
+    nbytes = frame_memory(compact)
+    report.append({'stage': '完成（残す列だけ）', 'MB': _mb(nbytes), 'bytes_per_bar': round(nbytes / max(n, 1), 1)})
+
+    return compact, pd.DataFrame(report)
+
+
+def run_backtest(df, pips_unit, pip_value_jpy, spread_pips=1.0,
+                 sl_atr_multiplier=1.5, tp_atr_multiplier=3.0,
+                 risk_percent=0.01, initial_capital=100000, max_lots=10.0, resolver=None):
+    """
+    forex-tester5min.py の run_backtest と同じ（定数を引数にしただけ）
+    前の足のシグナルで次の足の始値にエントリーし、ATR×倍率 のSL/TPか反対シグナルで決済
+    resolver … intrabar.IntrabarResolver。渡すと SL と TP の両方に触れた足は M1 でどちらが先か決める
+               （None なら元のコードと同じく SL が先）
+    """
+    balance = initial_capital
+    history = [initial_capital]
+    trades = []
+
+    curr_pos = 0
+    entry_price = 0
+    entry_time = None
+    lots = 0
+
+    times = df.index
+    opens = np.asarray(df['Open'])
+    highs = np.asarray(df['High'])
+    lows = np.asarray(df['Low'])
+    signals = np.asarray(df['signal'])
+    atrs = np.asarray(df['ATR'])
+
+    for i in range(2, len(df)):
+        # エントリー
+        if curr_pos == 0 and signals[i-1] != 0:
+            if np.isnan(atrs[i-1]):
+                continue
+
+            atr = atrs[i-1]
+            sl_pips = atr * sl_atr_multiplier / pips_unit
+            tp_pips = atr * tp_atr_multiplier / pips_unit
+
+            risk_amount = balance * risk_percent
+            lots = risk_amount / (sl_pips * pip_value_jpy)
+            if lots > max_lots:
+                lots = max_lots
+
+            if lots > 0.01:
+                curr_pos = signals[i-1]
+                entry_price = opens[i]
+                entry_time = times[i]
+                entry_sl_pips = sl_pips
+                entry_tp_pips = tp_pips
+
+        # 決済
+        if curr_pos != 0:
+            exit_price = 0
+            reason = ""
+            if curr_pos == 1:
+                sl_price = entry_price - (entry_sl_pips * pips_unit)
+                tp_price = entry_price + (entry_tp_pips * pips_unit)
+
+                sl_hit = lows[i] <= sl_price
+                if sl_hit and resolver is not None and highs[i] >= tp_price:
+                    sl_hit = resolver.resolve(times[i], 1, sl_price, tp_price) == "SL"
+
+                if sl_hit:
+                    exit_price = sl_price
+                    reason = "SL"
+                elif highs[i] >= tp_price:
+                    exit_price = tp_price
+                    reason = "TP"
+                elif signals[i-1] == -1:
+                    exit_price = opens[i]
+                    reason = "Reverse"
+            else:
+                sl_price = entry_price + (entry_sl_pips * pips_unit)
+                tp_price = entry_price - (entry_tp_pips * pips_unit)
+
+                sl_hit = highs[i] >= sl_price
+                if sl_hit and resolver is not None and lows[i] <= tp_price:
+                    sl_hit = resolver.resolve(times[i], -1, sl_price, tp_price) == "SL"
+
+                if sl_hit:
+                    exit_price = sl_price
+                    reason = "SL"
+                elif lows[i] <= tp_price:
+                    exit_price = tp_price
+                    reason = "TP"
+                elif signals[i-1] == 1:
+                    exit_price = opens[i]
+                    reason = "Reverse"
+
+            if exit_price != 0:
+                pips_diff = (exit_price - entry_price) * curr_pos / pips_unit
+                net_pips = pips_diff - spread_pips
+                profit_yen = net_pips * pip_value_jpy * lots
+
+                balance += profit_yen
+                trades.append({
+                    'entry_time': entry_time, 'exit_time': times[i],
+                    'type': 'BUY' if curr_pos == 1 else 'SELL',
+                    'pips': net_pips, 'profit': profit_yen, 'balance': balance, 'reason': reason
+                })
+                curr_pos = 0
+                history.append(balance)
+                if balance <= 0:
+                    break
+
+    return pd.DataFrame(trades), history
+
+
+# ------------------------------------------
+# USDJPY,EURUSD,GBPUSD_M5.py のロジック
+# ------------------------------------------
+
+def add_emas(df):
+    df['EMA_short'] = df['Close'].ewm(span=20, adjust=False).mean()
+    df['EMA_long'] = df['Close'].ewm(span=80, adjust=False).mean()
+    df['EMA_trend'] = df['Close'].ewm(span=200, adjust=False).mean()
+    df['EMA_slope'] = df['EMA_long'].diff(5)
+    return df
+
+
+def add_target_pos(df, slope_threshold, start_hour=16, end_hour=1):
+    """EMAの並び + 傾き + 時間帯（16時〜翌1時）で目標ポジションを決める"""
+    hour = df.index.hour
+    time_filter = (hour >= start_hour) | (hour <= end_hour)
+
+    buy_target = (df['EMA_short'] > df['EMA_long']) & (df['Close'] > df['EMA_trend']) & (df['EMA_slope'] > slope_threshold) & time_filter
+    sell_target = (df['EMA_short'] < df['EMA_long']) & (df['Close'] < df['EMA_trend']) & (df['EMA_slope'] < -slope_threshold) & time_filter
+
+    df['target_pos'] = 0
+    df.loc[buy_target, 'target_pos'] = 1
+    df.loc[sell_target, 'target_pos'] = -1
+    return df
+
+
+def run_simulation_final(df, sl_pips, spread_pips, pips_unit, pip_val_1lot, cap, risk, max_lot):
+    """USDJPY,EURUSD,GBPUSD_M5.py の run_simulation_final と同じ"""
+    trades = []
+    balance = cap
+    history = [cap]
+
+    curr_pos = 0
+    current_lot = 0
+    entry_price = 0
+    entry_time = None
+
+    times = df.index
+    closes = np.asarray(df['Close'])
+    highs = np.asarray(df['High'])
+    lows = np.asarray(df['Low'])
+    targets = np.asarray(df['target_pos'])
+
+    for i in range(len(df)):
+        if balance <= 0: break
+
+        target = targets[i]
+
+        # --- A. ポジション保有中の処理 ---
+        if curr_pos != 0:
+            exit_executed = False
+            net_pips = 0
+            exit_price = 0
+
+            # 1. 損切り(SL)判定 (最優先)
+            if curr_pos == 1:
+                sl_price = entry_price - (sl_pips * pips_unit)
+                if lows[i] <= sl_price:
+                    exit_price = sl_price
+                    net_pips = -(sl_pips + spread_pips)
+                    exit_executed = True
+            else:
+                sl_price = entry_price + (sl_pips * pips_unit)
+                if highs[i] >= sl_price:
+                    exit_price = sl_price
+                    net_pips = -(sl_pips + spread_pips)
+                    exit_executed = True
+
+            # 2. シグナル反転判定 (SLがヒットしていない場合のみ)
+            if not exit_executed and target != curr_pos:
+                exit_price = closes[i]
+                raw_pips = (exit_price - entry_price) * curr_pos / pips_unit
+                net_pips = raw_pips - spread_pips
+                exit_executed = True
+
+            if exit_executed:
+                trade_profit_yen = net_pips * pip_val_1lot * current_lot
+                balance += trade_profit_yen
+
+                trades.append({
+                    'entry_time': entry_time, 'exit_time': times[i],
+                    'entry_price': entry_price, 'exit_price': exit_price,
+                    'side': 'BUY' if curr_pos == 1 else 'SELL',
+                    'profit_pips': net_pips, 'profit_yen': trade_profit_yen,
+                    'balance': balance
+                })
+
+                curr_pos = 0
+                history.append(balance)
+
+                # 決済・反転が発生した足では「新規建て」を禁止。次の足に回す。
+                continue
+
+        # --- B. 新規エントリー判定 ---
+        if curr_pos == 0 and target != 0:
+            risk_amount = balance * risk
+            current_lot = risk_amount / ((sl_pips + spread_pips) * pip_val_1lot)
+            if current_lot > max_lot: current_lot = max_lot
+
+            if current_lot > 0:
+                entry_price = closes[i]
+                entry_time = times[i]
+                curr_pos = target
+
+    return pd.DataFrame(trades), history
+
+
+#=========================================================
+#fx_backtest.py（スクリプトのロジックを関数として使う）
+#=========================================================
+
+#使い方
+#from fx_backtest import add_indicators, add_signal, run_backtest
+#df = add_signal(add_indicators(load_ohlc_cached(path)), slope_thresh=2.0 * 0.01)
+#trade_df, history = run_backtest(df, pips_unit=0.01, pip_value_jpy=1000)
+
+#M1 を長期間回すときは省メモリ版（通常版 168 byte/本 → 29 byte/本）
+#compact, report = build_compact_frame(df, slope_thresh=2.0 * 0.01)
+#print(report)                       ← 段階ごとのメモリ量
+#trade_df, history = run_backtest(compact, pips_unit=0.01, pip_value_jpy=1000)
+
@@ -1,10 +1,12 @@
-import yfinance as yf
 import pandas as pd
+from market_data import MarketData, YFinanceSource
 
 # 1. Yahoo!ファイナンスからアップル(AAPL)のデータを取得
 # 本のデータに合わせて2010年から2020年くらいまでのデータを取ってみます
+# market_data のキャッシュ経由なので、2回目以降はダウンロードしない（足りない期間だけ取りに行く）
 symbol = 'AAPL'
-df = yf.download(symbol, start='2010-01-01', end='2020-12-31')
+md = MarketData(YFinanceSource())
+df = md.get_frames(symbol, start='2010-01-01', end='2020-12-31')[symbol]
 
 # 2. 本のデータ形式（Eikon風）に少し近づける
 # 本では「終値(Close)」を使っていることが多いので、Closeだけ抜き出す
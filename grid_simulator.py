@@ -0,0 +1,188 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 【run_simulation_final のパラメータ総当たりをまとめて回す】
+# USDJPY,EURUSD,GBPUSD_M5.py の run_simulation_final は 1回の呼び出しで
+# (sl_pips, slope_threshold, risk) の組み合わせ1つしか試せない
+# ここでは N 通りの組み合わせの「ポジション・建値・ロット・残高」を長さ N の numpy 配列で持ち、
+# 足を1本進めるたびに N 通りを同時に更新する
+#   - Python の for は足の本数だけ（組み合わせの数には比例しない）
+#   - 全員ノーポジで、どの閾値でもシグナルが出ない足は何もせずに飛ばす
+# 1つ1つの組み合わせの結果は fx_backtest.run_simulation_final と完全に同じ
+# ==========================================
+
+PARAM_COLUMNS = ['sl_pips', 'slope_threshold', 'risk']
+
+
+def make_grid(sl_pips, slope_threshold, risk):
+    """各パラメータの候補リストから全組み合わせの DataFrame を作る（列は PARAM_COLUMNS）"""
+    rows = list(itertools.product(sl_pips, slope_threshold, risk))
+    return pd.DataFrame(rows, columns=PARAM_COLUMNS, dtype='float64')
+
+
+def run_simulation_grid(df, params, spread_pips, pips_unit, pip_val_1lot, cap, max_lot,
+                        start_hour=16, end_hour=1):
+    """
+    df     … Close / High / Low と EMA_short / EMA_long / EMA_trend / EMA_slope を持つ DataFrame
+             （fx_backtest.add_emas を通したもの。target_pos は slope_threshold ごとにここで作る）
+    params … sl_pips / slope_threshold / risk 列を持つ DataFrame（make_grid の戻り値など）
+
+    戻り値: (summary, trades)
+      summary … 組み合わせごとに1行（パラメータ + トレード数・勝率・最終残高・最大DD・PF）
+      trades  … 全組み合わせのトレードを1つにまとめたもの（combo 列 = params の行番号）
+                列は run_simulation_final の trade_df と同じ
+    """
+    params = pd.DataFrame(params).reset_index(drop=True)
+    sl = params['sl_pips'].to_numpy(dtype='float64')
+    thr = params['slope_threshold'].to_numpy(dtype='float64')
+    risk = params['risk'].to_numpy(dtype='float64')
+    n_combo = len(params)
+
+    times = df.index
+    closes = np.asarray(df['Close'])
+    highs = np.asarray(df['High'])
+    lows = np.asarray(df['Low'])
+    slopes = np.asarray(df['EMA_slope'])
+
+    # 傾き以外の条件（閾値によらない）は先に bool 配列にしておく
+    hour = times.hour
+    time_filter = np.asarray((hour >= start_hour) | (hour <= end_hour))
+    ema_short = np.asarray(df['EMA_short'])
+    ema_long = np.asarray(df['EMA_long'])
+    ema_trend = np.asarray(df['EMA_trend'])
+    buy_base = (ema_short > ema_long) & (closes > ema_trend) & time_filter
+    sell_base = (ema_short < ema_long) & (closes < ema_trend) & time_filter
+    may_enter = buy_base | sell_base
+
+    # 組み合わせごとの状態（長さ N）
+    balance = np.full(n_combo, cap, dtype='float64')
+    pos = np.zeros(n_combo, dtype='int8')
+    lot = np.zeros(n_combo, dtype='float64')
+    entry_price = np.zeros(n_combo, dtype='float64')
+    entry_bar = np.zeros(n_combo, dtype='int64')
+    sl_dist = sl * pips_unit
+    sl_loss = -(sl + spread_pips)
+    lot_denom = (sl + spread_pips) * pip_val_1lot
+
+    records = []   # 決済が起きた足ごとの配列（最後にまとめて DataFrame にする）
+    n_open = 0
+
+    for i in range(len(closes)):
+        if n_open == 0 and not may_enter[i]:
+            continue
+
+        alive = balance > 0
+        target = np.zeros(n_combo, dtype='int8')
+        if buy_base[i]:
+            target[slopes[i] > thr] = 1
+        elif sell_base[i]:
+            target[slopes[i] < -thr] = -1
+
+        # --- A. ポジション保有中の処理 ---
+        exited = np.zeros(n_combo, dtype=bool)
+        if n_open:
+            holding = alive & (pos != 0)
+            long_ = holding & (pos == 1)
+            short = holding & (pos == -1)
+            sl_price = np.where(long_, entry_price - sl_dist, entry_price + sl_dist)
+
+            # 1. 損切り(SL)判定 (最優先)
+            sl_hit = (long_ & (lows[i] <= sl_price)) | (short & (highs[i] >= sl_price))
+            # 2. シグナル反転判定 (SLがヒットしていない場合のみ)
+            rev = holding & ~sl_hit & (target != pos)
+            exited = sl_hit | rev
+
+            if exited.any():
+                k = np.flatnonzero(exited)
+                k_pos = pos[k]
+                exit_price = np.where(sl_hit[k], sl_price[k], closes[i])
+                raw_pips = (closes[i] - entry_price[k]) * k_pos / pips_unit
+                net_pips = np.where(sl_hit[k], sl_loss[k], raw_pips - spread_pips)
+                profit_yen = net_pips * pip_val_1lot * lot[k]
+                balance[k] += profit_yen
+
+                records.append((k, entry_bar[k], np.full(len(k), i), entry_price[k], exit_price,
+                                k_pos, net_pips, profit_yen, balance[k]))
+                pos[k] = 0
+                n_open -= len(k)
+
+        # --- B. 新規エントリー判定（決済した足では建てない） ---
+        enter = alive & ~exited & (pos == 0) & (target != 0)
+        if enter.any():
+            k = np.flatnonzero(enter)
+            new_lot = np.minimum(balance[k] * risk[k] / lot_denom[k], max_lot)
+            lot[k] = new_lot
+            k = k[new_lot > 0]
+            entry_price[k] = closes[i]
+            entry_bar[k] = i
+            pos[k] = target[k]
+            n_open += len(k)
+
+    trades = _trades_frame(records, times)
+    return _summarize(params, trades, cap), trades
+
+
+def _trades_frame(records, times):
+    if records:
+        combo, e_bar, x_bar, e_price, x_price, side, pips, yen, bal = (
+            np.concatenate(col) for col in zip(*records))
+    else:
+        # どの組み合わせもトレードしなかったときも、列の型はトレードがあるときと同じにする
+        # （object 型の空フレームだと _summarize の cummax が落ちる）
+        combo, e_bar, x_bar, side = (np.empty(0, dtype=np.int64) for _ in range(4))
+        e_price, x_price, pips, yen, bal = (np.empty(0) for _ in range(5))
+    # 組み合わせごとに決済順に並べる（同じ足の決済は combo 順なので安定ソートで十分）
+    order = np.argsort(combo, kind='stable')
+    return pd.DataFrame({
+        'combo': combo[order],
+        'entry_time': times[e_bar[order]],
+        'exit_time': times[x_bar[order]],
+        'entry_price': e_price[order],
+        'exit_price': x_price[order],
+        'side': np.where(side[order] == 1, 'BUY', 'SELL'),
+        'profit_pips': pips[order],
+        'profit_yen': yen[order],
+        'balance': bal[order],
+    })
+
+
+def _summarize(params, trades, cap):
+    """組み合わせごとの集計（トレードが無い組み合わせも 0 件として残す）"""
+    summary = params.copy()
+    g = trades.groupby('combo')
+    summary['trades'] = g.size().reindex(summary.index, fill_value=0)
+    wins = (trades['profit_pips'] > 0).groupby(trades['combo']).sum()
+    summary['win_rate'] = (wins.reindex(summary.index, fill_value=0) / summary['trades'].where(summary['trades'] > 0)) * 100
+    summary['final_balance'] = g['balance'].last().reindex(summary.index).fillna(cap)
+
+    # 最大ドローダウンは run_simulation_final の history（初期資金 + 決済ごとの残高）と同じ基準
+    peak = np.maximum(g['balance'].cummax(), cap)
+    summary['max_dd'] = (peak - trades['balance']).groupby(trades['combo']).max().reindex(summary.index, fill_value=0.0)
+
+    gross_win = trades['profit_yen'].clip(lower=0).groupby(trades['combo']).sum()
+    gross_loss = (-trades['profit_yen'].clip(upper=0)).groupby(trades['combo']).sum()
+    summary['profit_factor'] = (gross_win / gross_loss.where(gross_loss > 0)).reindex(summary.index)
+    return summary
+
+
+#=========================================================
+#grid_simulator.py（run_simulation_final のパラメータ総当たり）
+#=========================================================
+
+#使い方
+#from fx_backtest import add_emas
+#from grid_simulator import make_grid, run_simulation_grid
+#df = add_emas(load_ohlc_cached(path))
+#grid = make_grid(sl_pips=[5, 10, 15, 20], slope_threshold=[p * 0.01 for p in (1, 2, 3)], risk=[0.01, 0.02])
+#summary, trades = run_simulation_grid(df, grid, spread_pips=1.0, pips_unit=0.01,
+#                                      pip_val_1lot=1000, cap=100000, max_lot=100)
+#print(summary.sort_values('final_balance', ascending=False).head())
+
+#1つの組み合わせのトレード一覧 → trades[trades['combo'] == 3]
+#（fx_backtest.run_simulation_final でその組み合わせだけ回したものと同じ）
+
+#1,000 通りでも Python が回るのは足の本数だけなので、1回分の数倍の時間で終わる
+#メモリは組み合わせの数 × 数十 byte + 全トレード分
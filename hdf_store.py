@@ -0,0 +1,172 @@
+import re
+
+import pandas as pd
+
+from ohlc_loader import load_ohlc
+
+# ==========================================
+# 【HDF5 足データストア（PyTables）】
+# environment.yml の tables を使い、銘柄 × 時間足ごとに1テーブル、年ごとに分割して保存する
+#   /USDJPY/M15/y2023, /USDJPY/M15/y2024, /AAPL_O/D1/y2010 ...
+# - 新しいエクスポートは append で追記（既に入っている日時より後ろだけ）
+# - 日時（index列）にインデックスを張るので、期間指定の読み出しが速い
+# ==========================================
+
+
+def _node_name(name):
+    """'AAPL.O' や 'EUR=' のような記号入りの銘柄名をHDF5のノード名に使える形にする"""
+    node = re.sub(r'[^0-9A-Za-z_]', '_', str(name))
+    return node if node[:1].isalpha() else f's_{node}'
+
+
+class HDFBarStore:
+
+    def __init__(self, path, complevel=5, complib='blosc'):
+        self.path = path
+        self.complevel = complevel
+        self.complib = complib
+
+    def _open(self, mode='a'):
+        return pd.HDFStore(self.path, mode=mode, complevel=self.complevel, complib=self.complib)
+
+    @staticmethod
+    def key(symbol, timeframe, year):
+        return f'/{_node_name(symbol)}/{timeframe}/y{int(year)}'
+
+    def keys(self, symbol=None, timeframe=None):
+        prefix = '/'
+        if symbol is not None:
+            prefix += _node_name(symbol) + '/'
+            if timeframe is not None:
+                prefix += f'{timeframe}/'
+        with self._open('a') as store:
+            return sorted(k for k in store.keys() if k.startswith(prefix))
+
+    def years(self, symbol, timeframe):
+        return [int(k.rsplit('/y', 1)[1]) for k in self.keys(symbol, timeframe)]
+
+    # ---------- 書き込み ----------
+
+    def append(self, symbol, timeframe, df):
+        """
+        足データを年ごとのテーブルに追記する（追記専用）
+        各年のテーブルに既にある最終日時以下の行は捨てるので、同じエクスポートを何度入れても重複しない
+        戻り値: 追加した行数
+        """
+        if not isinstance(df.index, pd.DatetimeIndex):
+            raise TypeError('df の index は DatetimeIndex にしてください')
+
+        df = df[~df.index.duplicated(keep='last')].sort_index()
+        df = df.astype('float64')
+        # json から読んだ ms 単位などが混ざらないように ns にそろえる
+        df.index = df.index.astype('datetime64[ns]')
+        df.index.name = 'datetime'
+
+        added = 0
+        with self._open('a') as store:
+            for year, part in df.groupby(df.index.year):
+                key = self.key(symbol, timeframe, year)
+                if key in store:
+                    last = store.select_column(key, 'index', start=-1).iloc[0]
+                    part = part[part.index > last]
+                if part.empty:
+                    continue
+                store.append(key, part, format='table', index=False)
+                added += len(part)
+            # まとめて追記してから日時のインデックスを張り直す（1行ずつ張るより速い）
+            for key in store.keys():
+                if key.startswith(f'/{_node_name(symbol)}/{timeframe}/'):
+                    store.create_table_index(key, columns=['index'], optlevel=9, kind='full')
+        return added
+
+    def import_ohlc_csv(self, path, symbol, timeframe, **loader_kwargs):
+        """Forex Tester / MT4 のCSV（C:\\market_data\\*.csv）を取り込む"""
+        return self.append(symbol, timeframe, load_ohlc(path, **loader_kwargs))
+
+    def import_eod(self, data, timeframe='D1'):
+        """
+        data/aapl.csv のような「1列 = 1銘柄の終値」の横長データを銘柄ごとに取り込む
+        data: DataFrame / .csv / .json / .xlsx のパス（P50.py の書き出し形式）
+        """
+        if isinstance(data, str):
+            data = read_eod_export(data)
+        added = {}
+        for symbol in data.columns:
+            close = pd.to_numeric(data[symbol], errors='coerce').dropna()
+            added[symbol] = self.append(symbol, timeframe, close.to_frame('Close'))
+        return added
+
+    # ---------- 読み出し ----------
+
+    def select(self, symbol, timeframe, start=None, end=None, columns=None):
+        """期間 [start, end] の足を返す（対象の年のテーブルだけを開く）"""
+        start = None if start is None else pd.Timestamp(start)
+        end = None if end is None else pd.Timestamp(end)
+
+        where = []
+        if start is not None:
+            where.append(f'index >= {start!r}')
+        if end is not None:
+            where.append(f'index <= {end!r}')
+
+        parts = []
+        with self._open('a') as store:
+            for key in sorted(k for k in store.keys() if k.startswith(f'/{_node_name(symbol)}/{timeframe}/')):
+                year = int(key.rsplit('/y', 1)[1])
+                if (start is not None and year < start.year) or (end is not None and year > end.year):
+                    continue
+                parts.append(store.select(key, where=where or None, columns=columns))
+
+        if not parts:
+            raise KeyError(f'{symbol} {timeframe} の {start}〜{end} のデータはありません: {self.path}')
+        df = pd.concat(parts)
+        df.index.name = 'datetime'
+        return df
+
+    def load_data(self, symbol, timeframe, start=None, end=None):
+        """
+        load_data() と同じ形（index=datetime, 列=price の1列）で返す
+        そのまま generate_position() などに渡せる
+        """
+        data = self.select(symbol, timeframe, start, end, columns=['Close'])
+        return data.rename(columns={'Close': 'price'})
+
+
+def read_eod_export(path):
+    """P50.py が書き出した csv / json / xlsx を同じ形（DatetimeIndex × 銘柄列）で読む"""
+    ext = path.lower().rsplit('.', 1)[-1]
+    if ext == 'csv':
+        data = pd.read_csv(path, index_col=0, parse_dates=True)
+    elif ext == 'json':
+        data = pd.read_json(path)
+    elif ext in ('xlsx', 'xls'):
+        data = pd.read_excel(path, index_col=0, parse_dates=True)
+    else:
+        raise ValueError(f'対応していない形式です: {path}')
+    data.index = pd.to_datetime(data.index)
+    return data.sort_index()
+
+
+if __name__ == "__main__":
+    store = HDFBarStore(r'C:\market_data\bars.h5')
+
+    print(store.import_ohlc_csv(r'C:\market_data\USDJPY_M15.csv', 'USDJPY', 'M15'))
+    print(store.import_eod('data/aapl.csv'))
+
+    data = store.load_data('USDJPY', 'M15', '2024-01-01', '2024-06-30')
+    print(data.head())
+    print(store.keys('USDJPY'))
+
+
+#=========================================================
+#hdf_store.py（HDF5 に足データをまとめて保存）
+#=========================================================
+
+#使い方
+#store = HDFBarStore(r'C:\market_data\bars.h5')
+#store.import_ohlc_csv(r'C:\market_data\USDJPY_M15.csv', 'USDJPY', 'M15')  ← 新しいエクスポートもこれで追記
+#store.import_eod('data/aapl.json')                                          ← P50.py の書き出しも取り込める
+#data = store.load_data('USDJPY', 'M15', '2024-01-01', '2024-06-30')        ← load_data() と同じ形
+
+#年ごとに分かれているので、期間を指定すると必要な年のテーブルしか開かない
+#テーブルの中も日時にインデックスが張ってあるので、1年分を全部読むことはない
@@ -1,42 +1,22 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from bar_pyramid import BarPyramid
+from intrabar import IntrabarResolver
 
 # ==========================================
 # 1. CSV読み込み & DateTime生成
 # ==========================================
-file_path = r"C:\market_data\USDJPY_M5.csv"
-df = pd.read_csv(file_path)
-
-df = df.rename(columns={
-    "<OPEN>": "Open",
-    "<HIGH>": "High",
-    "<LOW>": "Low",
-    "<CLOSE>": "Close"
-})
-
-date = pd.to_datetime(df["<DTYYYYMMDD>"].astype(str))
-time_str = df["<TIME>"].astype(str).str.zfill(6)
-
-time = (
-    pd.to_timedelta(time_str.str[:2].astype(int), unit="h") +
-    pd.to_timedelta(time_str.str[2:4].astype(int), unit="m") +
-    pd.to_timedelta(time_str.str[4:6].astype(int), unit="s")
-)
-
-df["DateTime"] = date + time
-df = df.set_index("DateTime")
-df = df[["Open", "High", "Low", "Close"]]
+# 5分足も SL/TP の順番の確認も M1 から作る（M5 のCSVを渡すと足の中が1本しかなく、順番を確かめられない）
+file_path = r"C:\market_data\USDJPY_M1.csv"
+# <TIME> は HHMMSS の6桁（zfill(6) で読んでいた形式）
+pyramid = BarPyramid(file_path, time_format="HHMMSS")
 
 # ==========================================
 # 2. 5分足作成
 # ==========================================
-df_5m = df.resample("5min").agg({
-    "Open": "first",
-    "High": "max",
-    "Low": "min",
-    "Close": "last"
-}).dropna()
+# 毎回 resample せず、M1キャッシュの隣に M1 から作っておいた5分足を開く（CSVが増えたら追加分だけ更新）
+df_5m = pyramid.get("M5")
 
 # ==========================================
 # 3. EMA & トレンド判定
@@ -88,6 +68,9 @@ pip_size = 0.01
 position = None
 trades = []
 
+# 同じ足で SL と TP の両方に触れたら、M1キャッシュのその足の中だけを見てどちらが先か決める
+resolver = IntrabarResolver.from_pyramid(pyramid, "M5")
+
 rows = list(df_5m.itertuples())
 
 for i in range(len(rows) - 1):
@@ -106,7 +89,11 @@ for i in range(len(rows) - 1):
             continue
 
     if position is not None:
-        if next_row.Low <= position["stop"]:
+        sl_hit = next_row.Low <= position["stop"]
+        if sl_hit and next_row.High >= position["tp"]:
+            sl_hit = resolver.resolve(next_row.Index, 1, position["stop"], position["tp"]) == "SL"
+
+        if sl_hit:
             result = "SL"
             r = -1
         elif next_row.High >= position["tp"]:
@@ -130,6 +117,7 @@ for i in range(len(rows) - 1):
 df_trades = pd.DataFrame(trades)
 
 print("トレード数:", len(df_trades))
+print("M1 で SL/TP の順番を確かめた足:", resolver.report())
 
 if not df_trades.empty:
     print(df_trades["result"].value_counts())
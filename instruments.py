@@ -0,0 +1,164 @@
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 【銘柄情報レジストリ】
+# 通貨ペアごとの pips の単位・1ロットの通貨量・決済通貨・標準的なスプレッドを1か所にまとめる
+# 「最初の終値が50未満ならドルストレート」のような推測をやめて、銘柄名から引く
+# 表記ゆれ（usd_jpy, USD/JPY, USDJPY.m など）は normalize_symbol でそろえてから引く
+# ==========================================
+
+# pip_size: 1pip の価格幅 / contract_size: 1ロットの通貨量 / quote: 決済通貨 / spread_pips: 標準的なスプレッド
+INSTRUMENTS = {
+    'USDJPY': {'pip_size': 0.01, 'contract_size': 100000, 'quote': 'JPY', 'spread_pips': 0.2},
+    'EURJPY': {'pip_size': 0.01, 'contract_size': 100000, 'quote': 'JPY', 'spread_pips': 0.4},
+    'GBPJPY': {'pip_size': 0.01, 'contract_size': 100000, 'quote': 'JPY', 'spread_pips': 0.9},
+    'AUDJPY': {'pip_size': 0.01, 'contract_size': 100000, 'quote': 'JPY', 'spread_pips': 0.5},
+    'NZDJPY': {'pip_size': 0.01, 'contract_size': 100000, 'quote': 'JPY', 'spread_pips': 0.8},
+    'CADJPY': {'pip_size': 0.01, 'contract_size': 100000, 'quote': 'JPY', 'spread_pips': 1.2},
+    'CHFJPY': {'pip_size': 0.01, 'contract_size': 100000, 'quote': 'JPY', 'spread_pips': 1.5},
+    'EURUSD': {'pip_size': 0.0001, 'contract_size': 100000, 'quote': 'USD', 'spread_pips': 0.2},
+    'GBPUSD': {'pip_size': 0.0001, 'contract_size': 100000, 'quote': 'USD', 'spread_pips': 0.6},
+    'AUDUSD': {'pip_size': 0.0001, 'contract_size': 100000, 'quote': 'USD', 'spread_pips': 0.4},
+    'NZDUSD': {'pip_size': 0.0001, 'contract_size': 100000, 'quote': 'USD', 'spread_pips': 0.8},
+    'USDCHF': {'pip_size': 0.0001, 'contract_size': 100000, 'quote': 'CHF', 'spread_pips': 0.8},
+    'USDCAD': {'pip_size': 0.0001, 'contract_size': 100000, 'quote': 'CAD', 'spread_pips': 0.8},
+    'EURGBP': {'pip_size': 0.0001, 'contract_size': 100000, 'quote': 'GBP', 'spread_pips': 0.8},
+    'XAUUSD': {'pip_size': 0.1, 'contract_size': 100, 'quote': 'USD', 'spread_pips': 3.0},
+}
+
+# 決済通貨 → 円 の換算レート（pip の円価値を出すための想定値。スクリプトの「10ドル×150円想定」と同じ考え方）
+QUOTE_TO_JPY = {'JPY': 1.0, 'USD': 150.0, 'EUR': 160.0, 'GBP': 190.0, 'CHF': 170.0, 'CAD': 110.0}
+
+# 記号を取っただけでは同じにならない別名
+ALIASES = {
+    'GOLD': 'XAUUSD',
+    'DOLLARYEN': 'USDJPY',
+}
+
+# ブローカーが付ける末尾の記号（USDJPY.m / USDJPYpro / USDJPY# など）
+_BROKER_SUFFIX = re.compile(r'(MICRO|MINI|PRO|ECN|RAW|M|I|C)$')
+
+
+@lru_cache(maxsize=None)
+def normalize_symbol(symbol):
+    """'usd_jpy' / 'USD/JPY' / 'USDJPY.m' / 'USDJPY_M5' → 'USDJPY'（分からなければ記号を取って大文字にしただけ）"""
+    text = str(symbol).upper()
+    # ファイル名の '_M5' '_H1' のような時間足は外す
+    text = re.sub(r'[_\-. ](M|H|D|W|MN)\d*$', '', text)
+    key = re.sub(r'[^0-9A-Z]', '', text)
+    if key in INSTRUMENTS:
+        return key
+    if key in ALIASES:
+        return ALIASES[key]
+    stripped = _BROKER_SUFFIX.sub('', key)
+    if stripped in INSTRUMENTS:
+        return stripped
+    return ALIASES.get(stripped, key)
+
+
+def symbol_from_path(path):
+    """C:\\market_data\\USDJPY_M5.csv → 'USDJPY'"""
+    name = re.split(r'[\\/]', str(path))[-1]
+    return normalize_symbol(os.path.splitext(name)[0])
+
+
+def get_instrument(symbol):
+    """
+    銘柄情報を返す（表記ゆれはそろえてから引く）
+    pip_value_jpy: 1ロットで1pip動いたときの円価値（pip_size × contract_size × 決済通貨の円換算）
+    """
+    # キャッシュの dict を書き換えられないようにコピーを返す
+    return dict(_lookup(normalize_symbol(symbol)))
+
+
+@lru_cache(maxsize=None)
+def _lookup(key):
+    if key not in INSTRUMENTS:
+        raise KeyError(f'{key} は instruments.py の INSTRUMENTS にありません')
+    info = dict(INSTRUMENTS[key])
+    info['symbol'] = key
+    info['pip_value_jpy'] = info['pip_size'] * info['contract_size'] * QUOTE_TO_JPY[info['quote']]
+    if info['quote'] == 'JPY':
+        kind = '円ペア'
+    elif 'USD' in (key[:3], info['quote']):
+        kind = 'ドルストレート'
+    else:
+        kind = 'クロス'
+    info['label'] = f'{key} ({kind})'
+    return info
+
+
+def instrument_for_path(path):
+    """CSVのファイル名から銘柄情報を引く"""
+    return get_instrument(symbol_from_path(path))
+
+
+def normalize_symbols(values):
+    """
+    symbol 列をまとめて正規化する（Categorical で返す）
+    行ごとに str.replace せず、種類（カテゴリ）ごとに1回だけ normalize_symbol を呼ぶ
+    """
+    cat = pd.Categorical(values)
+    mapped = [normalize_symbol(c) for c in cat.categories]
+    new_categories = pd.Index(sorted(set(mapped)))  # 並べ替えが銘柄名の順になるようにする
+    codes = new_categories.get_indexer(mapped)
+    # 元のコード → 正規化後のコード（欠損 -1 はそのまま）
+    new_codes = np.where(cat.codes >= 0, codes[cat.codes], -1)
+    result = pd.Categorical.from_codes(new_codes, categories=new_categories)
+    if isinstance(values, pd.Series):
+        return pd.Series(result, index=values.index, name=values.name)
+    return result
+
+
+def instrument_table(symbols=None):
+    """銘柄情報の表（index=銘柄）。複数ペアをまとめて回すときに merge / map して使う"""
+    symbols = list(INSTRUMENTS) if symbols is None else [normalize_symbol(s) for s in symbols]
+    return pd.DataFrame([get_instrument(s) for s in dict.fromkeys(symbols)]).set_index('symbol')
+
+
+def attach_instrument_info(df, col='symbol', fields=('pip_size', 'pip_value_jpy', 'spread_pips')):
+    """
+    df[col] を正規化して、銘柄情報の列（pip_size など）を付ける
+    銘柄の種類ごとに1回しか引かないので、数百万行でも速い
+    """
+    df[col] = normalize_symbols(df[col])
+    # INSTRUMENTS にない銘柄は NaN
+    known = [c for c in df[col].cat.categories if c in INSTRUMENTS]
+    table = instrument_table(known) if known else pd.DataFrame(columns=list(fields), dtype='float64')
+    table = table.reindex(df[col].cat.categories)
+    codes = df[col].cat.codes.to_numpy()
+    for field in fields:
+        values = table[field].to_numpy(dtype='float64')
+        df[field] = np.where(codes >= 0, values[codes], np.nan)
+    return df
+
+
+if __name__ == "__main__":
+    for path in [r'C:\market_data\USDJPY_M5.csv', r'C:\market_data\EURUSD_M5.csv', r'C:\market_data\GBPUSD_M5.csv']:
+        info = instrument_for_path(path)
+        print(info['label'], info['pip_size'], info['pip_value_jpy'])
+
+    df = pd.DataFrame({'symbol': ['USDJPY', 'usd_jpy', 'USD/JPY', 'eur_usd', 'GBPJPY', 'USDJPY.m']})
+    print(attach_instrument_info(df))
+
+
+#=========================================================
+#instruments.py（通貨ペアの情報を1か所で管理）
+#=========================================================
+
+#使い方
+#from instruments import instrument_for_path
+#inst = instrument_for_path(r'C:\market_data\GBPUSD_M5.csv')
+#PIPS_UNIT = inst['pip_size']          ← 0.0001
+#PIP_VALUE_JPY = inst['pip_value_jpy'] ← 決済通貨がUSDなので 10ドル × 150円 = 1500円
+
+#表記ゆれのある symbol 列は
+#df['symbol'] = normalize_symbols(df['symbol'])   ← Categorical になる（種類の数だけしか文字列処理しない）
+
+#新しい銘柄を使うときは INSTRUMENTS に1行足す
+#円換算レートは QUOTE_TO_JPY の想定値（必要なら書き換える）
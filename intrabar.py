@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+
+from bar_cache import cache_dir_for, ingest_csv, is_cache_valid, load_cache_arrays
+
+# ==========================================
+# 【1本の足で SL と TP の両方に触れたときの「どちらが先か」を M1 で決める】
+# run_backtest（forex-tester5min.py / exit_engine）も high1entry-test.py も、
+# M5/M15 の足が SL と TP の両方に触れていると「SLが先」とみなしている（安全側だが勝ちを取りこぼす）
+# ここでは、その足の時間帯の M1 だけを M1 キャッシュ（.npy のメモリマップ）から二分探索で切り出し、
+# 先に触れたのがどちらかを確かめる
+#   - M1 キャッシュは最初に迷った足が出てきたときに初めて開く（迷う足がなければ読まない）
+#   - 読むのは迷った足の中の数本だけ（全期間を M1 で回すわけではない）
+#   - 同じ M1 の足で両方に触れている / M1 が無い ときは今まで通り SL
+# ==========================================
+
+NS_PER_MINUTE = 60 * 1_000_000_000
+
+
+class IntrabarResolver:
+    """
+    bar_minutes 分足の「SL と TP の両方に触れた足」を M1 で解決する
+    opener … (times[int64 ns], ohlc[n×4]) を返す関数（初めて必要になったときに1回だけ呼ぶ）
+
+    res = IntrabarResolver.from_csv(r'C:\\market_data\\USDJPY_M1.csv', bar_minutes=5, time_format='HHMMSS')
+    trade_df, history = run_backtest_vectorized(df, 0.01, 1000, resolver=res)
+    print(res.report())
+    """
+
+    def __init__(self, opener, bar_minutes):
+        self.opener = opener
+        self.bar_minutes = bar_minutes
+        self.times = None
+        self.ohlc = None
+        self.counts = {'ambiguous': 0, 'tp_first': 0, 'sl_first': 0, 'same_m1': 0, 'no_m1': 0}
+
+    @classmethod
+    def from_arrays(cls, times, ohlc, bar_minutes):
+        """読み込み済みの M1（times: int64 ns, ohlc: n×4）から作る"""
+        return cls(lambda: (times, ohlc), bar_minutes)
+
+    @classmethod
+    def from_csv(cls, m1_path, bar_minutes, cache_root=None, **loader_kwargs):
+        """M1 の CSV から作る（bar_cache のキャッシュをメモリマップで開く。無ければその時に作る）"""
+        def opener():
+            cache_dir = cache_dir_for(m1_path, cache_root)
+            if not is_cache_valid(m1_path, cache_dir, loader_kwargs):
+                ingest_csv(m1_path, cache_root, **loader_kwargs)
+            return load_cache_arrays(cache_dir, mmap=True)
+        return cls(opener, bar_minutes)
+
+    @classmethod
+    def from_pyramid(cls, pyramid, timeframe):
+        """BarPyramid の M1 キャッシュを使う（timeframe は回している時間足 'M5' など）"""
+        return cls.from_csv(pyramid.m1_path, pyramid.timeframes[timeframe],
+                            pyramid.cache_root, **pyramid.loader_kwargs)
+
+    def _m1_window(self, bar_time):
+        if self.times is None:
+            self.times, self.ohlc = self.opener()
+        t0 = pd.Timestamp(bar_time).value
+        t1 = t0 + self.bar_minutes * NS_PER_MINUTE
+        i0, i1 = np.searchsorted(self.times, [t0, t1], side='left')
+        return np.asarray(self.ohlc[i0:i1])
+
+    def resolve(self, bar_time, side, sl_price, tp_price):
+        """
+        bar_time の足で先に触れたのが SL か TP か（'SL' / 'TP'）
+        side … 1 = 買い（安値で SL・高値で TP）、-1 = 売り（高値で SL・安値で TP）
+        """
+        self.counts['ambiguous'] += 1
+        m1 = self._m1_window(bar_time)
+        if side == 1:
+            sl_touch = m1[:, 2] <= sl_price
+            tp_touch = m1[:, 1] >= tp_price
+        else:
+            sl_touch = m1[:, 1] >= sl_price
+            tp_touch = m1[:, 2] <= tp_price
+
+        # 触れた最初の M1 の位置（触れていなければ len(m1)）
+        n = len(m1)
+        sl_at = int(np.argmax(sl_touch)) if sl_touch.any() else n
+        tp_at = int(np.argmax(tp_touch)) if tp_touch.any() else n
+        if tp_at < sl_at:
+            self.counts['tp_first'] += 1
+            return 'TP'
+        if sl_at < tp_at:
+            self.counts['sl_first'] += 1
+        elif sl_at < n:
+            self.counts['same_m1'] += 1
+        else:
+            # M1 が無い・上位足と食い違っている
+            self.counts['no_m1'] += 1
+        return 'SL'
+
+    def report(self):
+        """
+        迷った足の数と内訳
+          ambiguous … SL と TP の両方に触れていて M1 を見た足
+          tp_first / sl_first … M1 で TP / SL が先とわかった足
+          same_m1 … M1 でも同じ足で両方に触れていた（SL のまま）
+          no_m1 … M1 が無く解決できなかった（SL のまま）
+        """
+        return dict(self.counts)
+
+
+#=========================================================
+#intrabar.py（SL と TP の両方に触れた足を M1 で解決する）
+#=========================================================
+
+#使い方
+#from intrabar import IntrabarResolver
+#res = IntrabarResolver.from_csv(r'C:\market_data\USDJPY_M1.csv', bar_minutes=5, time_format='HHMMSS')
+#trade_df, history = run_backtest_vectorized(df, 0.01, 1000, resolver=res)   ← fx_backtest.run_backtest も同じ
+#print(res.report())
+#→ {'ambiguous': 37, 'tp_first': 12, 'sl_first': 22, 'same_m1': 3, 'no_m1': 0}
+
+#BarPyramid で M5 を作っているなら、同じ M1 キャッシュをそのまま使える
+#res = IntrabarResolver.from_pyramid(pyramid, 'M5')
+
+#resolver を渡さなければ今まで通り（両方に触れたら SL）
+#USDJPY,EURUSD,GBPUSD_M5.py の run_simulation_final は TP が無く、反転は終値なので迷う足はない
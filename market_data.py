@@ -0,0 +1,266 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+# ==========================================
+# 【市場データの取得レイヤー（ローカルキャッシュ付き）】
+# データ元（yfinance / URLのCSV / ローカルフォルダ）を差し替えられるようにして、
+# 取ってきたデータは銘柄ごとにキャッシュへ保存する
+#   - 2回目以降は、キャッシュにない日付の範囲だけを取りに行く（全部あればネットに繋がない）
+#   - 複数銘柄は「足りない範囲」が同じものをまとめて1回で取る
+# ==========================================
+
+DEFAULT_CACHE_DIR = os.path.join('data', '_market_cache')
+COVERAGE_FILE = 'coverage.json'
+
+
+def _day(value):
+    return pd.Timestamp(value).normalize()
+
+
+# ------------------------------------------
+# データ元
+# fetch(tickers, start, end) → {ticker: DataFrame(index=日付)} を返せば何でも差し込める
+# start / end は両端を含む日付
+# ------------------------------------------
+
+class YFinanceSource:
+    """Yahoo!ファイナンス（yf.download を複数銘柄まとめて1回呼ぶ）"""
+
+    name = 'yfinance'
+
+    def __init__(self, auto_adjust=False):
+        self.auto_adjust = auto_adjust
+
+    def fetch(self, tickers, start, end):
+        import yfinance as yf
+
+        # yf.download の end は「その日を含まない」ので1日足す
+        raw = yf.download(list(tickers), start=start.strftime('%Y-%m-%d'),
+                          end=(end + pd.Timedelta(days=1)).strftime('%Y-%m-%d'),
+                          group_by='ticker', auto_adjust=self.auto_adjust, progress=False)
+        frames = {}
+        for ticker in tickers:
+            if isinstance(raw.columns, pd.MultiIndex):
+                if ticker not in raw.columns.get_level_values(0):
+                    continue
+                df = raw[ticker]
+            else:
+                df = raw
+            frames[ticker] = df.dropna(how='all')
+        return frames
+
+
+class URLCSVSource:
+    """
+    1列 = 1銘柄の横長CSVをURLから読む（pyalgo_eikon_eod_data.csv など）
+    期間を指定して取れないので、1回ダウンロードしたら全銘柄・全期間をキャッシュする
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.name = 'url_' + hashlib.sha1(url.encode('utf-8')).hexdigest()[:10]
+
+    def read_all(self):
+        return pd.read_csv(self.url, index_col=0, parse_dates=True)
+
+    def fetch(self, tickers, start, end):
+        data = self.read_all()
+        tickers = list(data.columns) if tickers is None else tickers
+        return {t: data[[t]].rename(columns={t: 'Close'}).dropna() for t in tickers if t in data.columns}
+
+
+class LocalDirSource:
+    """
+    ローカルフォルダの <ticker>.csv（index=日付）を読む
+    ネットに繋がずにテストするとき、yfinance の代わりに使う
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.name = 'local_' + hashlib.sha1(os.path.abspath(root).encode('utf-8')).hexdigest()[:10]
+
+    def fetch(self, tickers, start, end):
+        frames = {}
+        for ticker in tickers:
+            path = os.path.join(self.root, f'{ticker}.csv')
+            if not os.path.exists(path):
+                continue
+            df = pd.read_csv(path, index_col=0, parse_dates=True).sort_index()
+            frames[ticker] = df.loc[start:end + pd.Timedelta(days=1) - pd.Timedelta(1)]
+        return frames
+
+
+# ------------------------------------------
+# キャッシュ付きの取得
+# ------------------------------------------
+
+class MarketData:
+    """
+    md = MarketData(YFinanceSource())
+    close = md.get(['AAPL', 'MSFT'], '2010-01-01', '2020-12-31')   ← 列=銘柄 の終値
+
+    キャッシュ: <cache_dir>/<データ元>/<ticker>.pkl と coverage.json（銘柄ごとに取得済みの期間）
+    """
+
+    def __init__(self, source, cache_dir=DEFAULT_CACHE_DIR):
+        self.source = source
+        self.dir = os.path.join(cache_dir, source.name)
+        os.makedirs(self.dir, exist_ok=True)
+        self.fetch_count = 0  # データ元に問い合わせた回数（キャッシュが効いているかの確認用）
+
+    # ---------- キャッシュ ----------
+
+    def _coverage_path(self):
+        return os.path.join(self.dir, COVERAGE_FILE)
+
+    def _read_coverage(self):
+        if not os.path.exists(self._coverage_path()):
+            return {}
+        with open(self._coverage_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_coverage(self, coverage):
+        with open(self._coverage_path(), 'w', encoding='utf-8') as f:
+            json.dump(coverage, f, ensure_ascii=False, indent=1)
+
+    def _frame_path(self, ticker):
+        safe = ''.join(ch if ch.isalnum() or ch in '-_' else '_' for ch in ticker)
+        return os.path.join(self.dir, f'{safe}.pkl')
+
+    def cached(self, ticker):
+        path = self._frame_path(ticker)
+        return pd.read_pickle(path) if os.path.exists(path) else None
+
+    def tickers(self):
+        return sorted(self._read_coverage())
+
+    # ---------- 足りない範囲の計算 ----------
+
+    @staticmethod
+    def missing_ranges(covered, start, end):
+        """
+        取得済み [cs, ce] に対して、[start, end] を満たすために取りに行く範囲のリスト
+        取得済みの範囲が1本につながるように、間が空く場合はその間も取る
+        """
+        if covered is None:
+            return [(start, end)]
+        cs, ce = _day(covered[0]), _day(covered[1])
+        ranges = []
+        if start < cs:
+            ranges.append((start, cs - pd.Timedelta(days=1)))
+        if end > ce:
+            ranges.append((ce + pd.Timedelta(days=1), end))
+        return ranges
+
+    def _store(self, coverage, ticker, frame, start, end):
+        old = self.cached(ticker)
+        if old is not None and frame is not None and len(frame):
+            frame = pd.concat([old, frame])
+            frame = frame[~frame.index.duplicated(keep='last')].sort_index()
+        elif frame is None or not len(frame):
+            frame = old
+        if frame is not None:
+            frame.to_pickle(self._frame_path(ticker))
+
+        # 今日の分はまだ確定していないので、取得済みは昨日までにしておく（次回また取りに行く）
+        end = min(end, _day('today') - pd.Timedelta(days=1))
+        if ticker in coverage:
+            start = min(start, _day(coverage[ticker][0]))
+            end = max(end, _day(coverage[ticker][1]))
+        if start <= end:
+            coverage[ticker] = [start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')]
+
+    def update(self, tickers, start, end):
+        """
+        キャッシュに足りない範囲だけをデータ元から取る
+        足りない範囲が同じ銘柄どうしは1回の fetch にまとめる
+        戻り値: fetch した回数
+        """
+        start, end = _day(start), _day(end)
+        coverage = self._read_coverage()
+
+        batches = {}
+        for ticker in tickers:
+            for rng in self.missing_ranges(coverage.get(ticker), start, end):
+                batches.setdefault(rng, []).append(ticker)
+
+        for (s, e), group in batches.items():
+            frames = self.source.fetch(group, s, e)
+            self.fetch_count += 1
+            for ticker in group:
+                self._store(coverage, ticker, frames.get(ticker), s, e)
+            # 1回ごとに保存しておけば、途中で止まっても取った分は無駄にならない
+            self._write_coverage(coverage)
+        return len(batches)
+
+    def get_frames(self, tickers, start, end):
+        """{ticker: DataFrame}（データ元の列のまま。期間 [start, end]）"""
+        if isinstance(tickers, str):
+            tickers = [tickers]
+        self.update(tickers, start, end)
+        start, end = _day(start), _day(end)
+        frames = {}
+        for ticker in tickers:
+            df = self.cached(ticker)
+            if df is not None:
+                frames[ticker] = df.loc[start:end + pd.Timedelta(days=1) - pd.Timedelta(1)]
+        return frames
+
+    def get(self, tickers, start, end, field='Close'):
+        """列=銘柄 の横長DataFrame（本の eikon データと同じ形）"""
+        frames = self.get_frames(tickers, start, end)
+        data = pd.DataFrame({t: df[field] for t, df in frames.items() if field in df.columns})
+        data.index.name = 'Date'
+        return data
+
+
+def load_url_csv(url, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    pd.read_csv(url, index_col=0, parse_dates=True) のキャッシュ版
+    1回目だけダウンロードして、2回目以降はキャッシュから同じ横長DataFrameを返す
+    """
+    source = URLCSVSource(url)
+    md = MarketData(source, cache_dir)
+    # coverage.json は元のCSVの列の順番で書いてあるので、その順で並べ直す
+    tickers = list(md._read_coverage())
+    if not tickers:
+        data = source.read_all()
+        md.fetch_count += 1
+        coverage = {}
+        start, end = _day(data.index.min()), _day(data.index.max())
+        for ticker in data.columns:
+            md._store(coverage, ticker, data[[ticker]].rename(columns={ticker: 'Close'}).dropna(), start, end)
+        md._write_coverage(coverage)
+        return data
+    return pd.DataFrame({t: md.cached(t)['Close'] for t in tickers})
+
+
+if __name__ == "__main__":
+    md = MarketData(YFinanceSource())
+    close = md.get(['AAPL', 'MSFT', 'SPY'], '2010-01-01', '2020-12-31')
+    print(close.tail())
+    print('問い合わせ回数:', md.fetch_count)
+
+    # もう一度呼ぶとキャッシュだけで済む（問い合わせ回数は増えない）
+    close = md.get(['AAPL', 'MSFT', 'SPY'], '2012-01-01', '2015-12-31')
+    print('問い合わせ回数:', md.fetch_count)
+
+
+#=========================================================
+#market_data.py（データ取得をキャッシュしてネットに繋ぐ回数を減らす）
+#=========================================================
+
+#使い方
+#from market_data import MarketData, YFinanceSource, LocalDirSource, load_url_csv
+#md = MarketData(YFinanceSource())
+#close = md.get(['AAPL', 'MSFT'], '2010-01-01', '2020-12-31')     ← 列=銘柄 の終値
+#frames = md.get_frames('AAPL', '2010-01-01', '2020-12-31')       ← OHLCV のまま
+
+#data = load_url_csv('https://hilpisch.com/pyalgo_eikon_eod_data.csv')  ← 2回目からはダウンロードしない
+
+#ネットに繋がない環境では LocalDirSource('data/offline') に <ticker>.csv を置いておけば同じように動く
+#期間を広げたときは、足りない前後の期間だけを取りに行く
+#キャッシュを捨てたいときは data/_market_cache フォルダごと消してOK
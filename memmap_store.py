@@ -0,0 +1,204 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from ohlc_loader import OHLC_COLUMNS, load_ohlc
+
+# ==========================================
+# 【メモリマップ式 OHLC ストア】
+# 銘柄ごとに 日時 / Open / High / Low / Close を1本ずつの連続したバイナリ配列で保存し、
+# 期間を指定して「その範囲だけ」をコピーなしで取り出す
+# 10年分のM1でも、実際にメモリに載るのは触った範囲だけになる
+# ==========================================
+
+META_FILE = 'meta.json'
+TIME_COLUMN = 'datetime'
+
+# 保存する列とdtype（日時は int64 のナノ秒）
+STORE_DTYPES = {TIME_COLUMN: 'int64', 'Open': 'float64', 'High': 'float64', 'Low': 'float64', 'Close': 'float64'}
+
+
+class BarWindow:
+    """
+    ストアから切り出した期間（コピーなしのビュー）
+    run_backtest / run_simulation_final に DataFrame の代わりにそのまま渡せる:
+      - len(window), window.index
+      - window['Close'] → numpy配列（メモリマップのビュー）
+      - window['signal'] = ... で計算列を追加（追加列は切り出した範囲の長さだけ）
+    """
+
+    def __init__(self, times, columns):
+        self._times = times
+        self._columns = dict(columns)
+
+    def __len__(self):
+        return len(self._times)
+
+    def __getitem__(self, name):
+        return self._columns[name]
+
+    def __setitem__(self, name, values):
+        values = np.asarray(values)
+        if len(values) != len(self):
+            raise ValueError(f"列 '{name}' の長さ {len(values)} が期間の本数 {len(self)} と一致しません")
+        self._columns[name] = values
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    @property
+    def times(self):
+        """日時（int64 ナノ秒）のビュー"""
+        return self._times
+
+    @property
+    def index(self):
+        return pd.DatetimeIndex(np.asarray(self._times).view('datetime64[ns]'), name=TIME_COLUMN)
+
+    def to_frame(self, columns=None):
+        """pandasで指標を計算したいとき用（この期間だけをDataFrameにする）"""
+        columns = columns or self.columns
+        return pd.DataFrame({c: self._columns[c] for c in columns}, index=self.index)
+
+
+class MemmapBarStore:
+    """
+    root/
+      USDJPY_M1/
+        meta.json       … 本数・列・dtype
+        datetime.bin    … int64 ナノ秒
+        Open.bin ...    … float64
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    # ---------- 保存 ----------
+
+    def symbol_dir(self, symbol):
+        return os.path.join(self.root, symbol)
+
+    def symbols(self):
+        return sorted(
+            name for name in os.listdir(self.root)
+            if os.path.exists(os.path.join(self.root, name, META_FILE))
+        )
+
+    def read_meta(self, symbol):
+        path = os.path.join(self.symbol_dir(symbol), META_FILE)
+        if not os.path.exists(path):
+            raise KeyError(f'{symbol} はストアにありません: {self.root}')
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_meta(self, symbol, meta):
+        path = os.path.join(self.symbol_dir(symbol), META_FILE)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=1)
+
+    def write(self, symbol, df):
+        """DataFrame（DatetimeIndex + OHLC）で銘柄を丸ごと書き直す"""
+        sdir = self.symbol_dir(symbol)
+        os.makedirs(sdir, exist_ok=True)
+        for name in STORE_DTYPES:
+            open(os.path.join(sdir, f'{name}.bin'), 'wb').close()
+        self._write_meta(symbol, {'rows': 0, 'dtypes': STORE_DTYPES})
+        self.append(symbol, df)
+
+    def append(self, symbol, df):
+        """
+        末尾に足を追加する（既存の最終時刻より新しい行だけ）
+        ファイルに追記してから meta.json の本数を更新するので、途中で落ちても既存分は壊れない
+        """
+        meta = self.read_meta(symbol)
+        times = df.index.to_numpy(dtype='datetime64[ns]').view('int64')
+
+        if meta['rows'] > 0:
+            last = self._open(symbol, TIME_COLUMN, meta['rows'])[-1]
+            keep = times > last
+            df, times = df[keep], times[keep]
+        if len(times) == 0:
+            return 0
+        if np.any(np.diff(times) <= 0):
+            raise ValueError('日時が昇順になっていません（重複・逆順があります）')
+
+        sdir = self.symbol_dir(symbol)
+        arrays = {TIME_COLUMN: times}
+        arrays.update({c: df[c].to_numpy() for c in OHLC_COLUMNS})
+        for name, dtype in STORE_DTYPES.items():
+            with open(os.path.join(sdir, f'{name}.bin'), 'ab') as f:
+                f.write(np.ascontiguousarray(arrays[name], dtype=dtype).tobytes())
+
+        meta['rows'] += len(times)
+        self._write_meta(symbol, meta)
+        return len(times)
+
+    def import_csv(self, symbol, path, **loader_kwargs):
+        """Forex Tester / MT4 のCSVを読み込んでストアに書き込む"""
+        df = load_ohlc(path, **loader_kwargs)
+        df = df[~df.index.duplicated(keep='last')].sort_index()
+        self.write(symbol, df)
+        return len(df)
+
+    # ---------- 読み出し ----------
+
+    def _open(self, symbol, name, rows):
+        path = os.path.join(self.symbol_dir(symbol), f'{name}.bin')
+        if rows == 0:
+            return np.empty(0, dtype=STORE_DTYPES[name])
+        return np.memmap(path, dtype=STORE_DTYPES[name], mode='r', shape=(rows,))
+
+    def arrays(self, symbol):
+        """全期間のメモリマップ（この時点ではディスクから読まない）"""
+        rows = self.read_meta(symbol)['rows']
+        return {name: self._open(symbol, name, rows) for name in STORE_DTYPES}
+
+    def locate(self, symbol, start=None, end=None):
+        """期間 [start, end] に入る行番号の範囲 (i0, i1) を二分探索で求める"""
+        times = self.arrays(symbol)[TIME_COLUMN]
+        i0 = 0 if start is None else int(np.searchsorted(times, pd.Timestamp(start).value, side='left'))
+        i1 = len(times) if end is None else int(np.searchsorted(times, pd.Timestamp(end).value, side='right'))
+        return i0, i1
+
+    def bars(self, symbol, start=None, end=None):
+        """
+        期間を指定して切り出す（end は含む。pandas の df.loc[start:end] と同じ）
+        返り値はメモリマップのビューなので、全期間をメモリに読み込まない
+        """
+        arrays = self.arrays(symbol)
+        i0, i1 = self.locate(symbol, start, end)
+        columns = {c: arrays[c][i0:i1] for c in OHLC_COLUMNS}
+        return BarWindow(arrays[TIME_COLUMN][i0:i1], columns)
+
+
+if __name__ == "__main__":
+    store = MemmapBarStore(r'C:\market_data\_memmap_store')
+
+    if 'USDJPY_M1' not in store.symbols():
+        store.import_csv('USDJPY_M1', r'C:\market_data\USDJPY_M1.csv', time_format='HHMMSS')
+
+    window = store.bars('USDJPY_M1', '2024-01-01', '2024-03-31')
+    print(len(window), window.index[0], window.index[-1])
+    print(window.to_frame().head())
+
+
+#=========================================================
+#memmap_store.py（10年分のM1を扱うためのストア）
+#=========================================================
+
+#使い方
+#store = MemmapBarStore(r'C:\market_data\_memmap_store')
+#store.import_csv('USDJPY_M1', r'C:\market_data\USDJPY_M1.csv', time_format='HHMMSS')  ← 最初の1回だけ
+#window = store.bars('USDJPY_M1', '2024-01-01', '2024-03-31')
+
+#window['Close'] は numpy配列（ディスク上のファイルのビュー）
+#指標は window['ATR'] = ... のように足していけば、その期間の長さ分しかメモリを使わない
+#run_backtest(window) / run_simulation_final(window, ...) にそのまま渡せる
+#pandas で計算したいときは window.to_frame() でその期間だけDataFrameにする
@@ -0,0 +1,189 @@
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 【トレード順のモンテカルロ（最大DD・破産確率の分布）】
+# show_report（forex-tester5min.py）や print_final_report（USDJPY,EURUSD,GBPUSD_M5.py）の
+# 最大ドローダウン・SQN は「実際に起きた1通りのトレード順」の値でしかない
+# ここでは trade_df のトレードを並べ替え（permute）/ 重複ありで引き直し（bootstrap）て
+# 何万通りもの順番を作り、複利のロット計算（残高 × RISK_PERCENT、上限 MAX_LOTS）を全部の順番で同時にやり直す
+#   - 順番は (本数 × トレード数) の2次元配列で作る（メモリを抑えるため chunk 本ずつ）
+#   - Python が回るのはトレードの数だけ（1ステップで全部の順番の残高を numpy で更新する）
+# ==========================================
+
+CHUNK_PATHS = 10000
+
+
+def trade_units(trade_df, pip_value_jpy, risk_percent):
+    """
+    trade_df から1トレードごとの (1ロットあたりの損益[円], 1ロットあたりのSL幅[円]) を取り出す
+    ロット = 残高 × risk / SL幅 なので、SL幅 = 決済前の残高 × risk / ロット で戻せる
+      - forex-tester5min.py の trade_df（pips / profit / balance）も
+        run_simulation_final の trade_df（profit_pips / profit_yen / balance）も使える
+      - ロットが max_lots で頭打ちだったトレードは SL幅の上限しかわからないので、その上限を使う
+      - 損益 0 pips のトレードはロットが戻せないので、他のトレードのSL幅の中央値を使う
+    """
+    pips = np.asarray(trade_df['pips'] if 'pips' in trade_df else trade_df['profit_pips'], dtype='float64')
+    profit = np.asarray(trade_df['profit'] if 'profit' in trade_df else trade_df['profit_yen'], dtype='float64')
+    balance_before = np.asarray(trade_df['balance'], dtype='float64') - profit
+
+    pnl_per_lot = pips * pip_value_jpy
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lots = profit / pnl_per_lot
+        stop_per_lot = balance_before * risk_percent / lots
+    unknown = ~np.isfinite(stop_per_lot) | (stop_per_lot <= 0)
+    if unknown.all():
+        raise ValueError('ロットを戻せるトレードがありません（損益が全部 0 です）')
+    stop_per_lot[unknown] = np.median(stop_per_lot[~unknown])
+    return pnl_per_lot, stop_per_lot
+
+
+def sample_orders(n_trades, n_paths, length=None, method='bootstrap', rng=None):
+    """
+    トレード番号の2次元配列（行 = 1通りの順番）
+    bootstrap … 重複ありで length 個引く / permute … 全トレードを並べ替える
+    """
+    rng = np.random.default_rng(rng)
+    if method == 'bootstrap':
+        return rng.integers(0, n_trades, size=(n_paths, length or n_trades), dtype=np.int32)
+    if method == 'permute':
+        return rng.permuted(np.broadcast_to(np.arange(n_trades, dtype=np.int32), (n_paths, n_trades)), axis=1)
+    raise ValueError(f'method は bootstrap / permute のどちらかです: {method}')
+
+
+def replay(pnl_per_lot, stop_per_lot, orders, initial_capital, risk_percent, max_lots, min_lots=0.0):
+    """
+    orders の行ごとに、複利のロット計算でトレードをやり直す（全部の行を同時に）
+    ロット = min(残高 × risk / SL幅, max_lots)。ロットが min_lots 以下ならそのトレードは見送る
+    残高が 0 以下になった行はそこで止める（元のバックテストと同じ）
+    戻り値: 行ごとの dict（final_balance / max_dd / max_dd_pct / longest_losing_streak / sqn / min_balance）
+    """
+    n_paths, length = orders.shape
+    balance = np.full(n_paths, float(initial_capital))
+    peak = balance.copy()
+    max_dd = np.zeros(n_paths)
+    max_dd_pct = np.zeros(n_paths)
+    min_balance = balance.copy()
+    streak = np.zeros(n_paths)
+    longest = np.zeros(n_paths)
+    count = np.zeros(n_paths)
+    total_sq = np.zeros(n_paths)
+
+    # 残高 1円あたりのロット（ロット = 残高 × risk / SL幅）
+    lots_per_yen = risk_percent / stop_per_lot
+    # 残高 0 以下の行はロットが 0 以下になるので、lots > min_lots（min_lots >= 0）で止まる
+    min_lots = max(min_lots, 0.0)
+    lots = np.empty(n_paths)
+    profit = np.empty(n_paths)
+    take = np.empty(n_paths, dtype=bool)
+    loss = np.empty(n_paths, dtype=bool)
+    dd = np.empty(n_paths)
+
+    # 1ステップで1列ずつ読むので、列が連続したメモリになるように転置しておく
+    steps = np.ascontiguousarray(orders.T)
+    for k in steps:
+        np.multiply(balance, lots_per_yen[k], out=lots)
+        np.minimum(lots, max_lots, out=lots)
+        np.greater(lots, min_lots, out=take)
+        np.multiply(pnl_per_lot[k], lots, out=profit)
+        profit *= take
+        balance += profit
+
+        np.maximum(peak, balance, out=peak)
+        np.subtract(peak, balance, out=dd)
+        np.maximum(max_dd, dd, out=max_dd)
+        dd /= peak
+        np.maximum(max_dd_pct, dd, out=max_dd_pct)
+        np.minimum(min_balance, balance, out=min_balance)
+
+        # 負けなら +1、勝ち・引き分けなら 0、見送りならそのまま
+        np.less(profit, 0, out=loss)
+        np.add(streak, 1, out=dd)
+        dd *= loss
+        streak *= ~take
+        streak += dd
+        np.maximum(longest, streak, out=longest)
+        count += take
+        profit *= profit
+        total_sq += profit
+
+    total = balance - initial_capital
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / count
+        std = np.sqrt((total_sq - count * mean ** 2) / (count - 1))
+        sqn = mean / std * np.sqrt(count)
+    return {
+        'final_balance': balance,
+        'max_dd': max_dd,
+        'max_dd_pct': max_dd_pct * 100,
+        'longest_losing_streak': longest.astype(np.int64),
+        'sqn': sqn,
+        'min_balance': min_balance,
+    }
+
+
+def monte_carlo(trade_df, pip_value_jpy, risk_percent, max_lots, initial_capital,
+                n_paths=10000, length=None, method='bootstrap', min_lots=0.0,
+                ruin_dd_pct=50.0, seed=None, chunk=CHUNK_PATHS):
+    """
+    trade_df のトレード順を n_paths 通り作り直して、成績の分布を出す
+    ruin_dd_pct … 残高が初期資金からこの % 以上減ったら「破産」とみなす（100 なら残高 0）
+
+    戻り値: (paths, summary)
+      paths   … 1行 = 1通り（final_balance / max_dd / max_dd_pct / longest_losing_streak / sqn / ruined）
+      summary … 各列の平均と 5% / 50% / 95% 点、破産確率
+    """
+    pnl_per_lot, stop_per_lot = trade_units(trade_df, pip_value_jpy, risk_percent)
+    rng = np.random.default_rng(seed)
+
+    parts = []
+    for start in range(0, n_paths, chunk):
+        orders = sample_orders(len(pnl_per_lot), min(chunk, n_paths - start), length, method, rng)
+        parts.append(pd.DataFrame(replay(pnl_per_lot, stop_per_lot, orders, initial_capital,
+                                         risk_percent, max_lots, min_lots)))
+    paths = pd.concat(parts, ignore_index=True)
+    paths['ruined'] = paths['min_balance'] <= initial_capital * (1 - ruin_dd_pct / 100)
+    paths = paths.drop(columns='min_balance')
+    return paths, summarize(paths)
+
+
+def summarize(paths):
+    """分布の要約（列ごとの平均・5%・50%・95% 点と破産確率）"""
+    cols = ['final_balance', 'max_dd', 'max_dd_pct', 'longest_losing_streak', 'sqn']
+    summary = paths[cols].quantile([0.05, 0.5, 0.95]).T
+    summary.columns = ['p5', 'p50', 'p95']
+    summary.insert(0, 'mean', paths[cols].mean())
+    summary.loc['prob_ruin'] = [paths['ruined'].mean(), np.nan, np.nan, np.nan]
+    return summary
+
+
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(0)
+    n = 2000
+    pips = np.where(rng.random(n) < 0.4, 30.0, -15.0) + rng.normal(0, 2, n)
+    demo = pd.DataFrame({'pips': pips, 'profit': pips * 1000 * 0.5})
+    demo['balance'] = 100000 + demo['profit'].cumsum()
+
+    t0 = time.perf_counter()
+    paths, summary = monte_carlo(demo, pip_value_jpy=1000, risk_percent=0.01, max_lots=10.0,
+                                 initial_capital=100000, n_paths=100000, seed=0)
+    print(summary)
+    print(f"{len(paths):,} 通り × {n:,} トレード: {time.perf_counter() - t0:.1f} 秒")
+
+
+#=========================================================
+#montecarlo.py（トレード順のモンテカルロ）
+#=========================================================
+
+#使い方
+#from montecarlo import monte_carlo
+#paths, summary = monte_carlo(trade_df, pip_value_jpy=PIP_VALUE_JPY, risk_percent=RISK_PERCENT,
+#                             max_lots=MAX_LOTS, initial_capital=INITIAL_CAPITAL, n_paths=100000)
+#print(summary)                        ← 最終残高・最大DD・最大連敗・SQN の分布と破産確率
+#paths['max_dd_pct'].hist(bins=100)    ← 最大DD(%)の分布
+
+#method='permute' は同じトレードの並べ替えだけ（最終残高は複利の頭打ちがなければほぼ同じで、DDと連敗だけが変わる）
+#method='bootstrap'（既定）は重複ありで引き直すので、勝率のぶれも入る
+#forex-tester5min.py のように lots > 0.01 のときだけ建てるなら min_lots=0.01
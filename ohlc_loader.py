@@ -0,0 +1,225 @@
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 【共通OHLCローダー】
+# Forex Tester / MT4 のCSVを読み込み、Open/High/Low/Close のDataFrameにする
+# ==========================================
+
+# 列名の揺れ（<DTYYYYMMDD> 形式 / 大文字形式）を共通名にそろえる
+RENAME_DICT = {
+    '<DTYYYYMMDD>': 'Date', '<TIME>': 'Time',
+    '<OPEN>': 'Open', '<HIGH>': 'High', '<LOW>': 'Low', '<CLOSE>': 'Close', '<VOL>': 'TickVol',
+    'DATE': 'Date', 'TIME': 'Time', 'OPEN': 'Open', 'HIGH': 'High', 'LOW': 'Low', 'CLOSE': 'Close', 'VOL': 'TickVol'
+}
+
+OHLC_COLUMNS = ['Open', 'High', 'Low', 'Close']
+
+NS_PER_SECOND = 1_000_000_000
+NS_PER_DAY = 86400 * NS_PER_SECOND
+
+# <TIME> の桁数（HHMM / HHMMSS）を判定するのに読む先頭の行数
+# 読み方（一括 / キャッシュ / チャンク）によらず同じ行で判定するので、どの読み方でも同じ日時になる
+TIME_SAMPLE_ROWS = 100_000
+
+# 各月の日数（うるう年の2月は別で判定）
+_DAYS_IN_MONTH = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+
+def detect_encoding(path, sample_size=1 << 16):
+    """
+    ファイル先頭を読んで utf-8 / shift-jis を1回だけ判定する
+    （毎回 read_csv を失敗させてから読み直す必要がなくなる）
+    """
+    with open(path, 'rb') as f:
+        head = f.read(sample_size)
+
+    if head.startswith(b'\xef\xbb\xbf'):
+        return 'utf-8-sig'
+
+    try:
+        head.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # サンプルの末尾でマルチバイト文字が切れただけなら utf-8 とみなす
+        if e.reason != 'unexpected end of data':
+            return 'shift-jis'
+    return 'utf-8'
+
+
+def detect_csv_format(path, encoding=None):
+    """
+    ヘッダー1行目から列の対応（元の列名 → 共通名）を判定する
+    戻り値: {'encoding': ..., 'columns': {'Date': '<DTYYYYMMDD>', ...}}
+    """
+    if encoding is None:
+        encoding = detect_encoding(path)
+
+    with open(path, 'r', encoding=encoding) as f:
+        header = f.readline()
+
+    columns = {}
+    for name in header.strip().split(','):
+        key = name.strip().strip('"')
+        # 'Open' のような既に正規化済みの列名にも対応する
+        common = RENAME_DICT.get(key.upper(), RENAME_DICT.get(key, key))
+        if common in ('Date', 'Time') or common in OHLC_COLUMNS:
+            columns.setdefault(common, name.strip().strip('"'))
+
+    missing = [c for c in ['Date'] + OHLC_COLUMNS if c not in columns]
+    if missing:
+        raise ValueError(f'{path}: 必要な列が見つかりません {missing}')
+
+    return {'encoding': encoding, 'columns': columns}
+
+
+def _days_from_civil(y, m, d):
+    """年月日の整数配列 → 1970-01-01 からの日数（文字列を使わずに計算）"""
+    y = y - (m <= 2)
+    era = y // 400
+    yoe = y - era * 400
+    mp = (m + 9) % 12
+    doy = (153 * mp + 2) // 5 + d - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def _valid_ymd(y, m, d):
+    month_ok = (m >= 1) & (m <= 12)
+    dim = _DAYS_IN_MONTH[np.where(month_ok, m, 0)]
+    leap = ((y % 4 == 0) & (y % 100 != 0)) | (y % 400 == 0)
+    dim = dim + ((m == 2) & leap)
+    return month_ok & (d >= 1) & (d <= dim)
+
+
+def detect_time_format(time_values):
+    """<TIME> が HHMM か HHMMSS かを判定する"""
+    # HHMM なら最大でも 2359、HHMMSS なら 2400 を超える値が必ず出てくる
+    tmax = np.nanmax(time_values) if len(time_values) else 0
+    return 'HHMMSS' if tmax > 2359 else 'HHMM'
+
+
+def sniff_time_format(path, fmt, sample_rows=TIME_SAMPLE_ROWS):
+    """
+    ファイル先頭の sample_rows 行の <TIME> から HHMM / HHMMSS を判定する
+    <TIME> が無い・数値でない（'00:05' のような文字列）ときは None
+    """
+    time_col = fmt['columns'].get('Time')
+    if time_col is None:
+        return None
+    sample = pd.read_csv(path, header=0, encoding=fmt['encoding'], usecols=[time_col], nrows=sample_rows)
+    values = sample[time_col]
+    if values.dtype.kind not in 'iuf':
+        return None
+    return detect_time_format(values.to_numpy(dtype='float64'))
+
+
+def build_datetime_ns(date_values, time_values=None, time_format=None):
+    """
+    <DTYYYYMMDD> と <TIME> の整数列から、int64のナノ秒タイムスタンプを算術だけで作る
+    戻り値: (ns, valid)  変換できない行は valid=False になる
+
+    time_format: 'HHMM' / 'HHMMSS' / None（最大値から自動判定）
+    """
+    date_num = pd.to_numeric(pd.Series(date_values), errors='coerce').to_numpy(dtype='float64')
+    valid = np.isfinite(date_num)
+    dint = np.where(valid, date_num, 0).astype(np.int64)
+
+    y = dint // 10000
+    m = dint // 100 % 100
+    d = dint % 100
+    valid &= _valid_ymd(y, m, d)
+
+    ns = _days_from_civil(y, m, d) * NS_PER_DAY
+
+    if time_values is not None:
+        time_num = pd.to_numeric(pd.Series(time_values), errors='coerce').to_numpy(dtype='float64')
+        valid &= np.isfinite(time_num)
+        tint = np.where(valid, time_num, 0).astype(np.int64)
+
+        if time_format is None:
+            time_format = detect_time_format(tint)
+
+        if time_format == 'HHMMSS':
+            hh, mm, ss = tint // 10000, tint // 100 % 100, tint % 100
+        else:
+            hh, mm, ss = tint // 100, tint % 100, np.zeros_like(tint)
+
+        valid &= (hh < 24) & (mm < 60) & (ss < 60) & (tint >= 0)
+        ns = ns + (hh * 3600 + mm * 60 + ss) * NS_PER_SECOND
+
+    return ns, valid
+
+
+def _build_datetime_from_strings(date_values, time_values):
+    """'2024.01.02', '00:05' のような文字列形式のMT4エクスポート用（遅いので最終手段）"""
+    text = pd.Series(date_values).astype(str)
+    if time_values is not None:
+        text = text + ' ' + pd.Series(time_values).astype(str)
+    parsed = pd.to_datetime(text.str.replace('.', '-', regex=False), errors='coerce')
+    valid = parsed.notna().to_numpy()
+    return parsed.to_numpy(dtype='datetime64[ns]').view('int64'), valid
+
+
+def load_ohlc(path, encoding=None, time_format=None):
+    """
+    Forex Tester / MT4 のCSVを読み込み、DatetimeIndex付きの Open/High/Low/Close を返す
+
+    - 文字コードとヘッダー形式はファイル先頭から1回だけ判定する
+    - 日時は整数の <DTYYYYMMDD>/<TIME> から算術で作る（astype(str)+zfill を使わない）
+    - 日時に変換できない行は従来どおり捨てる
+    - <TIME> の桁数は先頭 TIME_SAMPLE_ROWS 行で判定する（sniff_time_format）
+    """
+    fmt = detect_csv_format(path, encoding)
+    if time_format is None:
+        time_format = sniff_time_format(path, fmt)
+    raw = pd.read_csv(path, header=0, encoding=fmt['encoding'], usecols=usecols_for(fmt))
+    return frame_from_raw(raw, fmt, time_format)
+
+
+def usecols_for(fmt):
+    """read_csv の usecols（日時とOHLCの列だけ読む）"""
+    cols = fmt['columns']
+    return [cols[c] for c in ['Date', 'Time'] + OHLC_COLUMNS if c in cols]
+
+
+def frame_from_raw(raw, fmt, time_format=None):
+    """
+    read_csv した生データ（元の列名のまま）→ DatetimeIndex + Open/High/Low/Close
+    チャンク読み込み（chunksize）でも同じ処理を使えるように分けてある
+    """
+    raw.columns = raw.columns.str.strip().str.strip('"')
+    raw = raw.rename(columns={v: k for k, v in fmt['columns'].items()})
+
+    date_values = raw['Date'].to_numpy()
+    time_values = raw['Time'].to_numpy() if 'Time' in raw.columns else None
+
+    if raw['Date'].dtype.kind in 'iuf' and (time_values is None or raw['Time'].dtype.kind in 'iuf'):
+        ns, valid = build_datetime_ns(date_values, time_values, time_format)
+    else:
+        ns, valid = _build_datetime_from_strings(date_values, time_values)
+
+    df = raw.loc[valid, OHLC_COLUMNS]
+    df.index = pd.DatetimeIndex(ns[valid].view('datetime64[ns]'), name='datetime')
+    return df
+
+
+if __name__ == "__main__":
+    path = r'C:\market_data\USDJPY_M5.csv'
+    print(detect_csv_format(path))
+    df = load_ohlc(path)
+    print(df.head())
+    print(df.dtypes)
+
+
+#=========================================================
+#ohlc_loader.py（Forex Tester / MT4 CSVの共通読み込み）
+#=========================================================
+
+#使い方
+#from ohlc_loader import load_ohlc
+#df = load_ohlc(r'C:\market_data\USDJPY_M15.csv')
+
+#速い理由
+#① 文字コードはファイル先頭だけで判定（失敗→読み直しをしない）
+#② 必要な6列だけ読む（<TICKER> や <VOL> は読まない）
+#③ 日時を文字列にせず、整数のまま「年月日→日数」「時分秒→秒」に計算する
@@ -0,0 +1,300 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from bar_cache import load_ohlc_cached
+from fx_backtest import add_emas, add_target_pos
+from instruments import QUOTE_TO_JPY, get_instrument, symbol_from_path
+
+# ==========================================
+# 【複数通貨ペアを1つの口座（共通の残高）で回すポートフォリオ版】
+# USDJPY,EURUSD,GBPUSD_M5.py は1ペアずつ、それぞれ別の initial_capital で回している
+# ここでは
+#   1. ペアごとのシグナル（target_pos）を別プロセスで同時に作る（ペアの数だけコアを使う）
+#   2. 全ペアの時刻をそろえて、1本のループで「共通の残高・証拠金・1トレードのリスク」で回す
+#   3. ポートフォリオ全体とペアごとの損益曲線を返す
+# 1ペアごとの売買ルール（SL優先・反転は終値・決済した足では建てない）は run_simulation_final と同じ
+# ==========================================
+
+DEFAULT_PAIRS = ['USDJPY', 'EURUSD', 'GBPUSD', 'AUDUSD']
+
+# 証拠金の計算に使うレバレッジ（国内の個人口座の上限）
+LEVERAGE = 25
+
+
+def pair_signals(path, slope_threshold_pips, start_hour=16, end_hour=1, loader_kwargs=None):
+    """
+    1ペア分の価格とシグナルを作る（ワーカープロセスで呼ばれる）
+    戻り値: (symbol, times[int64 ns], close, high, low, target[int8])
+    """
+    symbol = symbol_from_path(path)
+    pip_size = get_instrument(symbol)['pip_size']
+    df = load_ohlc_cached(path, **(loader_kwargs or {}))
+    df = add_target_pos(add_emas(df[['High', 'Low', 'Close']].copy()),
+                        slope_threshold_pips * pip_size, start_hour, end_hour)
+    return (symbol, df.index.asi8,
+            df['Close'].to_numpy(dtype='float64'),
+            df['High'].to_numpy(dtype='float64'),
+            df['Low'].to_numpy(dtype='float64'),
+            df['target_pos'].to_numpy(dtype='int8'))
+
+
+def compute_signals(paths, slope_threshold_pips=3.0, start_hour=16, end_hour=1,
+                    workers=None, loader_kwargs=None):
+    """
+    全ペアのシグナルをプロセスプールで並列に作る
+    workers=1 ならプールを使わずにこのプロセスで順番に作る（Jupyter などで使うとき）
+    戻り値: {symbol: (times, close, high, low, target)}（paths の順）
+    """
+    args = [(p, slope_threshold_pips, start_hour, end_hour, loader_kwargs) for p in paths]
+    if workers is None:
+        workers = min(len(paths), os.cpu_count() or 1)
+
+    if workers <= 1:
+        results = [pair_signals(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(pair_signals, *zip(*args)))
+    return {r[0]: r[1:] for r in results}
+
+
+def align_signals(signals):
+    """
+    ペアごとの配列を全ペアの時刻の和集合にそろえる
+    その時刻に足が無いペアは has_bar = False（その時刻は何もしない）
+    戻り値: (times[int64 ns], {'close'/'high'/'low': n×P, 'target': n×P int8, 'has_bar': n×P bool})
+    """
+    times = np.unique(np.concatenate([s[0] for s in signals.values()]))
+    n, n_pair = len(times), len(signals)
+    close = np.full((n, n_pair), np.nan)
+    high = np.full((n, n_pair), np.nan)
+    low = np.full((n, n_pair), np.nan)
+    target = np.zeros((n, n_pair), dtype='int8')
+    has_bar = np.zeros((n, n_pair), dtype=bool)
+
+    for p, (t, c, h, l, tgt) in enumerate(signals.values()):
+        rows = np.searchsorted(times, t)
+        close[rows, p] = c
+        high[rows, p] = h
+        low[rows, p] = l
+        target[rows, p] = tgt
+        has_bar[rows, p] = True
+    return times, {'close': close, 'high': high, 'low': low, 'target': target, 'has_bar': has_bar}
+
+
+def run_portfolio(times, aligned, symbols, sl_pips, cap, risk, max_lot,
+                  spread_pips=None, leverage=LEVERAGE):
+    """
+    共通の残高で全ペアを回す
+    sl_pips / spread_pips … 数値なら全ペア共通、dict なら {symbol: 値}（spread_pips=None は instruments.py の標準値）
+    ロット … 共通の残高 × risk を SL+スプレッドで割る（run_simulation_final と同じ）
+              さらに「残高 − 使用中の証拠金」で建てられる分までに抑える
+    同じ足では、全ペアの決済を先に済ませてからペアの順にエントリーする
+
+    戻り値: (trades, equity)
+      trades … 全ペアのトレード（symbol 列付き。列は run_simulation_final の trade_df と同じ）
+      equity … index=時刻、列=ペアごとの損益（確定 + 含み）と 'portfolio'（cap + 合計）
+    """
+    insts = [get_instrument(s) for s in symbols]
+    n_pair = len(symbols)
+
+    def per_pair(value, default):
+        if value is None:
+            return np.array([default(i) for i in insts], dtype='float64')
+        if isinstance(value, dict):
+            return np.array([value[i['symbol']] for i in insts], dtype='float64')
+        return np.full(n_pair, value, dtype='float64')
+
+    sl = per_pair(sl_pips, None)
+    spread = per_pair(spread_pips, lambda i: i['spread_pips'])
+    pip_size = np.array([i['pip_size'] for i in insts])
+    pip_val = np.array([i['pip_value_jpy'] for i in insts])
+    # 1ロットの証拠金 = 通貨量 × 価格 × 決済通貨の円換算 / レバレッジ
+    margin_unit = np.array([i['contract_size'] * QUOTE_TO_JPY[i['quote']] for i in insts]) / leverage
+
+    close, high, low = aligned['close'], aligned['high'], aligned['low']
+    target, has_bar = aligned['target'], aligned['has_bar']
+    # 全ペアでノーポジ・シグナルなしの足は飛ばす
+    active_bar = (target != 0).any(axis=1)
+
+    balance = cap
+    used_margin = 0.0
+    pos = [0] * n_pair
+    lot = [0.0] * n_pair
+    entry_price = [0.0] * n_pair
+    entry_bar = [0] * n_pair
+    margin = [0.0] * n_pair
+    n_open = 0
+    trades = []
+
+    for i in range(len(times)):
+        if balance <= 0:
+            break
+        if n_open == 0 and not active_bar[i]:
+            continue
+
+        # --- A. 全ペアの決済 ---
+        exited = [False] * n_pair
+        if n_open:
+            for p in range(n_pair):
+                if pos[p] == 0 or not has_bar[i, p]:
+                    continue
+                side = pos[p]
+                if side == 1:
+                    sl_price = entry_price[p] - sl[p] * pip_size[p]
+                    sl_hit = low[i, p] <= sl_price
+                else:
+                    sl_price = entry_price[p] + sl[p] * pip_size[p]
+                    sl_hit = high[i, p] >= sl_price
+
+                if sl_hit:
+                    exit_price = sl_price
+                    net_pips = -(sl[p] + spread[p])
+                elif target[i, p] != side:
+                    exit_price = close[i, p]
+                    net_pips = (exit_price - entry_price[p]) * side / pip_size[p] - spread[p]
+                else:
+                    continue
+
+                profit_yen = net_pips * pip_val[p] * lot[p]
+                balance += profit_yen
+                used_margin -= margin[p]
+                trades.append((p, entry_bar[p], i, entry_price[p], exit_price, side,
+                               net_pips, profit_yen, balance, lot[p]))
+                pos[p] = 0
+                n_open -= 1
+                exited[p] = True
+
+        # --- B. 新規エントリー（決済したペアはこの足では建てない） ---
+        for p in range(n_pair):
+            if pos[p] != 0 or exited[p] or not has_bar[i, p] or target[i, p] == 0 or balance <= 0:
+                continue
+            new_lot = min(balance * risk / ((sl[p] + spread[p]) * pip_val[p]), max_lot)
+            per_lot = margin_unit[p] * close[i, p]
+            new_lot = min(new_lot, (balance - used_margin) / per_lot)
+            if new_lot > 0:
+                pos[p] = int(target[i, p])
+                lot[p] = new_lot
+                entry_price[p] = close[i, p]
+                entry_bar[p] = i
+                margin[p] = new_lot * per_lot
+                used_margin += margin[p]
+                n_open += 1
+
+    trade_df = _trades_frame(trades, times, symbols)
+    open_positions = [(p, entry_bar[p], pos[p], lot[p], entry_price[p]) for p in range(n_pair) if pos[p] != 0]
+    equity = _equity_curves(trades, open_positions, times, close, symbols, pip_size, pip_val, cap)
+    return trade_df, equity
+
+
+def _trades_frame(trades, times, symbols):
+    if trades:
+        p, e_bar, x_bar, e_price, x_price, side, pips, yen, bal, lot = (np.array(c) for c in zip(*trades))
+    else:
+        # トレードが無いときも列の型はトレードがあるときと同じにする（grid_simulator._trades_frame と同じ）
+        p, e_bar, x_bar, side = (np.empty(0, dtype=np.int64) for _ in range(4))
+        e_price, x_price, pips, yen, bal, lot = (np.empty(0) for _ in range(6))
+    index = pd.DatetimeIndex(times.view('datetime64[ns]'))
+    return pd.DataFrame({
+        'symbol': pd.Categorical.from_codes(p, categories=symbols),
+        'entry_time': index[e_bar],
+        'exit_time': index[x_bar],
+        'entry_price': e_price,
+        'exit_price': x_price,
+        'side': np.where(side == 1, 'BUY', 'SELL'),
+        'profit_pips': pips,
+        'profit_yen': yen,
+        'balance': bal,
+        'lot': lot,
+    })
+
+
+def _equity_curves(trades, open_positions, times, close, symbols, pip_size, pip_val, cap):
+    """
+    ペアごとの損益曲線（確定損益 + 終値で評価した含み損益）をトレード一覧から配列でまとめて作る
+    1ペアのポジションは重ならないので、「side×lot」「side×lot×建値」を建てた足で足して
+    決済した足で引いた累積和が、その足の保有状態になる
+    """
+    n, n_pair = close.shape
+    # 足が無い時刻は直前の終値で評価する
+    marks = pd.DataFrame(close).ffill().fillna(0.0).to_numpy()
+
+    # (ペア, 建てた足, 決済した足, side×lot, 建値, 確定損益)。保有中のものは決済した足 = n
+    held = [(t[0], t[1], t[2], t[5] * t[9], t[3], t[7]) for t in trades]
+    held += [(p, e, n, side * lot, price, 0.0) for p, e, side, lot, price in open_positions]
+    realized = np.zeros((n + 1, n_pair))
+    d_lot = np.zeros((n + 1, n_pair))
+    d_cost = np.zeros((n + 1, n_pair))
+    if held:
+        p, e_bar, x_bar, size, price, yen = (np.array(c) for c in zip(*held))
+        p = p.astype('int64')
+        e_bar = e_bar.astype('int64')
+        x_bar = x_bar.astype('int64')
+        np.add.at(realized, (x_bar, p), yen)
+        np.add.at(d_lot, (e_bar, p), size)
+        np.add.at(d_lot, (x_bar, p), -size)
+        np.add.at(d_cost, (e_bar, p), size * price)
+        np.add.at(d_cost, (x_bar, p), -size * price)
+
+    exposure = np.cumsum(d_lot[:n], axis=0)
+    cost = np.cumsum(d_cost[:n], axis=0)
+    unrealized = (marks * exposure - cost) / pip_size * pip_val
+    # 浮動小数の残り（ノーポジの足）を 0 にそろえる
+    unrealized[np.isclose(exposure, 0.0)] = 0.0
+    curves = np.cumsum(realized[:n], axis=0) + unrealized
+
+    equity = pd.DataFrame(curves, columns=list(symbols),
+                          index=pd.DatetimeIndex(times.view('datetime64[ns]'), name='datetime'))
+    equity['portfolio'] = cap + curves.sum(axis=1)
+    return equity
+
+
+def run_portfolio_backtest(paths, sl_pips=10.0, slope_threshold_pips=3.0, cap=100000,
+                           risk=0.01, max_lot=100, spread_pips=None, leverage=LEVERAGE,
+                           workers=None, loader_kwargs=None):
+    """シグナル作成（並列）→ 時刻合わせ → 共通残高のループ をまとめて行う"""
+    signals = compute_signals(paths, slope_threshold_pips, workers=workers, loader_kwargs=loader_kwargs)
+    symbols = list(signals)
+    times, aligned = align_signals(signals)
+    return run_portfolio(times, aligned, symbols, sl_pips, cap, risk, max_lot, spread_pips, leverage)
+
+
+if __name__ == "__main__":
+    import matplotlib.pyplot as plt
+
+    paths = [rf'C:\market_data\{pair}_M5.csv' for pair in DEFAULT_PAIRS]
+    # Windows はワーカーがこのファイルを読み直すので、並列処理は必ず if __name__ == "__main__": の中で呼ぶ
+    trade_df, equity = run_portfolio_backtest(paths, sl_pips=10.0, slope_threshold_pips=3.0)
+
+    print(trade_df.groupby('symbol', observed=False)['profit_yen'].agg(['count', 'sum']))
+    print(f"最終残高: {int(equity['portfolio'].iloc[-1]):,} 円")
+
+    fig, axes = plt.subplots(3, 2, figsize=(12, 9))
+    axes[0, 0].plot(equity.index, equity['portfolio'], color='orange')
+    axes[0, 0].set_title('Portfolio')
+    axes[0, 1].axis('off')
+    for ax, pair in zip(axes[1:].flatten(), DEFAULT_PAIRS):
+        ax.plot(equity.index, equity[pair], color='black', linestyle='dashed')
+        ax.set_title(pair)
+    plt.tight_layout()
+    plt.show()
+
+
+#=========================================================
+#portfolio.py（複数通貨ペアを共通の残高で回す）
+#=========================================================
+
+#使い方
+#from portfolio import run_portfolio_backtest
+#paths = [r'C:\market_data\USDJPY_M5.csv', r'C:\market_data\EURUSD_M5.csv',
+#         r'C:\market_data\GBPUSD_M5.csv', r'C:\market_data\AUDUSD_M5.csv']
+#trade_df, equity = run_portfolio_backtest(paths, sl_pips=10.0, slope_threshold_pips=3.0)
+#equity['portfolio']   ← 口座全体の残高（含み損益込み）
+#equity['EURUSD']      ← そのペアだけの損益
+
+#シグナル作成はペアごとに別プロセスで動く（workers=1 で並列なし）
+#Windows / Jupyter で並列にするときはスクリプトの if __name__ == "__main__": の中で呼ぶ
+#sl_pips={'USDJPY': 10, 'EURUSD': 12, ...} のようにペアごとに変えられる
+#1ペアだけ渡して leverage を大きくすると run_simulation_final と同じ結果になる
@@ -0,0 +1,385 @@
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import shutil
+import sys
+import time
+import types
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 【バックテスト結果のキャッシュ（内容ハッシュがキー）】
+# 同じデータ・同じパラメータで forex-tester 系や Algorithmic Trading Book のバックテストを
+# 1日に何度も回し直しているので、結果（トレード一覧・残高推移・成績）をディスクに置いておき、
+# 同じ条件ならファイルを読むだけで返す
+#   - キー = (データの中身のハッシュ, 戦略のコードのハッシュ, パラメータ, コスト設定) のハッシュ
+#   - コードは戦略関数のファイルに加えて、そこから呼んでいるこのリポジトリの関数・モジュールのファイルも見る
+#     （exit_engine.py を直せば forex-tester5min.py の run_backtest のキャッシュも自動で外れる）
+#   - データ・コードが1バイトでも変わればキーが変わるので、古い結果は使われない（残りは LRU で消える）
+#   - 合計サイズが max_bytes を超えたら、最後に使ってから一番時間がたったものから消す
+# ==========================================
+
+CACHE_DIR_NAME = '_result_cache'
+META_FILE = 'meta.json'
+CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# コードのハッシュに入れないモジュール（標準ライブラリ・pip で入れたもの）
+_SKIP_PREFIXES = tuple({os.path.abspath(p) for p in (sys.prefix, sys.base_prefix, sys.exec_prefix)})
+
+
+def _hasher():
+    return hashlib.blake2b(digest_size=20)
+
+
+def _update_array(h, values):
+    values = np.asarray(values)
+    if values.dtype == object:
+        values = pd.util.hash_pandas_object(pd.Series(values), index=False).to_numpy()
+    h.update(f'{values.dtype.str}{values.shape}'.encode())
+    h.update(np.ascontiguousarray(values).view(np.uint8).ravel())
+
+
+def data_fingerprint(data):
+    """
+    入力データの中身のハッシュ
+    DataFrame / Series / numpy配列 / BarWindow / 配列の dict を受け付ける（index と列名も含める）
+    CSV のパス（str）なら bar_cache と同じく パス・サイズ・更新時刻 で見る
+    """
+    h = _hasher()
+    if isinstance(data, (str, os.PathLike)):
+        st = os.stat(data)
+        h.update(json.dumps([os.path.abspath(data), st.st_size, st.st_mtime_ns]).encode())
+    elif isinstance(data, pd.DataFrame):
+        _update_array(h, data.index)
+        for name in data.columns:
+            h.update(str(name).encode())
+            _update_array(h, data[name])
+    elif isinstance(data, pd.Series):
+        _update_array(h, data.index)
+        _update_array(h, data)
+    elif isinstance(data, dict):
+        for name in sorted(data):
+            h.update(str(name).encode())
+            _update_array(h, data[name])
+    elif hasattr(data, 'columns') and hasattr(data, 'times'):
+        # memmap_store.BarWindow
+        _update_array(h, data.times)
+        for name in data.columns:
+            h.update(str(name).encode())
+            _update_array(h, data[name])
+    else:
+        _update_array(h, data)
+    return h.hexdigest()
+
+
+def _source_file(obj):
+    try:
+        path = inspect.getsourcefile(obj)
+    except TypeError:
+        return None
+    if path is None or not os.path.exists(path):
+        return None
+    path = os.path.abspath(path)
+    if path.startswith(_SKIP_PREFIXES):
+        return None
+    return path
+
+
+def _code_objects(code):
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            yield from _code_objects(const)
+
+
+def _referenced(fn):
+    """fn のコードが名前で参照しているグローバル（関数・クラス・モジュール）"""
+    fn = inspect.unwrap(getattr(fn, '__func__', fn))
+    code = getattr(fn, '__code__', None)
+    if code is None:
+        return []
+    names = {name for c in _code_objects(code) for name in c.co_names}
+    scope = getattr(fn, '__globals__', {})
+    return [scope[name] for name in names
+            if isinstance(scope.get(name), (types.FunctionType, types.ModuleType, type))]
+
+
+def code_fingerprint(fn, depends=()):
+    """
+    戦略のコードのハッシュ
+    fn の定義されたファイルと、fn から（たどって）呼んでいるこのリポジトリの関数・クラス・モジュールの
+    ファイルの中身を全部まとめる。depends には追加で見たいモジュール・関数・クラスを渡す
+    ファイルが無いとき（Jupyter のセルなど）は関数のソース / バイトコードで代用する
+    """
+    files = set()
+    fallback = []
+    seen = set()
+    stack = [fn, *depends]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        path = _source_file(obj)
+        if path is not None:
+            files.add(path)
+        elif obj is fn or obj in depends:
+            try:
+                fallback.append(inspect.getsource(obj))
+            except (OSError, TypeError):
+                code = getattr(inspect.unwrap(getattr(obj, '__func__', obj)), '__code__', None)
+                fallback.append(repr(code.co_code + repr(code.co_consts).encode()) if code else repr(obj))
+        else:
+            continue   # 標準ライブラリ・pip のパッケージはたどらない
+        stack.extend(_referenced(obj))
+
+    h = _hasher()
+    h.update(getattr(fn, '__qualname__', repr(fn)).encode())
+    for path in sorted(files):
+        with open(path, 'rb') as f:
+            h.update(path.encode() + b'\0' + f.read())
+    for text in fallback:
+        h.update(text.encode())
+    return h.hexdigest()
+
+
+def _jsonable(value):
+    """
+    json にできない値の変換（キーに入るので、同じ値なら毎回同じ文字列になるものだけ）
+    それ以外（オブジェクト・DataFrame など）は str() するとアドレスが入って毎回キーが変わるので TypeError
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if isinstance(value, tuple):
+        return list(value)
+    if isinstance(value, date):
+        return value.isoformat()   # datetime / pd.Timestamp も
+    raise TypeError(f'キャッシュのキーにできない値です: {type(value).__name__}')
+
+
+def make_key(data, fn, params=None, costs=None, depends=()):
+    """キャッシュのキー（データ・コード・パラメータ・コスト設定のハッシュ）と、その中身の dict"""
+    parts = {
+        'version': CACHE_VERSION,
+        'data': data_fingerprint(data),
+        'code': code_fingerprint(fn, depends),
+        'params': params or {},
+        'costs': costs or {},
+    }
+    text = json.dumps(parts, sort_keys=True, default=_jsonable)
+    return hashlib.sha256(text.encode()).hexdigest(), json.loads(text)
+
+
+class ResultCache:
+    """
+    キーごとに1フォルダ（<cache_root>/<key>/）
+      <名前>.pkl … 結果の各部分（trades / history など）
+      meta.json  … キーの中身・成績（metrics）・サイズ（最後に書くので、途中で落ちた結果は使われない）
+    meta.json の更新時刻を「最後に使った時刻」にして LRU で消す
+    """
+
+    def __init__(self, cache_root=None, max_bytes=DEFAULT_MAX_BYTES):
+        if cache_root is None:
+            cache_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), CACHE_DIR_NAME)
+        self.cache_root = cache_root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_root, key)
+
+    def get(self, key):
+        """保存されている結果の dict（無ければ None）"""
+        entry_dir = self._entry_dir(key)
+        meta_path = os.path.join(entry_dir, META_FILE)
+        if not os.path.exists(meta_path):
+            self.misses += 1
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        result = {}
+        for name in meta['parts']:
+            with open(os.path.join(entry_dir, f'{name}.pkl'), 'rb') as f:
+                result[name] = pickle.load(f)
+        os.utime(meta_path)   # LRU の「最後に使った時刻」
+        self.hits += 1
+        return result
+
+    def put(self, key, result, key_parts=None):
+        """
+        result（{'trades': DataFrame, 'history': list, 'metrics': dict, ...}）を保存する
+        一時フォルダに書いてから名前を変えるので、同じキーを同時に書いても壊れない
+        """
+        os.makedirs(self.cache_root, exist_ok=True)
+        tmp_dir = os.path.join(self.cache_root, f'.tmp_{key}_{os.getpid()}')
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        size = 0
+        for name, value in result.items():
+            path = os.path.join(tmp_dir, f'{name}.pkl')
+            with open(path, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            size += os.path.getsize(path)
+        meta = {
+            'version': CACHE_VERSION,
+            'key': key_parts,
+            'parts': list(result),
+            'metrics': result.get('metrics'),
+            'bytes': size,
+            'created': time.time(),
+        }
+        with open(os.path.join(tmp_dir, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=1, default=_jsonable)
+
+        entry_dir = self._entry_dir(key)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        try:
+            os.replace(tmp_dir, entry_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)   # 他のプロセスが先に書いた
+        self.evict()
+
+    def entries(self):
+        """保存されている結果の一覧（最後に使った時刻の新しい順）"""
+        rows = []
+        if not os.path.isdir(self.cache_root):
+            return pd.DataFrame(columns=['key', 'bytes', 'last_used', 'metrics'])
+        for key in os.listdir(self.cache_root):
+            meta_path = os.path.join(self._entry_dir(key), META_FILE)
+            if key.startswith('.tmp_') or not os.path.exists(meta_path):
+                continue
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            rows.append({'key': key, 'bytes': meta['bytes'],
+                         'last_used': pd.Timestamp(os.path.getmtime(meta_path), unit='s'),
+                         'metrics': meta.get('metrics')})
+        table = pd.DataFrame(rows, columns=['key', 'bytes', 'last_used', 'metrics'])
+        return table.sort_values('last_used', ascending=False, ignore_index=True)
+
+    def evict(self):
+        """合計が max_bytes を超えていたら、最後に使ったのが古いものから消す"""
+        table = self.entries()
+        total = int(table['bytes'].sum())
+        for row in table.iloc[::-1].itertuples():
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(self._entry_dir(row.key), ignore_errors=True)
+            total -= row.bytes
+
+    def clear(self):
+        shutil.rmtree(self.cache_root, ignore_errors=True)
+
+    # ------------------------------------------
+    # よく使う形
+    # ------------------------------------------
+
+    def backtest(self, fn, df, params=None, costs=None, depends=(), metrics=None):
+        """
+        fn(df, **costs, **params) → (trade_df, history) のバックテストをキャッシュ付きで回す
+        （exit_engine.run_backtest_vectorized / fx_backtest.run_backtest / forex-tester5min.py の run_backtest など）
+        metrics … (trade_df, history) → dict。既定は sweep.summarize_trades（show_report と同じ指標）
+        戻り値: (trade_df, history, metrics)
+        """
+        params = params or {}
+        costs = costs or {}
+        if metrics is None:
+            from sweep import summarize_trades as metrics
+        key, key_parts = make_key(df, fn, params, costs, (*depends, metrics))
+        cached = self.get(key)
+        if cached is not None:
+            return cached['trades'], cached['history'], cached['metrics']
+
+        trade_df, history = fn(df, **costs, **params)
+        stats = {name: _jsonable(v) if isinstance(v, np.generic) else v
+                 for name, v in metrics(trade_df, history).items()}
+        self.put(key, {'trades': trade_df, 'history': history, 'metrics': stats}, key_parts)
+        return trade_df, history, stats
+
+    def strategy(self, bt, method='run_strategy', **params):
+        """
+        Algorithmic Trading Book の Vector バックテスタ用
+        - bt.data を持つクラス（MomVectorBacktester / MRVectorBacktester）は bt.data の中身をキーにする
+        - bt.data を持たず run_strategy の中で読むクラス（SMAVectorBacktester）は bt.get_data() の戻り値をキーにする
+        bt.run_strategy(**params) の戻り値（と、あれば bt.results）をキャッシュする（当たったら bt.results も戻す）
+        bt の数値・文字列・日付の属性（SMA1 / SMA2 / amount / tc / start / end など）もキーに入れる
+        コードはクラスと親クラスのファイルを見る
+        """
+        if hasattr(bt, 'data'):
+            data = bt.data
+        elif hasattr(bt, 'get_data'):
+            data = bt.get_data()
+        else:
+            raise TypeError(f'{type(bt).__name__}: data も get_data も無いクラスはキャッシュできません')
+
+        fn = getattr(bt, method)
+        settings = {name: value for name, value in vars(bt).items()
+                    if name not in ('data', 'results')
+                    and (value is None or isinstance(value, (str, int, float, np.generic, date)))}
+        key, key_parts = make_key(data, fn, params, settings, type(bt).__mro__[:-1])
+        cached = self.get(key)
+        if cached is not None:
+            if 'results' in cached:
+                bt.results = cached['results']
+            return cached['value']
+
+        value = fn(**params)
+        result = {'value': value,
+                  'metrics': dict(zip(('aperf', 'operf'), value)) if isinstance(value, tuple) else None}
+        if hasattr(bt, 'results'):
+            result['results'] = bt.results
+        self.put(key, result, key_parts)
+        return value
+
+if __name__ == "__main__":
+    from bar_cache import load_ohlc_cached
+    from exit_engine import run_backtest_vectorized
+    from fx_backtest import add_indicators, add_signal
+
+    df = add_signal(add_indicators(load_ohlc_cached(r'C:\market_data\USDJPY_M15.csv').copy()), 0.02)
+    cache = ResultCache()
+    for _ in range(2):
+        t0 = time.perf_counter()
+        trade_df, history, stats = cache.backtest(
+            run_backtest_vectorized, df,
+            params={'sl_atr_multiplier': 1.5, 'tp_atr_multiplier': 3.0},
+            costs={'pips_unit': 0.01, 'pip_value_jpy': 1000, 'spread_pips': 1.0})
+        print(stats, f"{time.perf_counter() - t0:.3f} 秒")
+    print(cache.entries())
+
+
+#=========================================================
+#result_cache.py（バックテスト結果のキャッシュ）
+#=========================================================
+
+#使い方（forex-tester 系）
+#from result_cache import ResultCache
+#cache = ResultCache()                     ← 既定の置き場所はリポジトリ直下の _result_cache\
+#trade_df, balance_history, stats = cache.backtest(
+#    run_backtest_vectorized, df,
+#    params={'sl_atr_multiplier': SL_ATR_MULTIPLIER, 'tp_atr_multiplier': TP_ATR_MULTIPLIER},
+#    costs={'pips_unit': PIPS_UNIT, 'pip_value_jpy': PIP_VALUE_JPY, 'spread_pips': SPREAD_PIPS})
+
+#使い方（Algorithmic Trading Book）
+#mombt = MomVectorBacktester(...)
+#cache.strategy(mombt, momentum=5)        ← mombt.run_strategy(momentum=5) と同じ戻り値。mombt.results も入る
+#cache.strategy(smabt)                    ← SMAVectorBacktester は get_data() の中身と SMA1 / SMA2 がキー。戻り値のフレームが返る
+
+#キーに入るもの
+#  データ … df の index と全部の列の中身（シグナルや指標の列も含む）
+#  コード … 戦略関数のファイル + そこから呼んでいるこのリポジトリの関数・モジュールのファイル
+#  パラメータ・コスト … params / costs の dict（Book のクラスは SMA1 / amount / tc などの属性）
+#  キーにできない値（オブジェクトなど）を params に渡すと TypeError
+#どれかが変われば別のキーになるので、古い結果が返ることはない
+#cache.entries() で一覧、cache.clear() で全部消す。max_bytes（既定 2GB）を超えると古いものから消える
@@ -0,0 +1,86 @@
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+
+# ==========================================
+# 【価格配列をプロセス間で共有する】
+# ProcessPoolExecutor にそのまま配列を渡すと、タスクごとに pickle してコピーを送ることになる
+# ここでは親プロセスで配列を共有メモリ（multiprocessing.shared_memory）に1回だけ置き、
+# ワーカーは名前で開いて numpy 配列として読む（コピーしない）
+#   - 親: with SharedArrays({'close': close, ...}) as shared: ... shared.specs をワーカーに渡す
+#   - ワーカー: attach(specs) → {'close': ndarray, ...}（プールの initializer で1回だけ呼ぶ）
+# ==========================================
+
+
+class SharedArrays:
+    """
+    配列の dict を共有メモリに置く
+    specs … ワーカーに渡す {name: (共有メモリ名, shape, dtype)}（pickle できる小さい dict）
+    with を抜けると共有メモリを解放する
+    """
+
+    def __init__(self, arrays):
+        self.blocks = []
+        self.specs = {}
+        self.arrays = {}
+        for name, values in arrays.items():
+            values = np.ascontiguousarray(values)
+            shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+            self.blocks.append(shm)
+            view = np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)
+            view[...] = values
+            self.arrays[name] = view
+            self.specs[name] = (shm.name, values.shape, values.dtype.str)
+
+    def close(self):
+        self.arrays = {}
+        for shm in self.blocks:
+            shm.close()
+            shm.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ワーカー側で開いた共有メモリ（プロセスが終わるまで開いたままにする）
+_attached = []
+
+
+def _open_block(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)   # Python 3.13 以降
+    except TypeError:
+        pass
+    # 3.12 以前は開いただけで resource_tracker に登録され、ワーカー終了時に消されてしまうので登録を止めて開く
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def attach(specs):
+    """SharedArrays.specs から読み取り専用の numpy 配列の dict を作る（ワーカーで呼ぶ）"""
+    arrays = {}
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = _open_block(shm_name)
+        _attached.append(shm)
+        view = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        view.flags.writeable = False
+        arrays[name] = view
+    return arrays
+
+
+#=========================================================
+#shared_arrays.py（価格配列をプロセス間で共有する）
+#=========================================================
+
+#使い方（walkforward.py を参照）
+#with SharedArrays({'close': close, 'times': times}) as shared:
+#    with ProcessPoolExecutor(initializer=_init_worker, initargs=(shared.specs,)) as pool:
+#        ...
+#ワーカー側: arrays = attach(specs)  ← 配列はコピーされない
@@ -0,0 +1,128 @@
+import numpy as np
+
+# ==========================================
+# 【シグナル条件ごとのビットマスクキャッシュ】
+# forex-tester5min.py の買い・売りの条件は、独立した比較の AND でできている
+#   Close > EMA_trend / EMA_short > EMA_long / Close < EMA_short / EMA_slope > SLOPE_THRESH /
+#   ADX > 25 / PlusDI > MinusDI
+# パラメータスイープでは、組み合わせが変わってもほとんどの比較は同じ結果になる
+# ここでは比較1つ（左の列・演算子・右の列 or しきい値）ごとに結果を
+# np.packbits で詰めたビットマスク（1足 = 1ビット）として覚えておき、シグナルはマスクの AND で組み立てる
+#   - しきい値を1つ変えても、計算し直すのはその比較1つだけ
+#   - 1本のマスクは 足数 / 8 バイト（M5 10年分でも 100KB 弱）
+# ==========================================
+
+OPS = {
+    '>': np.greater,
+    '<': np.less,
+    '>=': np.greater_equal,
+    '<=': np.less_equal,
+}
+
+
+def trend_pullback_terms(slope_thresh, adx_thresh=25):
+    """
+    fx_backtest.add_signal（forex-tester5min.py）と同じ条件を (買いの比較, 売りの比較) で返す
+    slope_thresh は価格の単位（SLOPE_THRESH_PIPS × PIPS_UNIT）
+    """
+    buy = [
+        ('Close', '>', 'EMA_trend'),
+        ('EMA_short', '>', 'EMA_long'),
+        ('Close', '<', 'EMA_short'),
+        ('EMA_slope', '>', slope_thresh),
+        ('ADX', '>', adx_thresh),
+        ('PlusDI', '>', 'MinusDI'),
+    ]
+    sell = [
+        ('Close', '<', 'EMA_trend'),
+        ('EMA_short', '<', 'EMA_long'),
+        ('Close', '>', 'EMA_short'),
+        ('EMA_slope', '<', -slope_thresh),
+        ('ADX', '>', adx_thresh),
+        ('MinusDI', '>', 'PlusDI'),
+    ]
+    return buy, sell
+
+
+class SignalMasks:
+    """
+    指標の列（DataFrame / BarWindow / 配列の dict）から、比較ごとのビットマスクを作って覚えておく
+    比較は (左の列名, 演算子, 右の列名 or 数値) のタプル。NaN との比較は False（pandas と同じ）
+
+    masks = SignalMasks(df)
+    df['signal'] = masks.signal(*trend_pullback_terms(SLOPE_THRESH, 25))
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.n = len(columns['Close'] if 'Close' in columns else next(iter(columns.values())))
+        self.cache = {}
+        self.computed = 0
+        self.hits = 0
+
+    @staticmethod
+    def _key(term):
+        left, op, right = term
+        if not isinstance(right, str):
+            right = float(right)
+        return left, op, right
+
+    def term(self, term):
+        """比較1つのビットマスク（packbits 済みの uint8 配列）"""
+        key = self._key(term)
+        packed = self.cache.get(key)
+        if packed is not None:
+            self.hits += 1
+            return packed
+        left, op, right = key
+        values = np.asarray(self.columns[left])
+        other = np.asarray(self.columns[right]) if isinstance(right, str) else right
+        packed = np.packbits(OPS[op](values, other))
+        self.cache[key] = packed
+        self.computed += 1
+        return packed
+
+    def mask(self, terms):
+        """比較の AND（packbits 済み）"""
+        terms = list(terms)
+        packed = self.term(terms[0]).copy()
+        for term in terms[1:]:
+            np.bitwise_and(packed, self.term(term), out=packed)
+        return packed
+
+    def unpack(self, packed):
+        return np.unpackbits(packed, count=self.n).view(bool)
+
+    def signal(self, buy_terms, sell_terms, dtype=np.int8):
+        """買いの条件がすべて成り立てば 1、売りなら -1、どちらでもなければ 0（add_signal と同じく売りが後）"""
+        signal = np.zeros(self.n, dtype=dtype)
+        signal[self.unpack(self.mask(buy_terms))] = 1
+        signal[self.unpack(self.mask(sell_terms))] = -1
+        return signal
+
+    def report(self):
+        """覚えているマスクの数・計算した回数・使い回した回数・メモリ"""
+        return {
+            'terms': len(self.cache),
+            'computed': self.computed,
+            'hits': self.hits,
+            'bytes': sum(packed.nbytes for packed in self.cache.values()),
+        }
+
+
+#=========================================================
+#signal_masks.py（シグナル条件ごとのビットマスクキャッシュ）
+#=========================================================
+
+#使い方
+#from signal_masks import SignalMasks, trend_pullback_terms
+#masks = SignalMasks(df)      ← add_indicators 済みの df（BarWindow や配列の dict でもよい）
+#for slope in [1.0, 2.0, 3.0]:
+#    for adx in [20, 25, 30]:
+#        df['signal'] = masks.signal(*trend_pullback_terms(slope * PIPS_UNIT, adx))
+#        ...
+#print(masks.report())        ← {'terms': 14, 'computed': 14, 'hits': 94, 'bytes': ...}
+#EMA の並び・押し目・DI の向きは最初の1回だけ計算され、あとは傾きと ADX のしきい値ごとに1回ずつ
+
+#自分で条件を足すときは (左の列名, 演算子, 右の列名 or 数値)
+#masks.signal(buy_terms + [('ATR', '>', 0.05)], sell_terms + [('ATR', '>', 0.05)])
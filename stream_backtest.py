@@ -0,0 +1,539 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from fx_backtest import ATR_PERIOD, add_adx_from_smooth, add_signal, add_target_pos
+from ohlc_loader import OHLC_COLUMNS, detect_csv_format, frame_from_raw, sniff_time_format, usecols_for
+
+# ==========================================
+# 【ストリーミング・バックテスト】
+# CSVをチャンク（例: 10万行）ずつ読み、インジケータの状態をチャンクの境目で引き継いで、
+# シミュレーターに1本ずつ流す。メモリに載るのは常に1チャンク分だけ。
+#
+# 結果はメモリ上で計算する場合（fx_backtest）と1ビットも違わない:
+#   - EMA は pandas の ewm(adjust=False) と同じ漸化式
+#   - rolling の sum/mean は pandas と同じ「カハン加算 + 同値連続の補正」を1本ずつ再現
+# ==========================================
+
+DEFAULT_CHUNKSIZE = 100_000
+
+
+# ------------------------------------------
+# 1. チャンク読み込み
+# ------------------------------------------
+
+def iter_ohlc_chunks(path, chunksize=DEFAULT_CHUNKSIZE, encoding=None, time_format=None):
+    """
+    load_ohlc と同じ形（DatetimeIndex + OHLC）のDataFrameをチャンクごとに返すジェネレータ
+    <TIME> の桁数（HHMM / HHMMSS）はチャンクの大きさに関係なく、load_ohlc・bar_cache と同じ
+    先頭 TIME_SAMPLE_ROWS 行で1回だけ判定し、全チャンクをそれで読む
+    （最初のチャンクだけで決めると、小さいチャンクの HHMMSS が全部 2359 以下で HHMM と誤判定される）
+    """
+    fmt = detect_csv_format(path, encoding)
+    if time_format is None:
+        time_format = sniff_time_format(path, fmt)
+    reader = pd.read_csv(path, header=0, encoding=fmt['encoding'], usecols=usecols_for(fmt), chunksize=chunksize)
+
+    for raw in reader:
+        chunk = frame_from_raw(raw, fmt, time_format)
+        if len(chunk):
+            yield chunk
+
+
+# ------------------------------------------
+# 2. 状態を持つインジケータ（pandas と同じ計算順序）
+# ------------------------------------------
+
+class EwmState:
+    """Series.ewm(span=span, adjust=False).mean() を続きから計算する"""
+
+    def __init__(self, span):
+        com = (span - 1) / 2.0
+        self.alpha = 1.0 / (1.0 + com)
+        self.old_wt_factor = 1.0 - self.alpha
+        self.weighted = None
+        self.old_wt = 1.0
+
+    def update(self, values):
+        alpha, factor = self.alpha, self.old_wt_factor
+        weighted, old_wt = self.weighted, self.old_wt
+        out = np.empty(len(values))
+
+        for i, cur in enumerate(values.tolist()):
+            if weighted is None:
+                weighted = cur
+            elif weighted == weighted:
+                old_wt *= factor
+                if cur == cur:
+                    # pandas と同じく、同じ値が続くときは更新しない（丸め誤差対策）
+                    if weighted != cur:
+                        weighted = old_wt * weighted + alpha * cur
+                        weighted /= (old_wt + alpha)
+                    old_wt = 1.0
+            elif cur == cur:
+                weighted = cur
+            out[i] = weighted
+
+        self.weighted, self.old_wt = weighted, old_wt
+        return out
+
+
+class RollingState:
+    """
+    Series.rolling(window).sum() / .mean() を続きから計算する
+    pandas は「足す側」と「引く側」で別々の補正項を持つカハン加算をしているので、それをそのまま再現する
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.tail = []          # 前のチャンクの最後の window 本（窓から外す値として使う）
+        self.tail_neg = []
+        self.nobs = 0
+        self.neg_ct = 0
+        self.sum_x = 0.0
+        self.comp_add = 0.0
+        self.comp_remove = 0.0
+        self.num_same = 0
+        self.prev_value = None
+
+    def update(self, values, want_sum=False, want_mean=False):
+        """values: float の numpy配列。戻り値: (sum配列 or None, mean配列 or None)"""
+        window = self.window
+        nobs, neg_ct, sum_x = self.nobs, self.neg_ct, self.sum_x
+        comp_add, comp_remove = self.comp_add, self.comp_remove
+        num_same, prev_value = self.num_same, self.prev_value
+
+        new_vals = values.tolist()
+        new_neg = np.signbit(values).tolist()
+        if prev_value is None and new_vals:
+            prev_value = new_vals[0]
+
+        # 窓から外れる値は「前のチャンクの残り + 今のチャンク」から順に取り出す
+        vals = self.tail + new_vals
+        negs = self.tail_neg + new_neg
+        offset = len(self.tail)
+
+        sums = []
+        means = []
+        nan = math.nan
+
+        for i in range(offset, len(vals)):
+            # 窓から外れる値を引く（pandas と同じく、足す前に引く）
+            if i >= window:
+                old = vals[i - window]
+                if old == old:
+                    nobs -= 1
+                    y = -old - comp_remove
+                    t = sum_x + y
+                    comp_remove = t - sum_x - y
+                    sum_x = t
+                    if negs[i - window]:
+                        neg_ct -= 1
+
+            val = vals[i]
+            if val == val:
+                nobs += 1
+                y = val - comp_add
+                t = sum_x + y
+                comp_add = t - sum_x - y
+                sum_x = t
+                if negs[i]:
+                    neg_ct += 1
+                if val == prev_value:
+                    num_same += 1
+                else:
+                    num_same = 1
+                prev_value = val
+
+            if nobs >= window:
+                if want_sum:
+                    sums.append(prev_value * nobs if num_same >= nobs else sum_x)
+                if want_mean:
+                    if num_same >= nobs:
+                        result = prev_value
+                    else:
+                        result = sum_x / nobs
+                        if neg_ct == 0 and result < 0:
+                            result = 0.0
+                        elif neg_ct == nobs and result > 0:
+                            result = 0.0
+                    means.append(result)
+            else:
+                if want_sum:
+                    sums.append(nan)
+                if want_mean:
+                    means.append(nan)
+
+        self.tail = vals[-window:]
+        self.tail_neg = negs[-window:]
+        self.nobs, self.neg_ct, self.sum_x = nobs, neg_ct, sum_x
+        self.comp_add, self.comp_remove = comp_add, comp_remove
+        self.num_same, self.prev_value = num_same, prev_value
+        return (np.array(sums, dtype='float64') if want_sum else None,
+                np.array(means, dtype='float64') if want_mean else None)
+
+
+class IndicatorStream:
+    """
+    fx_backtest.add_indicators と同じ列（EMA・ATR・ADX）をチャンクごとに計算する
+    前のチャンクの最終足（High/Low/Close）・EMA_long の直近5本・rolling の状態を引き継ぐ
+    """
+
+    SLOPE_LAG = 5
+
+    def __init__(self, atr_period=ATR_PERIOD, need_adx=True):
+        self.need_adx = need_adx
+        self.ema_short = EwmState(20)
+        self.ema_long = EwmState(80)
+        self.ema_trend = EwmState(200)
+        self.ema_long_tail = np.full(self.SLOPE_LAG, np.nan)
+        self.prev_hlc = (np.nan, np.nan, np.nan)
+        self.tr_roll = RollingState(atr_period)
+        self.plus_roll = RollingState(atr_period)
+        self.minus_roll = RollingState(atr_period)
+        self.dx_roll = RollingState(atr_period)
+
+    def update(self, chunk):
+        df = chunk.copy()
+        close = df['Close'].to_numpy(dtype='float64')
+
+        df['EMA_short'] = self.ema_short.update(close)
+        ema_long = self.ema_long.update(close)
+        df['EMA_long'] = ema_long
+        df['EMA_trend'] = self.ema_trend.update(close)
+
+        # diff(5): 前のチャンクの最後の5本をつなげてから引き算する
+        joined = np.concatenate([self.ema_long_tail, ema_long])
+        df['EMA_slope'] = joined[self.SLOPE_LAG:] - joined[:-self.SLOPE_LAG]
+        self.ema_long_tail = joined[-self.SLOPE_LAG:]
+
+        if self.need_adx:
+            self._add_atr_adx(df)
+
+        return df
+
+    def _add_atr_adx(self, df):
+        high = df['High'].to_numpy(dtype='float64')
+        low = df['Low'].to_numpy(dtype='float64')
+        close = df['Close'].to_numpy(dtype='float64')
+
+        # shift(1) の代わりに、前のチャンクの最終足を先頭につなげる
+        prev_high = np.concatenate([[self.prev_hlc[0]], high[:-1]])
+        prev_low = np.concatenate([[self.prev_hlc[1]], low[:-1]])
+        prev_close = np.concatenate([[self.prev_hlc[2]], close[:-1]])
+        self.prev_hlc = (high[-1], low[-1], close[-1])
+
+        tr = np.maximum(high - low, np.maximum(abs(high - prev_close), abs(low - prev_close)))
+        with np.errstate(invalid='ignore'):
+            plus_dm = np.where((high - prev_high) > (prev_low - low), np.maximum(high - prev_high, 0), 0)
+            minus_dm = np.where((prev_low - low) > (high - prev_high), np.maximum(prev_low - low, 0), 0)
+        plus_dm = plus_dm.astype('float64')
+        minus_dm = minus_dm.astype('float64')
+
+        tr_sum, atr = self.tr_roll.update(tr, want_sum=True, want_mean=True)
+        plus_sum, _ = self.plus_roll.update(plus_dm, want_sum=True)
+        minus_sum, _ = self.minus_roll.update(minus_dm, want_sum=True)
+
+        df['TR'] = tr
+        df['ATR'] = atr
+        df['PlusDM'] = plus_dm
+        df['MinusDM'] = minus_dm
+        df['TR_smooth'] = tr_sum
+        df['PlusDM_smooth'] = plus_sum
+        df['MinusDM_smooth'] = minus_sum
+        with np.errstate(invalid='ignore', divide='ignore'):
+            add_adx_from_smooth(df)
+        _, adx = self.dx_roll.update(df['DX'].to_numpy(dtype='float64'), want_mean=True)
+        df['ADX'] = adx
+        return df
+
+
+# ------------------------------------------
+# 3. 1本ずつ進めるシミュレーター
+# ------------------------------------------
+
+class BacktestStream:
+    """
+    fx_backtest.run_backtest（forex-tester5min.py）を1本ずつ進める形にしたもの
+    必要なのは「1本前のシグナルとATR」と「今の足のOHLC」だけ
+    """
+
+    def __init__(self, pips_unit, pip_value_jpy, spread_pips=1.0,
+                 sl_atr_multiplier=1.5, tp_atr_multiplier=3.0,
+                 risk_percent=0.01, initial_capital=100000, max_lots=10.0):
+        self.pips_unit = pips_unit
+        self.pip_value_jpy = pip_value_jpy
+        self.spread_pips = spread_pips
+        self.sl_atr_multiplier = sl_atr_multiplier
+        self.tp_atr_multiplier = tp_atr_multiplier
+        self.risk_percent = risk_percent
+        self.max_lots = max_lots
+
+        self.balance = initial_capital
+        self.history = [initial_capital]
+        self.trades = []
+        self.finished = False
+
+        self.i = 0
+        self.prev_signal = 0
+        self.prev_atr = np.nan
+        self.curr_pos = 0
+        self.entry_price = 0
+        self.entry_time = None
+        self.entry_sl_pips = 0
+        self.entry_tp_pips = 0
+        self.lots = 0
+
+    def feed(self, chunk):
+        """シグナル・ATR付きのチャンクを1本ずつ処理する"""
+        times = chunk.index.asi8
+        opens = chunk['Open'].to_numpy()
+        highs = chunk['High'].to_numpy()
+        lows = chunk['Low'].to_numpy()
+        signals = chunk['signal'].to_numpy()
+        atrs = chunk['ATR'].to_numpy()
+
+        pips_unit, pip_value = self.pips_unit, self.pip_value_jpy
+
+        for k in range(len(chunk)):
+            if self.finished:
+                return
+            i = self.i
+            self.i += 1
+            prev_signal, prev_atr = self.prev_signal, self.prev_atr
+            self.prev_signal, self.prev_atr = signals[k], atrs[k]
+            if i < 2:
+                continue
+
+            # エントリー
+            if self.curr_pos == 0 and prev_signal != 0:
+                if np.isnan(prev_atr):
+                    continue
+
+                sl_pips = prev_atr * self.sl_atr_multiplier / pips_unit
+                tp_pips = prev_atr * self.tp_atr_multiplier / pips_unit
+
+                risk_amount = self.balance * self.risk_percent
+                lots = risk_amount / (sl_pips * pip_value)
+                if lots > self.max_lots:
+                    lots = self.max_lots
+                self.lots = lots
+
+                if lots > 0.01:
+                    self.curr_pos = prev_signal
+                    self.entry_price = opens[k]
+                    self.entry_time = times[k]
+                    self.entry_sl_pips = sl_pips
+                    self.entry_tp_pips = tp_pips
+
+            # 決済
+            curr_pos = self.curr_pos
+            if curr_pos != 0:
+                entry_price = self.entry_price
+                exit_price = 0
+                reason = ""
+                if curr_pos == 1:
+                    sl_price = entry_price - (self.entry_sl_pips * pips_unit)
+                    tp_price = entry_price + (self.entry_tp_pips * pips_unit)
+
+                    if lows[k] <= sl_price:
+                        exit_price = sl_price
+                        reason = "SL"
+                    elif highs[k] >= tp_price:
+                        exit_price = tp_price
+                        reason = "TP"
+                    elif prev_signal == -1:
+                        exit_price = opens[k]
+                        reason = "Reverse"
+                else:
+                    sl_price = entry_price + (self.entry_sl_pips * pips_unit)
+                    tp_price = entry_price - (self.entry_tp_pips * pips_unit)
+
+                    if highs[k] >= sl_price:
+                        exit_price = sl_price
+                        reason = "SL"
+                    elif lows[k] <= tp_price:
+                        exit_price = tp_price
+                        reason = "TP"
+                    elif prev_signal == 1:
+                        exit_price = opens[k]
+                        reason = "Reverse"
+
+                if exit_price != 0:
+                    pips_diff = (exit_price - entry_price) * curr_pos / pips_unit
+                    net_pips = pips_diff - self.spread_pips
+                    profit_yen = net_pips * pip_value * self.lots
+
+                    self.balance += profit_yen
+                    self.trades.append({
+                        'entry_time': pd.Timestamp(self.entry_time), 'exit_time': pd.Timestamp(times[k]),
+                        'type': 'BUY' if curr_pos == 1 else 'SELL',
+                        'pips': net_pips, 'profit': profit_yen, 'balance': self.balance, 'reason': reason
+                    })
+                    self.curr_pos = 0
+                    self.history.append(self.balance)
+                    if self.balance <= 0:
+                        self.finished = True
+
+    def result(self):
+        return pd.DataFrame(self.trades), self.history
+
+
+class SimulationFinalStream:
+    """fx_backtest.run_simulation_final（USDJPY,EURUSD,GBPUSD_M5.py）を1本ずつ進める形にしたもの"""
+
+    def __init__(self, sl_pips, spread_pips, pips_unit, pip_val_1lot, cap, risk, max_lot):
+        self.sl_pips = sl_pips
+        self.spread_pips = spread_pips
+        self.pips_unit = pips_unit
+        self.pip_val_1lot = pip_val_1lot
+        self.risk = risk
+        self.max_lot = max_lot
+
+        self.balance = cap
+        self.history = [cap]
+        self.trades = []
+        self.finished = False
+
+        self.curr_pos = 0
+        self.current_lot = 0
+        self.entry_price = 0
+        self.entry_time = None
+
+    def feed(self, chunk):
+        times = chunk.index.asi8
+        closes = chunk['Close'].to_numpy()
+        highs = chunk['High'].to_numpy()
+        lows = chunk['Low'].to_numpy()
+        targets = chunk['target_pos'].to_numpy()
+
+        sl_pips, spread_pips, pips_unit = self.sl_pips, self.spread_pips, self.pips_unit
+
+        for k in range(len(chunk)):
+            if self.balance <= 0:
+                self.finished = True
+                return
+
+            target = targets[k]
+            curr_pos = self.curr_pos
+
+            # --- A. ポジション保有中の処理 ---
+            if curr_pos != 0:
+                exit_executed = False
+                net_pips = 0
+                exit_price = 0
+                entry_price = self.entry_price
+
+                if curr_pos == 1:
+                    sl_price = entry_price - (sl_pips * pips_unit)
+                    if lows[k] <= sl_price:
+                        exit_price = sl_price
+                        net_pips = -(sl_pips + spread_pips)
+                        exit_executed = True
+                else:
+                    sl_price = entry_price + (sl_pips * pips_unit)
+                    if highs[k] >= sl_price:
+                        exit_price = sl_price
+                        net_pips = -(sl_pips + spread_pips)
+                        exit_executed = True
+
+                if not exit_executed and target != curr_pos:
+                    exit_price = closes[k]
+                    raw_pips = (exit_price - entry_price) * curr_pos / pips_unit
+                    net_pips = raw_pips - spread_pips
+                    exit_executed = True
+
+                if exit_executed:
+                    trade_profit_yen = net_pips * self.pip_val_1lot * self.current_lot
+                    self.balance += trade_profit_yen
+
+                    self.trades.append({
+                        'entry_time': pd.Timestamp(self.entry_time), 'exit_time': pd.Timestamp(times[k]),
+                        'entry_price': entry_price, 'exit_price': exit_price,
+                        'side': 'BUY' if curr_pos == 1 else 'SELL',
+                        'profit_pips': net_pips, 'profit_yen': trade_profit_yen,
+                        'balance': self.balance
+                    })
+
+                    self.curr_pos = 0
+                    self.history.append(self.balance)
+                    continue
+
+            # --- B. 新規エントリー判定 ---
+            if self.curr_pos == 0 and target != 0:
+                risk_amount = self.balance * self.risk
+                current_lot = risk_amount / ((sl_pips + spread_pips) * self.pip_val_1lot)
+                if current_lot > self.max_lot: current_lot = self.max_lot
+                self.current_lot = current_lot
+
+                if current_lot > 0:
+                    self.entry_price = closes[k]
+                    self.entry_time = times[k]
+                    self.curr_pos = target
+
+    def result(self):
+        return pd.DataFrame(self.trades), self.history
+
+
+# ------------------------------------------
+# 4. パイプライン（読み込み → 指標 → シグナル → シミュレーター）
+# ------------------------------------------
+
+def iter_forex_tester_signals(path, slope_thresh, chunksize=DEFAULT_CHUNKSIZE, atr_period=ATR_PERIOD, **loader_kwargs):
+    """forex-tester5min.py の指標とシグナルを付けたチャンクを順に返す"""
+    indicators = IndicatorStream(atr_period)
+    for chunk in iter_ohlc_chunks(path, chunksize, **loader_kwargs):
+        yield add_signal(indicators.update(chunk), slope_thresh)
+
+
+def iter_target_pos(path, slope_threshold, chunksize=DEFAULT_CHUNKSIZE, **loader_kwargs):
+    """USDJPY,EURUSD,GBPUSD_M5.py の target_pos を付けたチャンクを順に返す"""
+    indicators = IndicatorStream(need_adx=False)
+    for chunk in iter_ohlc_chunks(path, chunksize, **loader_kwargs):
+        yield add_target_pos(indicators.update(chunk), slope_threshold)
+
+
+def run_backtest_stream(path, pips_unit, pip_value_jpy, slope_thresh, chunksize=DEFAULT_CHUNKSIZE,
+                        loader_kwargs=None, **backtest_kwargs):
+    """
+    run_backtest のストリーミング版
+    結果（trade_df, history）は load_ohlc → add_indicators → add_signal → run_backtest と完全に同じ
+    """
+    sim = BacktestStream(pips_unit, pip_value_jpy, **backtest_kwargs)
+    for chunk in iter_forex_tester_signals(path, slope_thresh, chunksize, **(loader_kwargs or {})):
+        sim.feed(chunk)
+        if sim.finished:
+            break
+    return sim.result()
+
+
+def run_simulation_stream(path, sl_pips, spread_pips, pips_unit, pip_val_1lot, cap, risk, max_lot,
+                          slope_threshold, chunksize=DEFAULT_CHUNKSIZE, loader_kwargs=None):
+    """run_simulation_final のストリーミング版"""
+    sim = SimulationFinalStream(sl_pips, spread_pips, pips_unit, pip_val_1lot, cap, risk, max_lot)
+    for chunk in iter_target_pos(path, slope_threshold, chunksize, **(loader_kwargs or {})):
+        sim.feed(chunk)
+        if sim.finished:
+            break
+    return sim.result()
+
+
+if __name__ == "__main__":
+    path = r'C:\market_data\USDJPY_M5.csv'
+
+    trade_df, history = run_backtest_stream(path, pips_unit=0.01, pip_value_jpy=1000, slope_thresh=2.0 * 0.01)
+    print(trade_df.tail())
+    print(f"最終残高: {int(history[-1]):,} 円")
+
+
+#=========================================================
+#stream_backtest.py（メモリに載らない大きさのCSVでバックテスト）
+#=========================================================
+
+#使い方
+#from stream_backtest import run_backtest_stream, run_simulation_stream
+#trade_df, history = run_backtest_stream(path, pips_unit=0.01, pip_value_jpy=1000, slope_thresh=0.02)
+
+#チャンクの大きさ（chunksize）を変えても結果は同じ。メモリ使用量だけが変わる
+#CSVが何GBあっても、メモリに載るのは chunksize 行 + トレード履歴だけ
@@ -0,0 +1,208 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from exit_engine import run_backtest_vectorized
+from fx_backtest import ATR_PERIOD, add_indicators
+from memmap_store import BarWindow
+from shared_arrays import SharedArrays, attach
+from signal_masks import SignalMasks, trend_pullback_terms
+
+# ==========================================
+# 【forex-tester5min.py のパラメータスイープ（共有メモリ + プロセスプール）】
+# SL_ATR_MULTIPLIER / TP_ATR_MULTIPLIER / SLOPE_THRESH_PIPS / ADX のしきい値を書き換えては
+# forex-tester5min.py を回し直す代わりに、全組み合わせをまとめて回す
+#   - 指標（EMA / ATR / ADX / DI）はパラメータに関係ないので親プロセスで1回だけ計算する
+#   - それを共有メモリ（shared_arrays）に1回だけ置く。タスクに渡すのはパラメータの行だけ（フレームは pickle しない）
+#   - ワーカーは signal_masks で条件ごとのビットマスクを覚えておき、シグナルはその AND で作る
+#     （EMAの並び・押し目・DIの向きは1回だけ、傾き・ADX はしきい値ごとに1回だけ計算される）
+#   - できたシグナルで exit_engine.run_backtest_vectorized を回す
+#   - 組み合わせは chunk 個ずつタスクにして、終わった順に1行ずつ結果表に流す
+# ==========================================
+
+PARAM_COLUMNS = ['sl_atr_multiplier', 'tp_atr_multiplier', 'slope_thresh_pips', 'adx_thresh']
+METRIC_COLUMNS = ['trades', 'win_rate', 'profit_factor', 'max_dd', 'final_balance', 'avg_pips']
+CHUNK_COMBOS = 8
+
+# ワーカーに渡す列（exit_engine が使う列 + シグナルの条件に出てくる列）
+INDICATOR_COLUMNS = ['Open', 'High', 'Low', 'Close', 'ATR', 'EMA_short', 'EMA_long', 'EMA_trend',
+                     'EMA_slope', 'ADX', 'PlusDI', 'MinusDI']
+
+
+def make_grid(sl_atr_multiplier, tp_atr_multiplier, slope_thresh_pips, adx_thresh=(25,)):
+    """各パラメータの候補リストから全組み合わせの DataFrame を作る（列は PARAM_COLUMNS）"""
+    rows = list(itertools.product(sl_atr_multiplier, tp_atr_multiplier, slope_thresh_pips, adx_thresh))
+    return pd.DataFrame(rows, columns=PARAM_COLUMNS, dtype='float64')
+
+
+def prepare_arrays(df, atr_period=ATR_PERIOD):
+    """
+    OHLC の DataFrame から、ワーカーが使う配列だけを作る（パラメータに関係ない指標はここで全部済ませる）
+    """
+    ind = add_indicators(df[['Open', 'High', 'Low', 'Close']].copy(), atr_period)
+    arrays = {'times': np.asarray(df.index.as_unit('ns').asi8)}
+    for name in INDICATOR_COLUMNS:
+        arrays[name] = ind[name].to_numpy('float64')
+    return arrays
+
+
+def summarize_trades(trade_df, history):
+    """show_report（forex-tester5min.py）と同じ指標を dict で返す"""
+    if trade_df.empty:
+        return {'trades': 0, 'win_rate': np.nan, 'profit_factor': np.nan,
+                'max_dd': 0.0, 'final_balance': history[-1], 'avg_pips': np.nan}
+    pos_profit = trade_df.loc[trade_df['profit'] > 0, 'profit'].sum()
+    neg_profit = abs(trade_df.loc[trade_df['profit'] <= 0, 'profit'].sum())
+    balance = np.asarray(history)
+    return {
+        'trades': len(trade_df),
+        'win_rate': (trade_df['pips'] > 0).mean() * 100,
+        'profit_factor': pos_profit / neg_profit if neg_profit != 0 else float('inf'),
+        'max_dd': (np.maximum.accumulate(balance) - balance).max(),
+        'final_balance': history[-1],
+        'avg_pips': trade_df['pips'].mean(),
+    }
+
+
+def evaluate_combo(arrays, params, backtest_kwargs, masks=None):
+    """
+    1組み合わせを回す
+    params … PARAM_COLUMNS の dict / backtest_kwargs … pips_unit・pip_value_jpy など run_backtest_vectorized の残りの引数
+    masks  … SignalMasks（組み合わせをまたいで使い回すと、変わったしきい値の比較だけ計算される）
+    """
+    if masks is None:
+        masks = SignalMasks(arrays)
+    slope_thresh = params['slope_thresh_pips'] * backtest_kwargs['pips_unit']
+    signal = masks.signal(*trend_pullback_terms(slope_thresh, params['adx_thresh']))
+
+    window = BarWindow(arrays['times'], {name: arrays[name] for name in ('Open', 'High', 'Low', 'ATR')})
+    window['signal'] = signal
+    trade_df, history = run_backtest_vectorized(
+        window, sl_atr_multiplier=params['sl_atr_multiplier'],
+        tp_atr_multiplier=params['tp_atr_multiplier'], **backtest_kwargs)
+    return summarize_trades(trade_df, history)
+
+
+# ------------------------------------------
+# ワーカー
+# ------------------------------------------
+
+_worker_arrays = None
+_worker_masks = None
+
+
+def _init_worker(specs):
+    global _worker_arrays, _worker_masks
+    _worker_arrays = attach(specs)
+    _worker_masks = SignalMasks(_worker_arrays)
+
+
+def _run_chunk(combos, backtest_kwargs):
+    return _evaluate_chunk(_worker_arrays, combos, backtest_kwargs, _worker_masks)
+
+
+def _evaluate_chunk(arrays, combos, backtest_kwargs, masks):
+    rows = []
+    for combo, params in combos:
+        row = {'combo': combo, **params}
+        row.update(evaluate_combo(arrays, params, backtest_kwargs, masks))
+        rows.append(row)
+    return rows
+
+
+# ------------------------------------------
+# スイープ本体
+# ------------------------------------------
+
+def iter_sweep(df, params, pips_unit, pip_value_jpy, spread_pips=1.0, risk_percent=0.01,
+               initial_capital=100000, max_lots=10.0, atr_period=ATR_PERIOD,
+               workers=None, chunk=CHUNK_COMBOS):
+    """
+    組み合わせごとの結果 dict を、終わった順に1つずつ返すジェネレータ（combo = params の行番号）
+    df     … Open / High / Low / Close を持つ DataFrame（load_ohlc_cached の戻り値そのまま）
+    params … PARAM_COLUMNS を持つ DataFrame（make_grid の戻り値など）
+    workers=1 ならプールを使わずこのプロセスで回す
+    """
+    arrays = prepare_arrays(df, atr_period)
+    backtest_kwargs = {'pips_unit': pips_unit, 'pip_value_jpy': pip_value_jpy, 'spread_pips': spread_pips,
+                       'risk_percent': risk_percent, 'initial_capital': initial_capital, 'max_lots': max_lots}
+    combos = list(enumerate(params[PARAM_COLUMNS].to_dict('records')))
+    chunks = [combos[k:k + chunk] for k in range(0, len(combos), chunk)]
+
+    if workers == 1:
+        masks = SignalMasks(arrays)
+        for part in chunks:
+            yield from _evaluate_chunk(arrays, part, backtest_kwargs, masks)
+        return
+
+    with SharedArrays(arrays) as shared:
+        del arrays
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(shared.specs,)) as pool:
+            futures = [pool.submit(_run_chunk, part, backtest_kwargs) for part in chunks]
+            for future in as_completed(futures):
+                yield from future.result()
+
+
+def run_sweep(df, params, pips_unit, pip_value_jpy, out_path=None, progress=True, **kwargs):
+    """
+    iter_sweep の結果を1つの表にまとめる（行は params の順、index = combo）
+    out_path … 指定すると1組み合わせ終わるごとに CSV に追記する（途中で止めてもそこまでの結果が残る）
+    kwargs   … iter_sweep の残りの引数（spread_pips / risk_percent / workers など）
+    """
+    if out_path is not None and os.path.exists(out_path):
+        os.remove(out_path)
+
+    rows = []
+    for row in iter_sweep(df, params, pips_unit, pip_value_jpy, **kwargs):
+        rows.append(row)
+        if out_path is not None:
+            pd.DataFrame([row]).to_csv(out_path, mode='a', header=len(rows) == 1, index=False)
+        if progress:
+            print(f"\r{len(rows)}/{len(params)} 組み合わせ完了", end='', flush=True)
+    if progress:
+        print()
+
+    columns = ['combo'] + PARAM_COLUMNS + METRIC_COLUMNS
+    return pd.DataFrame(rows, columns=columns).set_index('combo').sort_index()
+
+
+if __name__ == "__main__":
+    import time
+
+    from bar_cache import load_ohlc_cached
+    from instruments import instrument_for_path
+
+    file_path = r'C:\market_data\USDJPY_M15.csv'
+    df = load_ohlc_cached(file_path)
+    inst = instrument_for_path(file_path)
+
+    grid = make_grid(sl_atr_multiplier=[1.0, 1.5, 2.0], tp_atr_multiplier=[2.0, 3.0, 4.0],
+                     slope_thresh_pips=[1.0, 2.0, 3.0], adx_thresh=[20, 25, 30])
+
+    # プールはこのファイルを読み直すので、必ず if __name__ == "__main__": の中で呼ぶ（Windows）
+    t0 = time.perf_counter()
+    result = run_sweep(df, grid, inst['pip_size'], inst['pip_value_jpy'], out_path='sweep_result.csv')
+    print(result.sort_values('final_balance', ascending=False).head(20))
+    print(f"{len(grid)} 組み合わせ: {time.perf_counter() - t0:.1f} 秒")
+
+
+#=========================================================
+#sweep.py（SL/TP倍率・傾き・ADX のパラメータスイープ）
+#=========================================================
+
+#使い方
+#from sweep import make_grid, run_sweep
+#grid = make_grid(sl_atr_multiplier=[1.0, 1.5, 2.0], tp_atr_multiplier=[2.0, 3.0],
+#                 slope_thresh_pips=[1.0, 2.0], adx_thresh=[20, 25])
+#result = run_sweep(df, grid, PIPS_UNIT, PIP_VALUE_JPY, spread_pips=SPREAD_PIPS,
+#                   risk_percent=RISK_PERCENT, initial_capital=INITIAL_CAPITAL, max_lots=MAX_LOTS)
+#result.sort_values('profit_factor', ascending=False)
+
+#1行の結果は forex-tester5min.py の show_report と同じ値（trades / win_rate / profit_factor / max_dd / final_balance / avg_pips）
+#out_path='sweep.csv' で1組み合わせごとに CSV に追記される（長いスイープを途中で止めても結果が残る）
+#結果を自分で受け取りたいときは iter_sweep（終わった順に dict が1つずつ出てくる）
+#workers=1 でプールなし（デバッグ・Jupyter 用）。プールを使うときは if __name__ == "__main__": の中で呼ぶ
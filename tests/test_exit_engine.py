@@ -0,0 +1,45 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exit_engine import run_backtest_vectorized
+from fx_backtest import run_backtest
+
+
+def _random_frame(rng, n):
+    """シグナル・ATR がランダムな足（ところどころ足ごと NaN / ATR だけ NaN）"""
+    close = 150 + np.cumsum(rng.normal(0, 0.05, n))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    high = np.maximum(open_, close) + np.abs(rng.normal(0, 0.04, n))
+    low = np.minimum(open_, close) - np.abs(rng.normal(0, 0.04, n))
+    df = pd.DataFrame({
+        'Open': open_, 'High': high, 'Low': low, 'Close': close,
+        'ATR': np.abs(rng.normal(0.05, 0.02, n)) + 0.005,
+        'signal': rng.choice([-1, 0, 0, 0, 1], n),
+    }, index=pd.date_range('2024-01-02', periods=n, freq='5min'))
+    df.loc[rng.random(n) < 0.03, ['Open', 'High', 'Low', 'Close']] = np.nan
+    df.loc[rng.random(n) < 0.05, 'ATR'] = np.nan
+    return df
+
+
+@pytest.mark.parametrize('block_size', [1, 4, 256])
+def test_vectorized_matches_loop_on_random_frames(block_size):
+    rng = np.random.default_rng(block_size)
+    for _ in range(100):
+        df = _random_frame(rng, int(rng.integers(3, 400)))
+        kwargs = {
+            'spread_pips': float(rng.choice([0.0, 1.0])),
+            'sl_atr_multiplier': float(rng.choice([0.5, 1.5])),
+            'tp_atr_multiplier': float(rng.choice([1.0, 3.0])),
+            'risk_percent': float(rng.choice([0.01, 0.2, 2.0])),
+        }
+        expected_trades, expected_history = run_backtest(df, 0.01, 1000, **kwargs)
+        trades, history = run_backtest_vectorized(df, 0.01, 1000, block_size=block_size, **kwargs)
+
+        pd.testing.assert_frame_equal(trades, expected_trades)
+        np.testing.assert_array_equal(history, expected_history)   # NaN の足で建てた残高は NaN 同士
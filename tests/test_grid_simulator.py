@@ -0,0 +1,57 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fx_backtest import add_emas, add_target_pos, run_simulation_final
+from grid_simulator import make_grid, run_simulation_grid
+
+COSTS = {'spread_pips': 1.0, 'pips_unit': 0.01, 'pip_val_1lot': 1000, 'cap': 100000, 'max_lot': 100}
+
+
+def _random_frame(rng, n):
+    """M5 のランダムウォーク（ところどころ Low が NaN）"""
+    close = 150 + np.cumsum(rng.normal(0, 0.05, n))
+    high = close + np.abs(rng.normal(0, 0.04, n))
+    low = close - np.abs(rng.normal(0, 0.04, n))
+    low[rng.random(n) < 0.02] = np.nan
+    df = pd.DataFrame({'Open': close, 'High': high, 'Low': low, 'Close': close},
+                      index=pd.date_range('2024-01-02', periods=n, freq='5min'))
+    return add_emas(df)
+
+
+def test_grid_matches_run_simulation_final_per_combo():
+    rng = np.random.default_rng(0)
+    # risk=3.0 は SL 1回で残高がマイナスになる（破産した組み合わせ）
+    grid = make_grid(sl_pips=[5, 20], slope_threshold=[0.0, 0.02, 0.05], risk=[0.01, 3.0])
+    for _ in range(10):
+        df = _random_frame(rng, int(rng.integers(300, 1500)))
+        summary, trades = run_simulation_grid(df, grid, **COSTS)
+
+        for combo, row in grid.iterrows():
+            expected, history = run_simulation_final(
+                add_target_pos(df.copy(), row['slope_threshold']),
+                row['sl_pips'], COSTS['spread_pips'], COSTS['pips_unit'], COSTS['pip_val_1lot'],
+                COSTS['cap'], row['risk'], COSTS['max_lot'])
+            got = trades[trades['combo'] == combo].drop(columns='combo').reset_index(drop=True)
+
+            assert summary.loc[combo, 'trades'] == len(expected)
+            assert summary.loc[combo, 'final_balance'] == history[-1]
+            assert summary.loc[combo, 'max_dd'] == (np.maximum.accumulate(history) - history).max()
+            if len(expected):
+                pd.testing.assert_frame_equal(got, expected)
+
+
+def test_grid_without_trades_keeps_dtypes():
+    rng = np.random.default_rng(1)
+    df = _random_frame(rng, 300)
+    summary, trades = run_simulation_grid(df, make_grid([10], [1e9], [0.01]), **COSTS)
+
+    assert len(trades) == 0
+    assert trades['combo'].dtype == np.int64
+    assert trades['profit_yen'].dtype == np.float64
+    assert summary.loc[0, 'trades'] == 0
+    assert summary.loc[0, 'final_balance'] == COSTS['cap']
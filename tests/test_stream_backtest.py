@@ -0,0 +1,51 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fx_backtest import add_indicators, add_signal, run_backtest
+from ohlc_loader import load_ohlc
+from stream_backtest import iter_ohlc_chunks, run_backtest_stream
+
+
+def _write_m1_hhmmss(path, n=3000, seed=0):
+    """HHMMSS 形式の M1 CSV（先頭 24 本は <TIME> が全部 2359 以下になる）"""
+    rng = np.random.default_rng(seed)
+    times = pd.date_range('2024-01-02 00:00', periods=n, freq='1min')
+    close = 150 + np.cumsum(rng.normal(0, 0.02, n))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    high = np.maximum(open_, close) + np.abs(rng.normal(0, 0.01, n))
+    low = np.minimum(open_, close) - np.abs(rng.normal(0, 0.01, n))
+    raw = pd.DataFrame({
+        '<DTYYYYMMDD>': times.strftime('%Y%m%d').astype(int),
+        '<TIME>': times.strftime('%H%M%S').astype(int),
+        '<OPEN>': open_.round(3), '<HIGH>': high.round(3), '<LOW>': low.round(3), '<CLOSE>': close.round(3),
+    })
+    raw.to_csv(path, index=False)
+
+
+def test_small_chunks_read_hhmmss_times(tmp_path):
+    path = str(tmp_path / 'USDJPY_M1.csv')
+    _write_m1_hhmmss(path)
+
+    streamed = pd.concat(iter_ohlc_chunks(path, chunksize=20))
+    expected = load_ohlc(path)
+    pd.testing.assert_frame_equal(streamed, expected)
+    assert streamed.index[1] - streamed.index[0] == pd.Timedelta(minutes=1)
+
+
+def test_stream_backtest_matches_in_memory_with_small_chunks(tmp_path):
+    path = str(tmp_path / 'USDJPY_M1.csv')
+    _write_m1_hhmmss(path)
+    slope = 0.002
+
+    df = add_signal(add_indicators(load_ohlc(path)), slope)
+    expected_trades, expected_history = run_backtest(df, 0.01, 1000)
+    trades, history = run_backtest_stream(path, 0.01, 1000, slope, chunksize=20)
+
+    assert len(expected_trades) > 0
+    pd.testing.assert_frame_equal(trades, expected_trades)
+    assert history == expected_history
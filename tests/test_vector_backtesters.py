@@ -0,0 +1,63 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'Algorithmic Trading Book'))
+
+from MomVectorBacktester import MomVectorBacktester
+from MRVectorBacktester import MRVectorBacktester
+
+
+def _backtester(cls, rng, n, decimals, tc):
+    """CSV を読まずに self.data（price / return）だけを持たせたバックテスタ"""
+    price = 100 + np.cumsum(rng.normal(0, 0.05, n + 1))
+    if decimals is not None:
+        price = price.round(decimals)
+    data = pd.DataFrame({'price': price}, index=pd.date_range('2024-01-02', periods=n + 1, freq='D'))
+    data['return'] = np.log(data['price'] / data['price'].shift(1))
+
+    bt = cls.__new__(cls)
+    bt.amount = 10000
+    bt.tc = tc
+    bt.results = None
+    bt.many_results = {}
+    bt.data = data.dropna()
+    return bt
+
+
+@pytest.mark.parametrize('decimals', [2, 3, None])
+def test_run_many_matches_run_strategy(decimals):
+    rng = np.random.default_rng(0 if decimals is None else decimals)
+    for _ in range(10):
+        bt = _backtester(MomVectorBacktester, rng, int(rng.integers(50, 400)), decimals,
+                         float(rng.choice([0.0, 0.001])))
+        momenta = range(1, 41)
+        table = bt.run_many(momenta)
+        for m in momenta:
+            aperf, operf = bt.run_strategy(momentum=m)
+            assert table.loc[m, 'aperf'] == aperf
+            assert table.loc[m, 'operf'] == operf
+
+
+def test_run_grid_matches_run_strategy():
+    rng = np.random.default_rng(0)
+    for _ in range(10):
+        n = int(rng.integers(30, 300))
+        bt = _backtester(MRVectorBacktester, rng, n, 3, float(rng.choice([0.0, 0.001])))
+        smas = [2, 5, 10, 25]
+        thresholds = [0.0, 0.02, 0.1, 0.5]
+        # n より長い SMA は run_strategy だと結果が空で IndexError、run_grid では NaN
+        table = bt.run_grid(smas + [n + 5], thresholds)
+        for sma in smas:
+            for thr in thresholds:
+                aperf, operf = bt.run_strategy(SMA=sma, threshold=thr)
+                assert table.loc[(sma, thr), 'aperf'] == aperf
+                assert table.loc[(sma, thr), 'operf'] == operf
+        assert table.loc[n + 5, 'aperf'].isna().all()
+        with pytest.raises(IndexError):
+            bt.run_strategy(SMA=n + 5, threshold=0.1)
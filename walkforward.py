@@ -0,0 +1,290 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from fx_backtest import add_emas
+from grid_simulator import run_simulation_grid
+from shared_arrays import SharedArrays, attach
+
+# ==========================================
+# 【ウォークフォワード最適化】
+# SMAVectorBacktester / MomVectorBacktester / MRVectorBacktester / run_simulation_final は
+# 最適化した期間と同じ期間で成績を見ている（インサンプルのみ）
+# ここでは履歴を「学習期間 → 検証期間」の窓に区切り、
+#   1. 学習期間でパラメータを総当たりして一番良いものを選ぶ
+#   2. そのパラメータで直後の検証期間を回す
+# を窓ごとに行い、検証期間（アウトオブサンプル）だけをつないだ損益曲線を作る
+#   - 窓どうしは独立なので、プロセスプールで同時に回す
+#   - 価格配列は共有メモリに1回だけ置き、ワーカーはそれを読む（窓ごとにコピーを送らない）
+#   - 指標は履歴の最初から検証期間の終わりまでで計算する（過去だけを使うので先読みにはならない）
+# ==========================================
+
+
+# ------------------------------------------
+# 戦略（1本ごとの戦略の対数収益率を、グリッドの順に返す）
+# fn(arrays, grid, stop, **kwargs) → グリッドの組み合わせごとに長さ stop の配列
+# out[i] = i 本目の戦略の対数収益率（i-1 本目までの情報で決めたポジション × i 本目の収益率）
+# ------------------------------------------
+
+def _log_returns(price):
+    ret = np.zeros(len(price))
+    ret[1:] = np.log(price[1:] / price[:-1])
+    return ret
+
+
+def _rolling_mean(values, window):
+    return pd.Series(values).rolling(window).mean().to_numpy()
+
+
+def _strategy_returns(position, ret, tc=0.0):
+    """1本前のポジション × 収益率。ポジションが変わった足で tc を引く（VectorBacktester と同じ）"""
+    out = np.zeros(len(ret))
+    out[1:] = position[:-1] * ret[1:]
+    if tc:
+        out[1:] -= tc * (position[1:] != position[:-1])
+    return out
+
+
+def sma_returns(arrays, grid, stop):
+    """SMAVectorBacktester.run_strategy と同じ（SMA1 > SMA2 なら買い、それ以外は売り）。grid = [(SMA1, SMA2), ...]"""
+    price = arrays['close'][:stop]
+    ret = _log_returns(price)
+    cache = {}
+    for sma1, sma2 in grid:
+        for w in (sma1, sma2):
+            if w not in cache:
+                cache[w] = _rolling_mean(price, w)
+        s1, s2 = cache[sma1], cache[sma2]
+        # NaN との比較は False → -1（run_strategy の np.where と同じ）
+        position = np.where(s1 > s2, 1.0, -1.0)
+        # run_strategy は dropna で両方の SMA が出る足から始まり、その足には1本前の -1 が掛かる
+        # → それより前の足だけ収益率 0 にする（optimize_parameters_grid とも同じ）
+        position[:max(sma1, sma2, 2) - 2] = 0.0
+        yield _strategy_returns(position, ret)
+
+
+def momentum_returns(arrays, grid, stop, tc=0.0):
+    """MomVectorBacktester.run_strategy と同じ（直近 momentum 本の平均リターンの符号）。grid = [(momentum,), ...]"""
+    price = arrays['close'][:stop]
+    ret = _log_returns(price)
+    ret_nan = ret.copy()
+    ret_nan[0] = np.nan
+    for (momentum,) in grid:
+        position = np.nan_to_num(np.sign(_rolling_mean(ret_nan, momentum)))
+        yield _strategy_returns(position, ret, tc)
+
+
+def mean_reversion_returns(arrays, grid, stop, tc=0.0):
+    """MRVectorBacktester.run_strategy と同じ（SMA から threshold 以上離れたら逆張り、SMA を横切ったら手仕舞い）"""
+    price = arrays['close'][:stop]
+    ret = _log_returns(price)
+    for sma, threshold in grid:
+        distance = price - _rolling_mean(price, sma)
+        position = np.where(distance > threshold, -1.0, np.nan)
+        position = np.where(distance < -threshold, 1.0, position)
+        prev = np.r_[np.nan, distance[:-1]]
+        position = np.where(distance * prev < 0, 0.0, position)
+        position = pd.Series(position).ffill().fillna(0.0).to_numpy()
+        yield _strategy_returns(position, ret, tc)
+
+
+def sim_final_returns(arrays, grid, stop, spread_pips=1.0, pips_unit=0.01, pip_val_1lot=1000,
+                      cap=100000, max_lot=100, start_hour=16, end_hour=1):
+    """
+    run_simulation_final（USDJPY,EURUSD,GBPUSD_M5.py）。grid = [(sl_pips, slope_threshold, risk), ...]
+    全組み合わせを grid_simulator で1回に回し、決済した足に log(決済後の残高 / 決済前の残高) を置く
+    （ロットは残高に比例するので、窓の前の成績に関係なく同じ尺度で比べられる）
+    """
+    index = pd.DatetimeIndex(arrays['times'][:stop].view('datetime64[ns]'))
+    df = add_emas(pd.DataFrame({'High': arrays['high'][:stop], 'Low': arrays['low'][:stop],
+                                'Close': arrays['close'][:stop]}, index=index))
+    params = pd.DataFrame(list(grid), columns=['sl_pips', 'slope_threshold', 'risk'], dtype='float64')
+    _, trades = run_simulation_grid(df, params, spread_pips, pips_unit, pip_val_1lot, cap, max_lot,
+                                    start_hour, end_hour)
+
+    exit_bar = index.get_indexer(trades['exit_time'])
+    after = trades['balance'].to_numpy(dtype='float64')
+    before = after - trades['profit_yen'].to_numpy(dtype='float64')
+    log_ret = np.log(np.maximum(after, 1e-12) / before)
+    combo = trades['combo'].to_numpy()
+    for k in range(len(params)):
+        out = np.zeros(stop)
+        mine = combo == k
+        out[exit_bar[mine]] = log_ret[mine]
+        yield out
+
+
+# 名前 → (関数, パラメータ名)
+STRATEGIES = {
+    'sma': (sma_returns, ('SMA1', 'SMA2')),
+    'momentum': (momentum_returns, ('momentum',)),
+    'mean_reversion': (mean_reversion_returns, ('SMA', 'threshold')),
+    'sim_final': (sim_final_returns, ('sl_pips', 'slope_threshold', 'risk')),
+}
+
+
+# ------------------------------------------
+# 窓の作り方
+# ------------------------------------------
+
+def make_windows(n, train_size, test_size, step=None, anchored=False, start=0):
+    """
+    本数で窓を作る: [(train_start, train_end, test_start, test_end), ...]（end は含まない）
+    anchored=False … 学習期間は直近 train_size 本（ローリング）
+    anchored=True  … 学習期間は常に start から（アンカード。だんだん長くなる）
+    step … 次の窓までずらす本数（既定は test_size = 検証期間がすき間なくつながる）
+    最後の検証期間は n までで切る
+    """
+    step = step or test_size
+    windows = []
+    train_end = start + train_size
+    while train_end < n:
+        train_start = start if anchored else train_end - train_size
+        windows.append((train_start, train_end, train_end, min(train_end + test_size, n)))
+        train_end += step
+    return windows
+
+
+def param_grid(**candidates):
+    """param_grid(SMA1=range(10, 60, 10), SMA2=range(100, 300, 50)) → 全組み合わせのリスト"""
+    return list(itertools.product(*candidates.values()))
+
+
+# ------------------------------------------
+# 1つの窓を回す（ワーカー）
+# ------------------------------------------
+
+_worker_arrays = None
+
+
+def _init_worker(specs):
+    global _worker_arrays
+    _worker_arrays = attach(specs)
+
+
+def evaluate_window(arrays, window, strategy, grid, strategy_kwargs):
+    """学習期間の対数収益率の合計が一番大きいパラメータを選び、検証期間の1本ごとの収益率を返す"""
+    fn = STRATEGIES[strategy][0] if isinstance(strategy, str) else strategy
+    train_start, train_end, test_start, test_end = window
+
+    best, best_score, best_oos = None, -np.inf, None
+    for k, returns in enumerate(fn(arrays, grid, test_end, **strategy_kwargs)):
+        score = returns[train_start:train_end].sum()
+        # 同点なら先の組み合わせ（optimize_parameters と同じ）
+        if score > best_score:
+            best, best_score, best_oos = k, score, returns[test_start:test_end].copy()
+    return best, best_score, best_oos
+
+
+def _run_window(window, strategy, grid, strategy_kwargs):
+    return evaluate_window(_worker_arrays, window, strategy, grid, strategy_kwargs)
+
+
+# ------------------------------------------
+# まとめて回す
+# ------------------------------------------
+
+def walk_forward(data, strategy, grid, train_size, test_size, step=None, anchored=False,
+                 amount=10000, workers=None, strategy_kwargs=None, param_names=None):
+    """
+    data     … DatetimeIndex + Close の DataFrame（'sim_final' は High / Low も）
+    strategy … STRATEGIES の名前か、同じ形の関数（プールで回すときはモジュールの関数にする）
+    grid     … パラメータの組み合わせのリスト（param_grid の戻り値など）
+    workers  … プロセス数（None = CPU数、1 = プールを使わずこのプロセスで回す）
+
+    戻り値: (equity, table)
+      equity … 検証期間だけをつないだ DataFrame（'return' = 戦略の対数収益率、'equity' = amount からの資産、'window'）
+      table  … 窓ごとに1行（期間・選ばれたパラメータ・学習/検証の対数収益率・前の窓から変わったか）
+    """
+    strategy_kwargs = strategy_kwargs or {}
+    grid = [tuple(g) for g in grid]
+    if param_names is None:
+        param_names = STRATEGIES[strategy][1] if isinstance(strategy, str) else [f'p{i}' for i in range(len(grid[0]))]
+
+    arrays = {
+        'times': data.index.asi8,
+        'close': data['Close'].to_numpy(dtype='float64'),
+    }
+    if 'High' in data and 'Low' in data:
+        arrays['high'] = data['High'].to_numpy(dtype='float64')
+        arrays['low'] = data['Low'].to_numpy(dtype='float64')
+
+    windows = make_windows(len(data), train_size, test_size, step, anchored)
+    if not windows:
+        raise ValueError(f'データが {len(data)} 本しかなく、学習期間 {train_size} 本の後に検証期間が取れません')
+    if workers is None:
+        workers = min(len(windows), os.cpu_count() or 1)
+
+    if workers <= 1:
+        results = [evaluate_window(arrays, w, strategy, grid, strategy_kwargs) for w in windows]
+    else:
+        with SharedArrays(arrays) as shared:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(shared.specs,)) as pool:
+                futures = [pool.submit(_run_window, w, strategy, grid, strategy_kwargs) for w in windows]
+                results = [f.result() for f in futures]
+
+    return _stitch(data.index, windows, results, grid, param_names, amount)
+
+
+def _stitch(index, windows, results, grid, param_names, amount):
+    rows = []
+    parts = []
+    prev = None
+    for w, (window, (best, is_score, oos)) in enumerate(zip(windows, results)):
+        train_start, train_end, test_start, test_end = window
+        # step < test_size で検証期間が重なるときは、後の窓の分だけを使う
+        next_start = windows[w + 1][2] if w + 1 < len(windows) else test_end
+        keep = oos[:max(min(next_start, test_end) - test_start, 0)]
+        parts.append(pd.DataFrame({'return': keep, 'window': w},
+                                  index=index[test_start:test_start + len(keep)]))
+
+        params = grid[best]
+        row = {
+            'window': w,
+            'train_start': index[train_start], 'train_end': index[train_end - 1],
+            'test_start': index[test_start], 'test_end': index[test_end - 1],
+        }
+        row.update(dict(zip(param_names, params)))
+        row['is_return'] = is_score
+        row['oos_return'] = oos.sum()
+        row['changed'] = prev is not None and params != prev
+        rows.append(row)
+        prev = params
+
+    equity = pd.concat(parts)
+    equity['equity'] = amount * np.exp(equity['return'].cumsum())
+    return equity, pd.DataFrame(rows).set_index('window')
+
+
+if __name__ == "__main__":
+    from bar_cache import load_ohlc_cached
+
+    df = load_ohlc_cached(r'C:\market_data\USDJPY_M15.csv')
+    bars_per_year = 96 * 260
+
+    # プールはこのファイルを読み直すので、必ず if __name__ == "__main__": の中で呼ぶ（Windows）
+    equity, table = walk_forward(df, 'sma', param_grid(SMA1=range(10, 60, 10), SMA2=range(100, 300, 50)),
+                                 train_size=2 * bars_per_year, test_size=bars_per_year // 2)
+    print(table)
+    print(f"OOS 最終資産: {equity['equity'].iloc[-1]:.2f}")
+
+
+#=========================================================
+#walkforward.py（ウォークフォワード最適化）
+#=========================================================
+
+#使い方
+#from walkforward import walk_forward, param_grid
+#equity, table = walk_forward(df, 'sma', param_grid(SMA1=range(10, 60, 10), SMA2=range(100, 300, 50)),
+#                             train_size=50000, test_size=10000)
+#equity['equity'].plot()   ← 検証期間だけをつないだ資産曲線
+#table                     ← 窓ごとに選ばれたパラメータ（changed が True ばかりならパラメータが安定していない）
+
+#anchored=True で学習期間を最初から伸ばしていく形になる
+#戦略: 'sma' / 'momentum'（strategy_kwargs={'tc': 0.001}）/ 'mean_reversion' / 'sim_final'
+#'sim_final' は grid=[(sl_pips, slope_threshold, risk), ...] で、strategy_kwargs に pips_unit・pip_val_1lot などを渡す
+#workers=1 でプールなし（デバッグ・Jupyter 用）
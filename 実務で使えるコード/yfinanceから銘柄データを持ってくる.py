@@ -1,13 +1,27 @@
-import yfinance as yf
+import os
+import sys
+# リポジトリ直下の共通モジュール（market_data）を読み込めるようにする
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from market_data import MarketData, YFinanceSource
+
+md = MarketData(YFinanceSource())
 
 def get_data_yfinance(ticker, start, end):
-    df = yf.download(ticker, start=start, end=end)
-    return df
+    # 1回目はダウンロードしてキャッシュに保存、2回目以降はキャッシュから（足りない期間だけ取りに行く）
+    return md.get_frames(ticker, start, end)[ticker]
+
+def get_close_yfinance(tickers, start, end):
+    # 複数銘柄はまとめて1回でダウンロードする（列=銘柄 の終値）
+    return md.get(tickers, start, end)
 
 # 例：AAPLを取得
 data = get_data_yfinance('AAPL', '2010-01-01', '2019-12-31')
 print(data.head())
 
+# 例：複数銘柄をまとめて取得
+close = get_close_yfinance(['AAPL', 'MSFT', '^GSPC'], '2010-01-01', '2019-12-31')
+print(close.tail())
+
 
 
 
@@ -19,6 +33,8 @@ print(data.head())
 #データの形式がそのままバックテストに使える
 
 #追加ライブラリは yfinance だけ
+
+#一度取ったデータは data/_market_cache に保存されるので、何回実行してもネットに繋がない
 #==========================================
 
 
@@ -2,9 +2,13 @@
 
 
 # data_sanity_check.py
-def check_group_size(df, col):
-    for k, g in df.groupby(col):
-        print(f"{k}: rows={len(g)}")
+def check_group_size(df, col, label=None):
+    # groupby で1グループずつ回さず、件数だけまとめて数える（数百万行でも一瞬）
+    counts = df[col].value_counts(sort=False).sort_index()
+    if label:
+        print(f"--- {label} ---")
+    print(counts.to_string())
+    return counts
 
 
 
@@ -20,21 +24,30 @@ def check_group_size(df, col):
 
 
 #例① 通貨ペアごとのデータ量確認（超重要）
-for (symbol, g) in df.groupby('symbol'):
-    print(f"{symbol:10s} rows={len(g)}")
+print(df['symbol'].value_counts())
 #👉 USDJPY だけデータ少ない、みたいなのを即発見できる。
 
 #例② 時間足ごとの確認
-for (tf, g) in df.groupby('timeframe'):
-    print(f"{tf:5s} rows={len(g)}")
+print(df['timeframe'].value_counts())
 #👉 M1 と H1 が混ざってないかチェック。
 
 #例④ EAロジック別（複数ルールある場合）
-for (rule_id, g) in df.groupby('rule_id'):
-    print(f"rule {rule_id}: trades={len(g)}")
+print(df['rule_id'].value_counts())
 #👉 勝ってるように見えて
 #👉 実は 5トレードしかない、を防ぐ。
 
+#例⑤ 足データそのものの品質チェック（リポジトリ直下の data_quality.py）
+import os
+import sys
+# リポジトリ直下の共通モジュール（data_quality）を読み込めるようにする（このファイルは2階層下にある）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from data_quality import scan_csv, summarize
+report = scan_csv(r'C:\market_data\USDJPY_M5.csv')
+print(summarize(report))
+#👉 日時に変換できず捨てられた行・欠損した足（週末以外）・重複・逆順・
+#👉 High < Low・Close が [Low, High] の外・ATRの10倍を超えるスパイク を一度に数える
+#👉 report は dict なので json に保存して、バックテストの前に毎回比べられる
+
 
 
 #これを使うタイミング
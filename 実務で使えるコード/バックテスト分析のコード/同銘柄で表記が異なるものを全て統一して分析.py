@@ -15,12 +15,18 @@ data = {
 df = pd.DataFrame(data)
 
 # ここがポイント
-df["symbol"] = (
-    df["symbol"]
-    .str.replace("/", "")   # / を削除
-    .str.replace("_", "")   # _ を削除
-    .str.upper()            # 大文字に統一
-)
+# 行ごとに str.replace するのではなく、表記の種類（カテゴリ）ごとに1回だけ変換する
+# （リポジトリ直下の instruments.py。/ や _ の削除・大文字化・USDJPY.m のような末尾記号も外す）
+import os
+import sys
+# リポジトリ直下の共通モジュール（instruments）を読み込めるようにする（このファイルは2階層下にある）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from instruments import normalize_symbols, attach_instrument_info
+
+df["symbol"] = normalize_symbols(df["symbol"])   # Categorical になる
+
+# pips の単位・1pipの円価値・標準スプレッドも銘柄ごとに付けられる（価格から推測しない）
+df = attach_instrument_info(df, "symbol")
 
 df["date"] = pd.to_datetime(df["date"])  # 日付に変換
 df = df.sort_values(["symbol", "date"])   # 通貨ペアごとにソート